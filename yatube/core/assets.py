@@ -0,0 +1,275 @@
+import mimetypes
+import os
+import re
+from io import BytesIO
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+
+# Сжатые копии, которые пишет CompressedManifestStaticFilesStorage,
+# в порядке предпочтения.
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+# Имена, которые меняются вместе с содержимым: хэш collectstatic
+# (style.0123456789ab.css), sha256 ContentAddressedStorage и md5
+# миниатюр sorl.
+HASHED_NAME = re.compile(
+    r'\.[0-9a-f]{12}\.[^./]+$|(^|/)[0-9a-f]{32}([0-9a-f]{32})?\.[^./]+$')
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'public, no-cache'
+
+BYTES_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def existing_file(root, path):
+    """Путь файла path внутри root или None, если его нет или path
+    выходит за root."""
+    try:
+        full_path = safe_join(root, path)
+    except SuspiciousFileOperation:
+        return None
+    return full_path if os.path.isfile(full_path) else None
+
+
+def static_path(path):
+    """Файл статики: из STATIC_ROOT, а с DEBUG и без collectstatic — из
+    каталогов приложений."""
+    full_path = existing_file(settings.STATIC_ROOT, path)
+    if full_path is None and settings.DEBUG:
+        try:
+            return finders.find(path)
+        except SuspiciousFileOperation:
+            return None
+    return full_path
+
+
+def media_path(path):
+    return existing_file(settings.MEDIA_ROOT, path)
+
+
+def accepted_encodings(header):
+    """Кодировки из Accept-Encoding, которые клиент не запретил q=0."""
+    accepted = set()
+    for part in header.split(','):
+        coding, *params = [item.strip() for item in part.split(';')]
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding and quality > 0:
+            accepted.add(coding.lower())
+    return accepted
+
+
+def byte_range(header, size):
+    """(первый, последний) байт из Range: bytes=a-b, a- или -n.
+
+    Несколько диапазонов и непонятный заголовок дают None: отдаётся
+    весь файл, это разрешено. Диапазон за концом файла —
+    RangeNotSatisfiable.
+    """
+    match = BYTES_RANGE.match(header.strip())
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Последние n байт.
+        if not int(last) or not size:
+            raise RangeNotSatisfiable
+        return max(size - int(last), 0), size - 1
+    first = int(first)
+    if first >= size:
+        raise RangeNotSatisfiable
+    last = size - 1 if not last else min(int(last), size - 1)
+    if first > last:
+        return None
+    return first, last
+
+
+class Asset:
+    """Что отдать на запрос файла: вариант файла, его заголовки и
+    диапазон байт.
+
+    response — готовый ответ без тела (304, 416), если файл отдавать
+    не нужно.
+    """
+
+    def __init__(self, request, path):
+        self.response = None
+        self.name = os.path.basename(path)
+        self.path = path
+        self.headers = {}
+        self.range = None
+        content_type, encoding = mimetypes.guess_type(path)
+        self.headers['Content-Type'] = (
+            'application/octet-stream' if content_type is None or encoding
+            else content_type)
+        variants = [
+            (coding, path + suffix) for coding, suffix in ENCODINGS
+            if os.path.isfile(path + suffix)
+        ]
+        self.vary = bool(variants)
+        range_header = request.META.get('HTTP_RANGE')
+        # Диапазоны считаются в байтах несжатого файла.
+        if range_header is None:
+            accepted = accepted_encodings(
+                request.META.get('HTTP_ACCEPT_ENCODING', ''))
+            for coding, variant in variants:
+                if coding in accepted:
+                    self.path = variant
+                    self.headers['Content-Encoding'] = coding
+                    break
+        stat = os.stat(self.path)
+        self.size = stat.st_size
+        etag = quote_etag(f'{stat.st_mtime_ns:x}-{stat.st_size:x}')
+        last_modified = int(stat.st_mtime)
+        self.headers.update({
+            'ETag': etag,
+            'Last-Modified': http_date(last_modified),
+            'Accept-Ranges': 'bytes',
+            'Cache-Control': (
+                IMMUTABLE if HASHED_NAME.search(path.replace(os.sep, '/'))
+                else REVALIDATE),
+        })
+        self.response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified)
+        if self.response is not None:
+            return
+        if range_header is not None and self.range_applies(
+                request, etag, last_modified):
+            try:
+                self.range = byte_range(range_header, self.size)
+            except RangeNotSatisfiable:
+                self.response = HttpResponse(status=416)
+                self.headers['Content-Range'] = f'bytes */{self.size}'
+                return
+        if self.range is not None:
+            first, last = self.range
+            self.headers['Content-Range'] = f'bytes {first}-{last}/{self.size}'
+        self.headers['Content-Length'] = str(self.length)
+
+    @staticmethod
+    def range_applies(request, etag, last_modified):
+        """If-Range: диапазон, только если файл тот же, что у клиента."""
+        if_range = request.META.get('HTTP_IF_RANGE')
+        if if_range is None:
+            return True
+        if if_range.startswith(('"', 'W/')):
+            return if_range == etag
+        return parse_http_date_safe(if_range) == last_modified
+
+    @property
+    def status(self):
+        return 200 if self.range is None else 206
+
+    @property
+    def offset(self):
+        return 0 if self.range is None else self.range[0]
+
+    @property
+    def length(self):
+        if self.range is None:
+            return self.size
+        first, last = self.range
+        return last - first + 1
+
+    def finish(self, response):
+        headers = self.headers
+        if response.status_code == 304:
+            headers = {
+                name: value for name, value in headers.items()
+                if name in ('ETag', 'Last-Modified', 'Cache-Control')
+            }
+        for name, value in headers.items():
+            response[name] = value
+        if self.vary:
+            patch_vary_headers(response, ('Accept-Encoding',))
+        return response
+
+    def file_response(self):
+        """FileResponse для WSGI: без диапазона или с диапазоном до
+        конца файла сервер отдаёт файл через wsgi.file_wrapper (gunicorn —
+        sendfile)."""
+        if self.response is not None:
+            return self.finish(self.response)
+        file = open(self.path, 'rb')
+        file.seek(self.offset)
+        response = FileResponse(
+            file, status=self.status, filename=self.name)
+        if self.offset + self.length < self.size:
+            # file_wrapper шлёт файл до конца, а нужна только часть.
+            response.streaming_content = read_slice(
+                file, self.length, response.block_size)
+        return self.finish(response)
+
+    async def send(self, send):
+        """Отправляет файл расширением ASGI http.response.zerocopysend."""
+        await send({
+            'type': 'http.response.start',
+            'status': self.status,
+            'headers': [
+                (name.encode('latin-1'), value.encode('latin-1'))
+                for name, value in self.headers.items()
+            ] + [(b'Vary', b'Accept-Encoding')] * self.vary,
+        })
+        with open(self.path, 'rb') as file:
+            await send({
+                'type': 'http.response.zerocopysend',
+                'file': file,
+                'offset': self.offset,
+                'count': self.length,
+            })
+
+
+def read_slice(file, length, block_size):
+    while length > 0:
+        chunk = file.read(min(block_size, length))
+        if not chunk:
+            return
+        length -= len(chunk)
+        yield chunk
+
+
+def serve(request, path, find):
+    """Ответ с файлом find(path): сжатый вариант по Accept-Encoding,
+    Range, ETag и Last-Modified, бессрочный кэш для имён с хэшем."""
+    full_path = find(path)
+    if full_path is None:
+        raise Http404(path)
+    return Asset(request, full_path).file_response()
+
+
+def zero_copy(find):
+    """Обработчик для asgi_stream: отдаёт файл без копирования через
+    память процесса, если сервер ASGI поддерживает zerocopysend.
+    Иначе, а также для 304, 416 и 404 отвечает представление."""
+    async def handler(scope, receive, send, path):
+        extensions = scope.get('extensions') or {}
+        if ('http.response.zerocopysend' not in extensions
+                or scope['method'] != 'GET'):
+            return False
+        full_path = find(path)
+        if full_path is None:
+            return False
+        asset = Asset(ASGIRequest(scope, BytesIO()), full_path)
+        if asset.response is not None:
+            return False
+        await asset.send(send)
+    return handler
@@ -0,0 +1,34 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+
+def _in_pool(func, args, kwargs):
+    # Поток пула живёт дольше запроса: соединения в нём закрываются по
+    # тем же правилам, что в начале и конце обычного запроса.
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def run(func, *args, **kwargs):
+    """Выполняет синхронную func (ORM, кэш, рендер) вне цикла событий.
+
+    При ASYNC_PARALLEL_DB — в общем пуле потоков, у каждого потока своё
+    соединение с базой, так что несколько run() через gather() идут
+    одновременно. Иначе — в потоке запроса, по очереди: так видны данные
+    незакоммиченной транзакции, например в TestCase.
+    """
+    if getattr(settings, 'ASYNC_PARALLEL_DB', True):
+        return await sync_to_async(_in_pool, thread_sensitive=False)(
+            func, args, kwargs)
+    return await sync_to_async(func)(*args, **kwargs)
+
+
+async def gather(*calls):
+    """run() для нескольких (func, *args) сразу; результаты по порядку."""
+    return await asyncio.gather(*(run(*call) for call in calls))
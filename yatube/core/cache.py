@@ -0,0 +1,173 @@
+import asyncio
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import (get_cache_key, get_conditional_response,
+                                learn_cache_key, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.http import http_date, quote_etag
+
+from . import asyncdb, replica
+
+TAG_PREFIX = 'tag:'
+
+
+def _new_version():
+    return time.time_ns()
+
+
+def tag_versions(tags):
+    """Текущие версии тегов; отсутствующие теги получают новую версию."""
+    keys = [TAG_PREFIX + tag for tag in tags]
+    versions = cache.get_many(keys)
+    missing = {key: _new_version() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def tagged_key(key, tags, versions=None):
+    """Ключ, который меняется при инвалидации любого из тегов."""
+    if versions is None:
+        versions = tag_versions(tags)
+    stamp = ','.join(
+        f'{tag}={version}' for tag, version in zip(tags, versions))
+    return f'{key}.{hashlib.md5(stamp.encode()).hexdigest()}'
+
+
+def invalidate_tags(*tags):
+    """Делает недоступным всё, что закэшировано с этими тегами."""
+    if tags:
+        cache.set_many({TAG_PREFIX + tag: _new_version() for tag in tags},
+                       None)
+
+
+def cache_tagged(timeout, tags):
+    """Как cache_page, но запись живёт, пока не сменится версия тегов.
+
+    tags(request, *args, **kwargs) возвращает список тегов страницы.
+    Ответ зависит от Cookie, поэтому у каждой сессии своя копия, а
+    браузеру не отдаются заголовки кэширования: иначе он показывал бы
+    устаревшую страницу после инвалидации. Страница из реплики, которая
+    старше тегов, не кэшируется. Асинхронное представление оборачивается
+    асинхронно, кэш и теги читаются через asyncdb.run().
+    """
+    def lookup(request, args, kwargs):
+        page_tags = tags(request, *args, **kwargs)
+        versions = tag_versions(page_tags)
+        key_prefix = tagged_key('views', page_tags, versions)
+        cache_key = get_cache_key(request, key_prefix, 'GET', cache=cache)
+        response = None if cache_key is None else cache.get(cache_key)
+        return response, key_prefix, versions
+
+    def store(request, response, key_prefix, versions):
+        if response.status_code != 200 or response.streaming:
+            return
+        if not replica.caught_up(max(versions, default=0)):
+            return
+        if (request.META.get('CSRF_COOKIE_USED')
+                and settings.CSRF_COOKIE_NAME not in request.COOKIES):
+            # Ответ выдаёт новый csrftoken, его нельзя раздавать всем.
+            return
+        patch_vary_headers(response, ('Cookie',))
+        cache_key = learn_cache_key(
+            request, response, timeout, key_prefix, cache=cache)
+        cache.set(cache_key, response, timeout)
+
+    def decorator(view):
+        if asyncio.iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                if request.method not in ('GET', 'HEAD'):
+                    return await view(request, *args, **kwargs)
+                cached, key_prefix, versions = await asyncdb.run(
+                    lookup, request, args, kwargs)
+                if cached is not None:
+                    return cached
+                response = await view(request, *args, **kwargs)
+                await asyncdb.run(
+                    store, request, response, key_prefix, versions)
+                return response
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            cached, key_prefix, versions = lookup(request, args, kwargs)
+            if cached is not None:
+                return cached
+            response = view(request, *args, **kwargs)
+            store(request, response, key_prefix, versions)
+            return response
+        return wrapper
+    return decorator
+
+
+def conditional(stamps, **cache_control):
+    """Отвечает 304, если страница не менялась с прошлого запроса.
+
+    stamps(request, *args, **kwargs) без запроса самой страницы
+    возвращает (last_modified, parts): время последней правки и значения,
+    от которых ещё зависит страница (число записей, счётчики), или None,
+    если объекта нет, — тогда отвечает представление. ETag — хэш stamps
+    и Cookie, потому что страница у каждой сессии своя; Last-Modified —
+    last_modified. cache_control уходит в patch_cache_control ответов
+    200 и 304. Асинхронное представление оборачивается асинхронно.
+    """
+    def validators(request, args, kwargs):
+        row = stamps(request, *args, **kwargs)
+        if row is None:
+            return None, None
+        last_modified, parts = row
+        stamp = repr((last_modified, parts, request.META.get('HTTP_COOKIE')))
+        etag = quote_etag(hashlib.md5(stamp.encode()).hexdigest())
+        if last_modified is not None:
+            last_modified = int(last_modified.timestamp())
+        return etag, last_modified
+
+    def not_modified(request, etag, last_modified):
+        if etag is None:
+            return None
+        return get_conditional_response(
+            request, etag=etag, last_modified=last_modified)
+
+    def finish(response, etag, last_modified):
+        if etag is None or response.status_code not in (200, 304):
+            return response
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, **cache_control)
+        patch_vary_headers(response, ('Cookie',))
+        return response
+
+    def decorator(view):
+        if asyncio.iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                if request.method not in ('GET', 'HEAD'):
+                    return await view(request, *args, **kwargs)
+                etag, last_modified = await asyncdb.run(
+                    validators, request, args, kwargs)
+                response = not_modified(request, etag, last_modified)
+                if response is None:
+                    response = await view(request, *args, **kwargs)
+                return finish(response, etag, last_modified)
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            etag, last_modified = validators(request, args, kwargs)
+            response = not_modified(request, etag, last_modified)
+            if response is None:
+                response = view(request, *args, **kwargs)
+            return finish(response, etag, last_modified)
+        return wrapper
+    return decorator
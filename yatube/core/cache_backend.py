@@ -0,0 +1,314 @@
+import mmap
+import os
+import pickle
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from .metrics import record_cache
+
+STAMP = struct.Struct('<Q')
+
+
+class TieredCache(BaseCache):
+    """Двухуровневый кэш без внешних сервисов.
+
+    L1 — LRU в памяти процесса, L2 — общий для всех воркеров файл SQLite
+    в каталоге LOCATION. Рядом лежит файл штампов, отображённый в память:
+    каждая запись в L2 меняет штамп слота ключа, а запись L1 действительна,
+    только пока штамп не изменился. Так set/delete/clear в одном процессе
+    видны остальным без обращения к L2 на каждое попадание в L1.
+
+    OPTIONS: L1_MAX_ENTRIES, MAX_ENTRIES (для L2), STAMP_SLOTS.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._location = location
+        self._l1_max_entries = int(options.get('L1_MAX_ENTRIES', 1000))
+        self._slots = int(options.get('STAMP_SLOTS', 4096))
+        self._l1 = OrderedDict()
+        self._l1_lock = threading.Lock()
+        self._init_lock = threading.Lock()
+        self._local = threading.local()
+        self._stamps = None
+        self._pid = None
+        self._writes = 0
+        self._stats = {
+            'l1': {'hits': 0, 'misses': 0},
+            'l2': {'hits': 0, 'misses': 0},
+        }
+
+    # Файлы и соединения
+
+    def _setup(self):
+        if self._pid == os.getpid():
+            return
+        with self._init_lock:
+            if self._pid == os.getpid():
+                return
+            os.makedirs(self._location, exist_ok=True)
+            size = STAMP.size * (self._slots + 1)
+            path = os.path.join(self._location, 'stamps.bin')
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                if os.fstat(fd).st_size < size:
+                    os.ftruncate(fd, size)
+                self._stamps = mmap.mmap(fd, size)
+            finally:
+                os.close(fd)
+            # После fork соединения родителя использовать нельзя.
+            self._local = threading.local()
+            with self._l1_lock:
+                self._l1.clear()
+            self._pid = os.getpid()
+
+    def _db(self):
+        self._setup()
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(
+                os.path.join(self._location, 'cache.sqlite3'),
+                timeout=5,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS cache ('
+                'key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL)')
+            self._local.connection = connection
+        return connection
+
+    # Штампы версий
+
+    def _slot(self, key):
+        return zlib.crc32(key.encode()) % self._slots + 1
+
+    def _read_stamp(self, index):
+        return STAMP.unpack_from(self._stamps, index * STAMP.size)[0]
+
+    def _write_stamp(self, index):
+        value = int.from_bytes(os.urandom(STAMP.size), 'little')
+        STAMP.pack_into(self._stamps, index * STAMP.size, value)
+
+    def _stamp(self, key):
+        self._setup()
+        return self._read_stamp(0), self._read_stamp(self._slot(key))
+
+    def _invalidate(self, key):
+        """Вызывается после изменения ключа в L2."""
+        self._write_stamp(self._slot(key))
+        with self._l1_lock:
+            self._l1.pop(key, None)
+
+    # L1
+
+    def _l1_get(self, key, stamp):
+        with self._l1_lock:
+            entry = self._l1.get(key)
+            if entry is not None:
+                value, expires, entry_stamp = entry
+                if entry_stamp == stamp and not self._expired(expires):
+                    self._l1.move_to_end(key)
+                    self._stats['l1']['hits'] += 1
+                    return value
+                del self._l1[key]
+            self._stats['l1']['misses'] += 1
+        return None
+
+    def _l1_set(self, key, value, expires, stamp):
+        with self._l1_lock:
+            self._l1[key] = (value, expires, stamp)
+            self._l1.move_to_end(key)
+            while len(self._l1) > self._l1_max_entries:
+                self._l1.popitem(last=False)
+
+    # L2
+
+    @staticmethod
+    def _expired(expires):
+        return expires is not None and expires <= time.time()
+
+    def _expires(self, timeout):
+        # Для BaseCache это уже абсолютное время истечения.
+        return self.get_backend_timeout(timeout)
+
+    def _l2_hit(self, hit):
+        self._stats['l2']['hits' if hit else 'misses'] += 1
+
+    def _cull(self, db):
+        db.execute('DELETE FROM cache WHERE expires <= ?', (time.time(),))
+        count = db.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count > self._max_entries:
+            db.execute(
+                'DELETE FROM cache WHERE key IN (SELECT key FROM cache '
+                'ORDER BY expires IS NULL, expires LIMIT ?)',
+                (count // self._cull_frequency,))
+
+    def _maybe_cull(self, db):
+        self._writes += 1
+        if self._writes % 100 == 0:
+            self._cull(db)
+
+    # API BaseCache
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        stamp = self._stamp(key)
+        value = self._l1_get(key, stamp)
+        if value is not None:
+            record_cache(hits=1)
+            return pickle.loads(value)
+        row = self._db().execute(
+            'SELECT value, expires FROM cache WHERE key = ?',
+            (key,)).fetchone()
+        if row is None or self._expired(row[1]):
+            self._l2_hit(False)
+            record_cache(misses=1)
+            return default
+        self._l2_hit(True)
+        record_cache(hits=1)
+        self._l1_set(key, row[0], row[1], stamp)
+        return pickle.loads(row[0])
+
+    def get_many(self, keys, version=None):
+        found = {}
+        missing = {}
+        for original in keys:
+            key = self.make_key(original, version=version)
+            self.validate_key(key)
+            stamp = self._stamp(key)
+            value = self._l1_get(key, stamp)
+            if value is not None:
+                found[original] = pickle.loads(value)
+            else:
+                missing[key] = (original, stamp)
+        if missing:
+            placeholders = ','.join('?' * len(missing))
+            rows = self._db().execute(
+                'SELECT key, value, expires FROM cache '
+                f'WHERE key IN ({placeholders})', list(missing)).fetchall()
+            for key, value, expires in rows:
+                if self._expired(expires):
+                    continue
+                original, stamp = missing.pop(key)
+                self._l2_hit(True)
+                self._l1_set(key, value, expires, stamp)
+                found[original] = pickle.loads(value)
+            for _ in missing:
+                self._l2_hit(False)
+        record_cache(hits=len(found), misses=len(missing))
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        db = self._db()
+        db.execute(
+            'INSERT OR REPLACE INTO cache (key, value, expires) '
+            'VALUES (?, ?, ?)',
+            (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+             self._expires(timeout)))
+        self._invalidate(key)
+        self._maybe_cull(db)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self._expires(timeout)
+        rows = []
+        for original, value in data.items():
+            key = self.make_key(original, version=version)
+            self.validate_key(key)
+            rows.append(
+                (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), expires))
+        db = self._db()
+        with db:
+            db.execute('BEGIN')
+            db.executemany(
+                'INSERT OR REPLACE INTO cache (key, value, expires) '
+                'VALUES (?, ?, ?)', rows)
+        for key, _, _ in rows:
+            self._invalidate(key)
+        self._maybe_cull(db)
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        db = self._db()
+        with db:
+            db.execute('BEGIN IMMEDIATE')
+            db.execute(
+                'DELETE FROM cache WHERE key = ? AND expires <= ?',
+                (key, time.time()))
+            added = db.execute(
+                'INSERT OR IGNORE INTO cache (key, value, expires) '
+                'VALUES (?, ?, ?)',
+                (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                 self._expires(timeout))).rowcount == 1
+        if added:
+            self._invalidate(key)
+            self._maybe_cull(db)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        touched = self._db().execute(
+            'UPDATE cache SET expires = ? WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (self._expires(timeout), key, time.time())).rowcount == 1
+        if touched:
+            self._invalidate(key)
+        return touched
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        db = self._db()
+        with db:
+            db.execute('BEGIN IMMEDIATE')
+            row = db.execute(
+                'SELECT value, expires FROM cache WHERE key = ?',
+                (key,)).fetchone()
+            if row is None or self._expired(row[1]):
+                raise ValueError("Key '%s' not found" % key)
+            value = pickle.loads(row[0]) + delta
+            db.execute(
+                'UPDATE cache SET value = ? WHERE key = ?',
+                (pickle.dumps(value, pickle.HIGHEST_PROTOCOL), key))
+        self._invalidate(key)
+        return value
+
+    def delete(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        deleted = self._db().execute(
+            'DELETE FROM cache WHERE key = ?', (key,)).rowcount == 1
+        self._invalidate(key)
+        return deleted
+
+    def has_key(self, key, version=None):
+        return self.get(key, self, version=version) is not self
+
+    def clear(self):
+        self._db().execute('DELETE FROM cache')
+        self._write_stamp(0)
+        with self._l1_lock:
+            self._l1.clear()
+
+    def stats(self):
+        """Попадания и промахи L1 и L2 в этом процессе."""
+        with self._l1_lock:
+            return {
+                tier: dict(counters)
+                for tier, counters in self._stats.items()
+            }
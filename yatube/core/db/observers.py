@@ -0,0 +1,32 @@
+import functools
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Обёртки execute текущего запроса. В отличие от
+# connection.execute_wrapper() они привязаны к контексту, а не к
+# соединению, поэтому видят и запросы из потоков sync_to_async:
+# у каждого потока своё соединение, а контекст копируется.
+_observers = ContextVar('query_observers', default=())
+
+
+def dispatch(execute, sql, params, many, context):
+    for observer in reversed(_observers.get()):
+        execute = functools.partial(observer, execute)
+    return execute(sql, params, many, context)
+
+
+@contextmanager
+def observe(wrapper):
+    """Как connection.execute_wrapper(wrapper), но для всех соединений
+    и потоков текущего контекста."""
+    token = _observers.set(_observers.get() + (wrapper,))
+    try:
+        yield wrapper
+    finally:
+        _observers.reset(token)
+
+
+def install(sender, connection, **kwargs):
+    """Обработчик connection_created: ставит dispatch на соединение."""
+    if dispatch not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, dispatch)
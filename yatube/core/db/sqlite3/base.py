@@ -0,0 +1,131 @@
+import logging
+import random
+import time
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+Database = base.Database
+logger = logging.getLogger(__name__)
+
+OWN_OPTIONS = ('pragmas', 'transaction_mode', 'lock_retries', 'lock_backoff')
+TRANSACTION_MODES = ('DEFERRED', 'IMMEDIATE', 'EXCLUSIVE')
+
+
+def is_locked(error):
+    return 'database is locked' in str(error)
+
+
+class SQLiteCursorWrapper(base.SQLiteCursorWrapper):
+    retries = 0
+    backoff = 0.01
+
+    def execute(self, query, params=None):
+        return self._retry(super().execute, query, params)
+
+    def executemany(self, query, param_list):
+        return self._retry(super().executemany, query, param_list)
+
+    def _retry(self, execute, query, params):
+        # Посреди транзакции повтор одного запроса ничего не исправит:
+        # её целиком откатывает atomic.
+        attempt = 0
+        while True:
+            try:
+                return execute(query, params)
+            except Database.OperationalError as error:
+                if (not is_locked(error) or attempt >= self.retries
+                        or self.connection.in_transaction):
+                    raise
+            attempt += 1
+            delay = self.backoff * 2 ** attempt * random.uniform(0.5, 1)
+            logger.info('database is locked, повтор %d через %.3f с',
+                        attempt, delay)
+            time.sleep(delay)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """SQLite для нескольких процессов и потоков.
+
+    Поверх стандартного бэкенда:
+
+    * PRAGMA из OPTIONS['pragmas'] на каждом новом соединении: WAL, чтобы
+      запись не блокировала чтение, synchronous, mmap_size, cache_size,
+      busy_timeout;
+    * OPTIONS['transaction_mode']: IMMEDIATE берёт блокировку записи в
+      начале atomic, а не при первом INSERT. Отложенную транзакцию SQLite
+      не может дождаться и сразу отвечает «database is locked»;
+    * OPTIONS['lock_retries']: «database is locked» вне транзакции
+      повторяется с растущей паузой;
+    * CONN_HEALTH_CHECKS: живое соединение (CONN_MAX_AGE) проверяется
+      запросом SELECT 1 — один раз за запрос, при первом обращении к
+      базе, а не в каждом close_old_connections.
+    """
+
+    def __init__(self, settings_dict, *args, **kwargs):
+        super().__init__(settings_dict, *args, **kwargs)
+        options = self.settings_dict['OPTIONS']
+        self.pragmas = options.get('pragmas', {})
+        self.transaction_mode = options.get(
+            'transaction_mode', 'DEFERRED').upper()
+        if self.transaction_mode not in TRANSACTION_MODES:
+            raise ImproperlyConfigured(
+                f'transaction_mode должен быть одним из {TRANSACTION_MODES}')
+        self.lock_retries = options.get('lock_retries', 0)
+        self.lock_backoff = options.get('lock_backoff', 0.01)
+        self.health_checks = self.settings_dict.get(
+            'CONN_HEALTH_CHECKS', False)
+        self.health_check_done = False
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        for name in OWN_OPTIONS:
+            params.pop(name, None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def create_cursor(self, name=None):
+        cursor = self.connection.cursor(factory=SQLiteCursorWrapper)
+        cursor.retries = self.lock_retries
+        cursor.backoff = self.lock_backoff
+        return cursor
+
+    def is_usable(self):
+        try:
+            self.connection.execute('SELECT 1')
+        except Database.Error:
+            return False
+        return True
+
+    def connect(self):
+        super().connect()
+        # Новое соединение проверять незачем.
+        self.health_check_done = True
+
+    def _cursor(self, name=None):
+        self.close_if_health_check_failed()
+        return super()._cursor(name)
+
+    def close_if_health_check_failed(self):
+        # Внутри atomic закрывать соединение нельзя: транзакцию
+        # пришлось бы бросить.
+        if (not self.health_checks or self.health_check_done
+                or self.connection is None or self.in_atomic_block):
+            return
+        if not self.is_usable():
+            self.close()
+        self.health_check_done = True
+
+    def close_if_unusable_or_obsolete(self):
+        super().close_if_unusable_or_obsolete()
+        # Вызывается в начале и в конце каждого запроса: следующий
+        # запрос проверит соединение при первом обращении к базе.
+        self.health_check_done = False
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute(f'BEGIN {self.transaction_mode}')
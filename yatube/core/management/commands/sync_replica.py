@@ -0,0 +1,32 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.replica import sync
+
+
+class Command(BaseCommand):
+    help = 'Копирует основную базу SQLite в реплику для чтения'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=float,
+            help='Повторять каждые столько секунд, пока не прервут',
+        )
+
+    def handle(self, *args, **options):
+        alias = getattr(settings, 'READ_REPLICA', None)
+        if alias is None or alias not in settings.DATABASES:
+            raise CommandError('Реплика не настроена: READ_REPLICA')
+        interval = options['interval']
+        while True:
+            start = time.monotonic()
+            sync(target=alias)
+            self.stdout.write(
+                f'Реплика {alias} синхронизирована за '
+                f'{(time.monotonic() - start) * 1000:.0f} мс')
+            if interval is None:
+                return
+            time.sleep(max(0, interval - (time.monotonic() - start)))
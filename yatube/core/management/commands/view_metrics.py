@@ -0,0 +1,52 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from core.metrics import reset, summary
+
+
+def _format(value):
+    return '-' if value is None else f'{value:g}'
+
+
+class Command(BaseCommand):
+    help = 'Показывает p50/p95/p99 времени ответа по представлениям'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--json',
+            action='store_true',
+            help='Вывести сводку в JSON',
+        )
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Обнулить накопленные гистограммы',
+        )
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            reset()
+            self.stdout.write('Гистограммы обнулены')
+            return
+        views = summary()
+        if options['json']:
+            self.stdout.write(json.dumps(views, ensure_ascii=False, indent=2))
+            return
+        header = (
+            f'{"представление":<28} {"запросов":>8} '
+            f'{"p50 мс":>8} {"p95 мс":>8} {"p99 мс":>8} '
+            f'{"SQL p95":>8} {"SQL мс p95":>10} {"шаблон мс p95":>13} '
+            f'{"разбор сэкономлен мс p50":>24} {"кэш +/-":>11}')
+        self.stdout.write(header)
+        for name, view in views.items():
+            wall = view['wall']
+            self.stdout.write(
+                f'{name:<28} {view["requests"]:>8} '
+                f'{_format(wall["p50"]):>8} {_format(wall["p95"]):>8} '
+                f'{_format(wall["p99"]):>8} '
+                f'{_format(view["queries"]["p95"]):>8} '
+                f'{_format(view["db"]["p95"]):>10} '
+                f'{_format(view["template"]["p95"]):>13} '
+                f'{_format(view["parse_saved"]["p50"]):>24} '
+                f'{view["cache_hits"]:>5}/{view["cache_misses"]:<5}')
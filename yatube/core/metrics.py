@@ -0,0 +1,293 @@
+import glob
+import mmap
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+from .db.observers import observe
+from .middleware import ScopedMiddleware
+
+# Гистограммы в духе HDR: значения до 32 точные, дальше каждая степень
+# двойки делится на SUB_BUCKETS частей, то есть погрешность не больше
+# 1/16 значения. Время хранится в микросекундах, до ~19 часов.
+SUB_BITS = 4
+SUB_BUCKETS = 1 << SUB_BITS
+BUCKETS = SUB_BUCKETS * 34
+
+HISTOGRAMS = ('wall', 'db', 'template', 'queries', 'parse_saved')
+COUNTERS = ('cache_hits', 'cache_misses')
+
+MAX_VIEWS = 256
+NAME_SIZE = 128
+SLOT_SIZE = len(COUNTERS) + len(HISTOGRAMS) * BUCKETS
+NAMES_BYTES = MAX_VIEWS * NAME_SIZE
+FILE_SIZE = NAMES_BYTES + MAX_VIEWS * SLOT_SIZE * 8
+OTHER = '<other>'
+
+PERCENTILES = (50, 95, 99)
+
+
+def bucket_index(value):
+    value = max(int(value), 0)
+    if value < 2 * SUB_BUCKETS:
+        return value
+    shift = value.bit_length() - SUB_BITS - 1
+    index = (shift + 1) * SUB_BUCKETS + (value >> shift) - SUB_BUCKETS
+    return min(index, BUCKETS - 1)
+
+
+def bucket_bounds(index):
+    """Наименьшее и наибольшее значение, попадающее в корзину."""
+    if index < 2 * SUB_BUCKETS:
+        return index, index
+    shift = index // SUB_BUCKETS - 1
+    low = (SUB_BUCKETS + index % SUB_BUCKETS) << shift
+    return low, low + (1 << shift) - 1
+
+
+def percentile(buckets, percent):
+    total = sum(buckets)
+    if not total:
+        return None
+    rank = total * percent / 100
+    seen = 0
+    for index, count in enumerate(buckets):
+        seen += count
+        if count and seen >= rank:
+            return bucket_bounds(index)[1]
+    return None
+
+
+class RequestMetrics:
+    __slots__ = ('db', 'queries', 'template', 'parse_saved', 'cache_hits',
+                 'cache_misses', '_lock')
+
+    def __init__(self):
+        self.db = 0.0
+        self.queries = 0
+        self.template = 0.0
+        # Время разбора шаблонов, взятых скомпилированными из кэша.
+        self.parse_saved = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # Асинхронное представление делает запросы из нескольких потоков.
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.db += elapsed
+                self.queries += 1
+
+
+_current = ContextVar('request_metrics', default=None)
+
+
+def record_cache(hits=0, misses=0):
+    """Вызывается кэшем: попадания и промахи текущего запроса."""
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.cache_hits += hits
+        metrics.cache_misses += misses
+
+
+def record_template(seconds):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.template += seconds
+
+
+def record_parse_saved(seconds):
+    """Вызывается core.template_loader: шаблон не пришлось разбирать."""
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.parse_saved += seconds
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _remove_stale():
+    """Удаляет файлы завершившихся процессов."""
+    pattern = os.path.join(settings.METRICS_LOCATION, '*.bin')
+    for path in glob.glob(pattern):
+        pid = os.path.splitext(os.path.basename(path))[0]
+        if pid.isdigit() and not _alive(int(pid)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+class MetricsFile:
+    """Гистограммы одного процесса в файле METRICS_LOCATION/<pid>.bin.
+
+    В каждый файл пишет только его процесс, поэтому запись не требует
+    блокировок между воркерами, а читатель просто складывает все файлы.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._key = None
+        self._slots = {}
+
+    def _setup(self):
+        key = (os.getpid(), settings.METRICS_LOCATION)
+        if self._key == key:
+            return
+        os.makedirs(settings.METRICS_LOCATION, exist_ok=True)
+        path = os.path.join(settings.METRICS_LOCATION, f'{os.getpid()}.bin')
+        _remove_stale()
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            # Файл мог остаться от прежнего процесса с тем же pid: его
+            # гистограммы лежат под чужими номерами слотов.
+            os.ftruncate(fd, 0)
+            os.ftruncate(fd, FILE_SIZE)
+            self._mmap = mmap.mmap(fd, FILE_SIZE)
+        finally:
+            os.close(fd)
+        self._values = memoryview(self._mmap)[NAMES_BYTES:].cast('Q')
+        self._slots = {}
+        self._key = key
+
+    def _slot(self, name):
+        slot = self._slots.get(name)
+        if slot is None:
+            if len(self._slots) >= MAX_VIEWS - 1:
+                name = OTHER
+            slot = self._slots.setdefault(name, len(self._slots))
+            encoded = name.encode()[:NAME_SIZE]
+            start = slot * NAME_SIZE
+            self._mmap[start:start + NAME_SIZE] = encoded.ljust(
+                NAME_SIZE, b'\0')
+        return slot
+
+    def record(self, name, wall, metrics):
+        histograms = (
+            wall * 1e6, metrics.db * 1e6, metrics.template * 1e6,
+            metrics.queries, metrics.parse_saved * 1e6)
+        with self._lock:
+            self._setup()
+            base = self._slot(name) * SLOT_SIZE
+            values = self._values
+            values[base] += metrics.cache_hits
+            values[base + 1] += metrics.cache_misses
+            offset = base + len(COUNTERS)
+            for value in histograms:
+                values[offset + bucket_index(value)] += 1
+                offset += BUCKETS
+
+
+recorder = MetricsFile()
+
+
+def _read(path):
+    with open(path, 'rb') as file:
+        data = file.read()
+    if len(data) != FILE_SIZE:
+        return
+    values = memoryview(data)[NAMES_BYTES:].cast('Q')
+    for slot in range(MAX_VIEWS):
+        raw = data[slot * NAME_SIZE:(slot + 1) * NAME_SIZE].rstrip(b'\0')
+        if not raw:
+            break
+        yield raw.decode(errors='replace'), values[
+            slot * SLOT_SIZE:(slot + 1) * SLOT_SIZE]
+
+
+def collect():
+    """Складывает файлы всех процессов: имя -> список значений слота."""
+    views = {}
+    pattern = os.path.join(settings.METRICS_LOCATION, '*.bin')
+    for path in glob.glob(pattern):
+        for name, values in _read(path):
+            total = views.setdefault(name, [0] * SLOT_SIZE)
+            for index, value in enumerate(values):
+                if value:
+                    total[index] += value
+    return views
+
+
+def summary():
+    """p50/p95/p99 каждой метрики по представлениям.
+
+    Время — в миллисекундах, queries — число запросов.
+    """
+    result = {}
+    for name, values in sorted(collect().items()):
+        requests = sum(values[len(COUNTERS):][:BUCKETS])
+        if not requests:
+            # Слот обнулён reset().
+            continue
+        view = {
+            'requests': requests,
+            **dict(zip(COUNTERS, values)),
+        }
+        offset = len(COUNTERS)
+        for histogram in HISTOGRAMS:
+            buckets = values[offset:offset + BUCKETS]
+            offset += BUCKETS
+            scale = 1 if histogram == 'queries' else 1000
+            view[histogram] = {
+                f'p{percent}': (
+                    None if value is None else round(value / scale, 3))
+                for percent in PERCENTILES
+                for value in [percentile(buckets, percent)]
+            }
+        result[name] = view
+    return result
+
+
+def reset():
+    """Обнуляет гистограммы всех процессов.
+
+    Файлы живых воркеров не удаляются, а обнуляются на месте: воркеры
+    продолжают писать в них через свой mmap. Имена слотов остаются —
+    по ним воркер находит слот представления.
+    """
+    _remove_stale()
+    zeros = bytes(FILE_SIZE - NAMES_BYTES)
+    for path in glob.glob(os.path.join(settings.METRICS_LOCATION, '*.bin')):
+        try:
+            with open(path, 'r+b') as file:
+                file.seek(NAMES_BYTES)
+                file.write(zeros)
+        except FileNotFoundError:
+            pass
+
+
+class MetricsMiddleware(ScopedMiddleware):
+    """Время, SQL, рендер шаблонов и кэш каждого запроса по имени
+    представления (posts:index, ...). Запросы, не дошедшие до
+    представления, не учитываются."""
+
+    @contextmanager
+    def scope(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        start = time.perf_counter()
+        try:
+            with observe(metrics):
+                yield
+        finally:
+            _current.reset(token)
+        match = getattr(request, 'resolver_match', None)
+        if match is not None:
+            recorder.record(
+                match.view_name, time.perf_counter() - start, metrics)
@@ -0,0 +1,40 @@
+import asyncio
+from contextlib import nullcontext
+
+
+class ScopedMiddleware:
+    """Основа middleware, которое оборачивает обработку запроса целиком.
+
+    Работает и в WSGI, и в ASGI: под ASGI Django не переносит его в
+    отдельный поток, как синхронное middleware. scope(request) —
+    контекстный менеджер вокруг остальной цепочки, finish(request,
+    response) — обработка готового ответа; оба не должны ходить в базу.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self._async = asyncio.iscoroutinefunction(get_response)
+        if self._async:
+            # Как в MiddlewareMixin: Django должен видеть корутину.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if self._async:
+            return self._acall(request)
+        with self.scope(request):
+            response = self.get_response(request)
+        return self.finish(request, response)
+
+    async def _acall(self, request):
+        with self.scope(request):
+            response = await self.get_response(request)
+        return self.finish(request, response)
+
+    def scope(self, request):
+        return nullcontext()
+
+    def finish(self, request, response):
+        return response
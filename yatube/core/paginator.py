@@ -0,0 +1,166 @@
+import base64
+import binascii
+import datetime
+import json
+from collections.abc import Sequence
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """Сохраняет микросекунды, иначе курсор пропустит соседние записи."""
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class CursorPage(Sequence):
+    """Страница курсорной пагинации."""
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return f'<CursorPage {len(self.object_list)} objects>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if not self._has_next or not self.object_list:
+            return None
+        return self.paginator.encode_cursor(NEXT, self.object_list[-1])
+
+    @property
+    def previous_cursor(self):
+        if not self._has_previous or not self.object_list:
+            return None
+        return self.paginator.encode_cursor(PREVIOUS, self.object_list[0])
+
+
+class CursorPaginator:
+    """Пагинация по ключу (keyset) вместо LIMIT/OFFSET.
+
+    Каждая страница выбирается одним запросом по индексу от позиции
+    курсора, поэтому не нужен COUNT(*) и глубокие страницы стоят столько
+    же, сколько первая. Последнее поле в ordering должно быть уникальным.
+    """
+
+    def __init__(self, queryset, per_page, ordering=('-pub_date', '-id')):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.ordering = tuple(ordering)
+        self.fields = [name.lstrip('-') for name in self.ordering]
+        self._model_fields = [self.cursor_field(name) for name in self.fields]
+
+    def cursor_field(self, name):
+        """Поле модели, которым значение из курсора приводится к типу."""
+        opts = self.queryset.model._meta
+        return opts.pk if name == 'pk' else opts.get_field(name)
+
+    def _position(self, obj):
+        return [getattr(obj, name) for name in self.fields]
+
+    def encode_cursor(self, direction, obj):
+        payload = json.dumps(
+            [direction, self._position(obj)],
+            cls=CursorEncoder,
+            separators=(',', ':'),
+        )
+        return base64.urlsafe_b64encode(
+            payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            direction, raw_values = json.loads(
+                base64.urlsafe_b64decode(padded.encode()))
+            if direction not in (NEXT, PREVIOUS):
+                raise InvalidCursor(cursor)
+            if len(raw_values) != len(self._model_fields):
+                raise InvalidCursor(cursor)
+            values = [
+                field.to_python(value)
+                for field, value in zip(self._model_fields, raw_values)
+            ]
+        except (TypeError, ValueError, binascii.Error, ValidationError):
+            raise InvalidCursor(cursor)
+        return direction, values
+
+    def _seek(self, values, forward, fields=None):
+        """Условие «строго после позиции» для составного ключа."""
+        condition = Q()
+        equal = {}
+        fields = fields or self.fields
+        for name, field, value in zip(self.ordering, fields, values):
+            descending = name.startswith('-')
+            lookup = 'lt' if descending == forward else 'gt'
+            condition |= Q(**equal, **{f'{field}__{lookup}': value})
+            equal[field] = value
+        return condition
+
+    def _reversed_ordering(self):
+        return [
+            name[1:] if name.startswith('-') else f'-{name}'
+            for name in self.ordering
+        ]
+
+    def _fetch(self, values, forward, limit):
+        """Первые limit объектов после позиции в нужном направлении."""
+        queryset = self.queryset
+        if values is not None:
+            queryset = queryset.filter(self._seek(values, forward))
+        ordering = self.ordering if forward else self._reversed_ordering()
+        return list(queryset.order_by(*ordering)[:limit])
+
+    def page(self, cursor=None):
+        limit = self.per_page + 1
+        if not cursor:
+            rows = self._fetch(None, True, limit)
+            return CursorPage(
+                rows[:self.per_page], self, len(rows) > self.per_page, False)
+        direction, values = self.decode_cursor(cursor)
+        if direction == NEXT:
+            rows = self._fetch(values, True, limit)
+            return CursorPage(
+                rows[:self.per_page], self, len(rows) > self.per_page, True)
+        rows = self._fetch(values, False, limit)
+        if len(rows) <= self.per_page:
+            return self.page()
+        rows = rows[:self.per_page]
+        rows.reverse()
+        return CursorPage(rows, self, True, True)
+
+    def get_page(self, cursor=None):
+        """Как page(), но битый курсор отдаёт первую страницу."""
+        try:
+            return self.page(cursor)
+        except InvalidCursor:
+            return self.page()
@@ -0,0 +1,77 @@
+import logging
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from .db.observers import observe
+from .middleware import ScopedMiddleware
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def query_budget(limit):
+    """Объявляет, сколько SQL-запросов может сделать представление.
+
+    Сам декоратор ничего не считает: бюджет проверяет
+    QueryBudgetMiddleware. Ставится поверх остальных декораторов, чтобы
+    в бюджет вошли и запросы кэширующих обёрток.
+    """
+    def decorator(view):
+        view.query_budget = limit
+        return view
+    return decorator
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+        # Асинхронное представление делает запросы из нескольких потоков.
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+
+class QueryBudgetMiddleware(ScopedMiddleware):
+    """Считает запросы представления и сверяет их с его бюджетом.
+
+    Учитываются запросы от вызова представления до готового ответа, на
+    всех подключениях и во всех потоках запроса. Превышение пишется в лог, а при
+    QUERY_BUDGET_STRICT поднимает QueryBudgetExceeded. Итог доступен в
+    request.query_count и request.query_budget.
+    """
+
+    @contextmanager
+    def scope(self, request):
+        counter = QueryCounter()
+        request.query_budget = None
+        request._query_counter = counter
+        with observe(counter):
+            yield
+
+    def finish(self, request, response):
+        if request.query_budget is not None:
+            request.query_count = (
+                request._query_counter.count - request._query_start)
+            self.check(request)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = getattr(view_func, 'query_budget', None)
+        request._query_start = request._query_counter.count
+
+    def check(self, request):
+        if request.query_count <= request.query_budget:
+            return
+        message = '%s: %d SQL-запросов при бюджете %d' % (
+            request.path, request.query_count, request.query_budget)
+        if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
@@ -0,0 +1,75 @@
+import re
+
+from django.db import connection
+from django.test import Client
+
+from .db.observers import observe
+
+# Полный проход по таблице: SCAN без индекса. Проход по индексу
+# («SCAN t USING INDEX i») — это чтение в порядке ORDER BY, его
+# ограничивает LIMIT, поэтому он не помечается.
+FULL_SCAN = re.compile(r'^SCAN (\w+)(?: AS \w+)?$')
+TEMP_SORT = re.compile(r'USE TEMP B-TREE FOR (.+)')
+EXPLAINED = ('SELECT', 'UPDATE', 'DELETE', 'INSERT', 'WITH')
+
+
+def explain(sql, params=(), using=connection):
+    """Строки EXPLAIN QUERY PLAN запроса с отступами по вложенности."""
+    with using.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        rows = cursor.fetchall()
+    depth = {0: -1}
+    lines = []
+    for node, parent, _, detail in rows:
+        depth[node] = depth.get(parent, -1) + 1
+        lines.append('  ' * depth[node] + detail)
+    return lines
+
+
+def problems(plan, allowed=()):
+    """Полные проходы и сортировки во временном B-дереве.
+
+    allowed — таблицы, которые можно читать целиком: справочники из
+    нескольких строк.
+    """
+    found = []
+    for line in plan:
+        detail = line.strip()
+        scan = FULL_SCAN.match(detail)
+        if scan and scan.group(1) not in allowed:
+            found.append(f'полный проход по {scan.group(1)}')
+        sort = TEMP_SORT.search(detail)
+        if sort:
+            found.append(f'временная сортировка для {sort.group(1)}')
+    return found
+
+
+class StatementLog:
+    """Обёртка execute, которая запоминает запросы с параметрами."""
+
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if not many:
+            self.statements.append((sql, params))
+        return execute(sql, params, many, context)
+
+
+def capture(url, user=None):
+    """Код ответа и запросы, выполненные на GET url, как (sql, params)."""
+    client = Client()
+    if user is not None:
+        client.force_login(user)
+    log = StatementLog()
+    with observe(log):
+        response = client.get(url)
+    return response.status_code, log.statements
+
+
+def audit(sql, params=(), allowed=()):
+    """(план, проблемы) запроса; для остальных команд SQL — None."""
+    if not sql.lstrip().upper().startswith(EXPLAINED):
+        return None
+    plan = explain(sql, params)
+    return plan, problems(plan, allowed)
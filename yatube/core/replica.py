@@ -0,0 +1,170 @@
+import re
+import sqlite3
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .db.observers import observe
+from .middleware import ScopedMiddleware
+
+SYNCED_KEY = 'replica:synced'
+PIN_COOKIE = 'db_primary'
+WRITE = re.compile(r'\s*(INSERT|UPDATE|DELETE|REPLACE)\b', re.IGNORECASE)
+# Сессии всегда читаются из основной базы: сессия, которой ещё нет в
+# реплике, считается пустой, и SessionMiddleware стирает её cookie.
+PRIMARY_APPS = {'sessions'}
+
+# Алиас для чтения в текущем запросе; None — основная база.
+_read_alias = ContextVar('read_alias', default=None)
+
+
+def read_replica(view):
+    """Разрешает представлению читать из реплики.
+
+    Как и query_budget, только помечает представление: базу выбирает
+    ReplicaMiddleware. Подходит представлениям, которые ничего не пишут.
+    """
+    view.read_replica = True
+    return view
+
+
+def synced_at():
+    """Время (ns) последней синхронизации реплики или None."""
+    return cache.get(SYNCED_KEY)
+
+
+def replica_alias():
+    """Алиас реплики, если она настроена и отстаёт не больше
+    REPLICA_MAX_LAG секунд, иначе None."""
+    alias = getattr(settings, 'READ_REPLICA', None)
+    if alias is None or alias not in settings.DATABASES:
+        return None
+    synced = synced_at()
+    if synced is None:
+        return None
+    if time.time_ns() - synced > settings.REPLICA_MAX_LAG * 1e9:
+        return None
+    return alias
+
+
+def caught_up(version):
+    """Видно ли в базе текущего запроса всё записанное до version (ns).
+
+    Основная база видит всё. Страницу, собранную из реплики, которая
+    синхронизирована раньше инвалидации её тегов, кэшировать нельзя.
+    """
+    if _read_alias.get() is None:
+        return True
+    synced = synced_at()
+    return synced is not None and synced >= version
+
+
+class ReplicaRouter:
+    """Чтение — из базы, выбранной ReplicaMiddleware, запись — всегда в
+    основную."""
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label in PRIMARY_APPS:
+            return DEFAULT_DB_ALIAS
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        # Явно: иначе объект, прочитанный из реплики, сохранялся бы в неё.
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Схема попадает в реплику вместе с данными при синхронизации.
+        return db == DEFAULT_DB_ALIAS
+
+
+class WriteDetector:
+    def __init__(self):
+        self.writes = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        if WRITE.match(sql):
+            self.writes += 1
+        return execute(sql, params, many, context)
+
+
+def caught_up_with(request):
+    """Есть ли в реплике последняя запись этого браузера."""
+    try:
+        written = int(request.COOKIES.get(PIN_COOKIE, 0))
+    except ValueError:
+        return False
+    return written == 0 or (synced_at() or 0) >= written
+
+
+class ReplicaMiddleware(ScopedMiddleware):
+    """Отправляет чтение представлений с read_replica в реплику.
+
+    После запроса, который что-то записал, браузер получает cookie со
+    временем записи. Пока реплика синхронизирована раньше, его запросы
+    читают основную базу: пользователь видит свои изменения. Выбранный
+    алиас — в request.read_database.
+    """
+
+    @contextmanager
+    def scope(self, request):
+        request.read_database = DEFAULT_DB_ALIAS
+        request._write_detector = WriteDetector()
+        try:
+            with observe(request._write_detector):
+                yield
+        finally:
+            # Под ASGI process_view работает в другом потоке со своей
+            # копией контекста, поэтому токена для reset() здесь нет.
+            _read_alias.set(None)
+
+    def finish(self, request, response):
+        if request._write_detector.writes:
+            # Дольше REPLICA_MAX_LAG cookie не нужна: настолько
+            # отставшую реплику не читает никто.
+            response.set_cookie(
+                PIN_COOKIE, str(time.time_ns()),
+                max_age=settings.REPLICA_MAX_LAG, httponly=True,
+                samesite='Lax')
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not getattr(view_func, 'read_replica', False):
+            return None
+        alias = replica_alias()
+        if alias is not None and caught_up_with(request):
+            request.read_database = alias
+            _read_alias.set(alias)
+        return None
+
+
+def backup(source_path, target_path):
+    """Согласованная копия файла SQLite через backup API.
+
+    backup читает источник в одной транзакции и запись в основную базу
+    в WAL не блокирует. Читатели копии ждут окончания (busy_timeout).
+    """
+    source = sqlite3.connect(source_path)
+    target = sqlite3.connect(target_path, timeout=30)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+
+def sync(source=DEFAULT_DB_ALIAS, target=None):
+    """Копирует основную базу в реплику и запоминает время начала
+    копирования в ns: в реплике есть всё, что записано до него."""
+    target = target or settings.READ_REPLICA
+    started = time.time_ns()
+    backup(connections[source].settings_dict['NAME'],
+           connections[target].settings_dict['NAME'])
+    cache.set(SYNCED_KEY, started, None)
+    return started
@@ -0,0 +1,153 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import posixpath
+import tempfile
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+
+from .models import StoredFile
+
+# brotli не входит в requirements.txt: без него collectstatic пишет
+# только .gz, а core.assets отдаёт их.
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранит каждое содержимое один раз под именем из его sha256.
+
+    Загрузка пишется во временный файл и хэшируется по ходу записи, затем
+    переносится в <каталог upload_to>/ab/cd/<sha256><расширение>. Если
+    такой файл уже есть, копия просто удаляется. StoredFile считает ссылки,
+    delete() убирает файл с диска только вместе с последней ссылкой.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # Одинаковое имя означает одинаковое содержимое, суффиксы не нужны.
+        return name
+
+    def _stream_to_temp(self, content):
+        directory = self.path('tmp')
+        os.makedirs(directory, exist_ok=True)
+        digest = hashlib.sha256()
+        fd, temp_path = tempfile.mkstemp(dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as temp:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    temp.write(chunk)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        return digest.hexdigest(), temp_path
+
+    def content_name(self, name, digest):
+        directory = posixpath.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        return posixpath.join(
+            directory, digest[:2], digest[2:4], digest + extension)
+
+    def _save(self, name, content):
+        digest, temp_path = self._stream_to_temp(content)
+        name = self.content_name(name, digest)
+        path = self.path(name)
+        # Ссылка берётся до проверки файла: параллельный delete() либо
+        # увидит её, либо уже удалил файл, и мы положим его заново.
+        with transaction.atomic():
+            stored, _ = StoredFile.objects.select_for_update().get_or_create(
+                name=name)
+            StoredFile.objects.filter(pk=stored.pk).update(
+                references=F('references') + 1)
+        if os.path.exists(path):
+            os.remove(temp_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(temp_path, path)
+            if self.file_permissions_mode is not None:
+                os.chmod(path, self.file_permissions_mode)
+        return name
+
+    def delete(self, name):
+        """Снимает одну ссылку; файл удаляется, когда ссылок не осталось.
+
+        Файлы, сохранённые до появления этого хранилища, не учитываются
+        и не удаляются.
+        """
+        with transaction.atomic():
+            stored = StoredFile.objects.select_for_update().filter(
+                name=name).first()
+            if stored is None:
+                return
+            if stored.references > 1:
+                StoredFile.objects.filter(pk=stored.pk).update(
+                    references=F('references') - 1)
+                return
+            stored.delete()
+            super().delete(name)
+
+
+content_storage = ContentAddressedStorage()
+
+
+def compressible(name):
+    """Стоит ли сжимать файл: текст, а не уже сжатые картинки и шрифты."""
+    content_type, encoding = mimetypes.guess_type(name)
+    if encoding is not None or content_type is None:
+        return False
+    return content_type.startswith('text/') or content_type in (
+        'application/javascript', 'application/json', 'application/xml',
+        'image/svg+xml', 'image/x-icon',
+    )
+
+
+def compress(content):
+    """Сжатые варианты содержимого: суффикс -> байты. .br — если
+    установлен brotli."""
+    variants = {'.gz': gzip.compress(content, 9, mtime=0)}
+    if brotli is not None:
+        variants['.br'] = brotli.compress(content)
+    return variants
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """ManifestStaticFilesStorage, который после collectstatic кладёт
+    рядом с текстовыми файлами сжатые копии .gz и .br.
+
+    Сжимаются и исходные имена, и имена с хэшем; копия пишется, только
+    если она заметно меньше файла. core.assets выбирает вариант по
+    Accept-Encoding.
+    """
+    min_size = 256
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in paths:
+            hashed_name = self.hashed_files.get(
+                self.hash_key(self.clean_name(name)))
+            for target in {name, hashed_name} - {None}:
+                if compressible(target):
+                    self.write_compressed(target)
+
+    def write_compressed(self, name):
+        with self.open(name) as file:
+            content = file.read()
+        if len(content) < self.min_size:
+            return
+        for suffix, data in compress(content).items():
+            if len(data) < len(content) * 0.9:
+                self.delete(name + suffix)
+                self._save(name + suffix, ContentFile(data))
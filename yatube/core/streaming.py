@@ -0,0 +1,82 @@
+import asyncio
+
+from django.urls import Resolver404, get_resolver, set_urlconf
+
+
+def asgi_stream(handler):
+    """Отдаёт URL представления под ASGI асинхронному handler.
+
+    Django 3.2 читает StreamingHttpResponse синхронно прямо в цикле
+    событий, поэтому долгий поток (SSE) под ASGI обслуживает
+    handler(scope, receive, send, **kwargs) в обход middleware. Если
+    handler вернул False, ничего не отправив, запрос обслуживает само
+    представление: так отдаются, например, 404. Для WSGI и runserver
+    представление остаётся как есть. Как и query_budget,
+    декоратор только помечает представление; маршрут выбирает
+    StreamRouter.
+    """
+    def decorator(view):
+        view.asgi_stream = handler
+        return view
+    return decorator
+
+
+class StreamRouter:
+    """ASGI-приложение: пути представлений с asgi_stream — их
+    обработчикам, остальное — application."""
+
+    def __init__(self, application):
+        self.application = application
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http':
+            set_urlconf(None)
+            try:
+                match = get_resolver().resolve(scope['path'])
+            except Resolver404:
+                match = None
+            handler = getattr(match and match.func, 'asgi_stream', None)
+            if (handler is not None and await handler(
+                    scope, receive, send, **match.kwargs) is not False):
+                return
+        await self.application(scope, receive, send)
+
+
+async def until_disconnect(receive):
+    """Ждёт, пока клиент закроет соединение."""
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def send_events(events, receive, send, headers=(), timeout=None):
+    """Отправляет байты из асинхронного итератора events как тело ответа
+    200, пока клиент не отключится или не пройдёт timeout секунд."""
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [
+            (name.encode(), value.encode()) for name, value in headers],
+    })
+
+    async def pump():
+        async for chunk in events:
+            await send({
+                'type': 'http.response.body', 'body': chunk,
+                'more_body': True,
+            })
+
+    tasks = {
+        asyncio.ensure_future(pump()),
+        asyncio.ensure_future(until_disconnect(receive)),
+    }
+    try:
+        done, _ = await asyncio.wait(
+            tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    for task in done:
+        if not task.cancelled() and task.exception() is not None:
+            raise task.exception()
+    await send({'type': 'http.response.body'})
@@ -0,0 +1,93 @@
+import logging
+import os
+import time
+
+from django.template import TemplateSyntaxError, engines
+from django.template.backends.django import DjangoTemplates
+from django.template.loaders import cached
+
+from .metrics import record_parse_saved
+
+logger = logging.getLogger(__name__)
+
+
+def _mtime(origin):
+    try:
+        return os.stat(origin.name).st_mtime_ns
+    except (OSError, TypeError, ValueError):
+        return None
+
+
+class Loader(cached.Loader):
+    """cached.Loader, который знает цену компиляции каждого шаблона.
+
+    Каждое попадание в кэш сообщается в core.metrics как сэкономленное
+    время разбора. warm() компилирует заранее все шаблоны каталогов
+    загрузчиков. С autoreload (для разработки) шаблон перекомпилируется,
+    если его файл изменился, а ненайденные шаблоны ищутся заново.
+    """
+
+    def __init__(self, engine, loaders, autoreload=False):
+        super().__init__(engine, loaders)
+        self.autoreload = autoreload
+        # Ключ кэша -> (секунд на компиляцию, mtime файла).
+        self.compiled = {}
+
+    def get_template(self, template_name, skip=None):
+        key = self.cache_key(template_name, skip)
+        compiled = self.compiled.get(key)
+        if compiled is not None:
+            seconds, mtime = compiled
+            template = self.get_template_cache.get(key)
+            if template is not None and not (
+                    self.autoreload and _mtime(template.origin) != mtime):
+                record_parse_saved(seconds)
+                return template
+            self.compiled.pop(key, None)
+            self.get_template_cache.pop(key, None)
+        elif self.autoreload:
+            self.get_template_cache.pop(key, None)
+        start = time.perf_counter()
+        template = super().get_template(template_name, skip)
+        self.compiled[key] = (
+            time.perf_counter() - start, _mtime(template.origin))
+        return template
+
+    def template_names(self):
+        for loader in self.loaders:
+            for directory in loader.get_dirs():
+                for root, _, files in os.walk(directory):
+                    for filename in files:
+                        path = os.path.relpath(
+                            os.path.join(root, filename), directory)
+                        yield path.replace(os.sep, '/')
+
+    def warm(self):
+        """Компилирует все шаблоны; возвращает их число и секунды на
+        компиляцию."""
+        for name in self.template_names():
+            try:
+                self.get_template(name)
+            except (TemplateSyntaxError, UnicodeDecodeError) as exc:
+                # Например, шаблон приложения с библиотекой тегов, которой
+                # нет в INSTALLED_APPS: его никто и не отрисует.
+                logger.debug('Шаблон %s не скомпилирован: %s', name, exc)
+        seconds = sum(cost for cost, _ in self.compiled.values())
+        return len(self.compiled), seconds
+
+    def reset(self):
+        super().reset()
+        self.compiled.clear()
+
+
+def warm_up():
+    """Компилирует шаблоны всех движков с этим загрузчиком: при старте
+    воркера, до первых запросов."""
+    for backend in engines.all():
+        if not isinstance(backend, DjangoTemplates):
+            continue
+        for loader in backend.engine.template_loaders:
+            if isinstance(loader, Loader):
+                count, seconds = loader.warm()
+                logger.info(
+                    'Скомпилировано шаблонов: %d за %.3f с', count, seconds)
@@ -0,0 +1,51 @@
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    """Прогон тестов, в котором выход представления за бюджет запросов —
+    ошибка, а не предупреждение в логе, а метрики запросов пишутся во
+    временный каталог, а не к метрикам сервера. Асинхронные представления
+    ходят в базу из потока запроса: данные TestCase видны только в его
+    транзакции. Статика берётся без манифеста collectstatic. Кэш тоже
+    свой, во временном каталоге: cache.clear() в тестах не трогает кэш
+    сервера."""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._workdir = tempfile.mkdtemp()
+        caches = {
+            alias: {**config, 'LOCATION': f'{self._workdir}/cache-{alias}'}
+            for alias, config in settings.CACHES.items()
+        }
+        self._test_settings = override_settings(
+            QUERY_BUDGET_STRICT=True,
+            ASYNC_PARALLEL_DB=False,
+            METRICS_LOCATION=f'{self._workdir}/metrics',
+            CACHES=caches,
+            STATICFILES_STORAGE=(
+                'django.contrib.staticfiles.storage.StaticFilesStorage'),
+        )
+        self._test_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._test_settings.disable()
+        shutil.rmtree(self._workdir, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
+
+
+class QueryBudgetMixin:
+    """Проверка бюджета запросов для ответов тестового клиента."""
+
+    def assertWithinQueryBudget(self, response):
+        request = response.wsgi_request
+        self.assertIsNotNone(
+            request.query_budget, f'{request.path}: бюджет не объявлен')
+        self.assertLessEqual(
+            request.query_count, request.query_budget,
+            f'{request.path}: {request.query_count} SQL-запросов '
+            f'при бюджете {request.query_budget}')
@@ -0,0 +1,575 @@
+import contextvars
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import time
+import tempfile
+import threading
+from io import StringIO
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import OperationalError, connection, router
+from django.db.utils import ConnectionHandler
+from django.http import HttpResponse
+from django.template import Context, Engine, TemplateDoesNotExist
+from django.test import (RequestFactory, SimpleTestCase, TestCase,
+                         override_settings)
+from django.urls import reverse
+
+from . import assets, asyncdb, metrics, query_plan, replica
+from .cache_backend import TieredCache
+from .db.observers import observe
+from .models import StoredFile
+from .query_budget import QueryCounter
+from .storage import ContentAddressedStorage
+
+
+class TieredCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.location, ignore_errors=True)
+
+    def make_cache(self):
+        """Отдельный экземпляр — как кэш другого воркера."""
+        return TieredCache(self.location, {'OPTIONS': {'STAMP_SLOTS': 64}})
+
+    def test_tiers_and_stats(self):
+        cache = self.make_cache()
+        self.assertIsNone(cache.get('key'))
+        cache.set('key', {'value': 1})
+        self.assertEqual(cache.get('key'), {'value': 1})
+        self.assertEqual(cache.get('key'), {'value': 1})
+        self.assertEqual(cache.stats(), {
+            'l1': {'hits': 1, 'misses': 2},
+            'l2': {'hits': 1, 'misses': 1},
+        })
+
+    def test_invalidation_between_processes(self):
+        worker = self.make_cache()
+        other = self.make_cache()
+        other.set('key', 'old')
+        self.assertEqual(worker.get('key'), 'old')
+        other.set('key', 'new')
+        self.assertEqual(worker.get('key'), 'new')
+        other.delete('key')
+        self.assertIsNone(worker.get('key'))
+        other.set_many({'a': 1, 'b': 2})
+        self.assertEqual(worker.get_many(['a', 'b', 'c']), {'a': 1, 'b': 2})
+        other.clear()
+        self.assertEqual(worker.get_many(['a', 'b']), {})
+
+    def test_add_incr_and_timeout(self):
+        cache = self.make_cache()
+        self.assertTrue(cache.add('counter', 1))
+        self.assertFalse(cache.add('counter', 5))
+        self.assertEqual(cache.incr('counter', 2), 3)
+        with self.assertRaises(ValueError):
+            cache.incr('missing')
+        cache.set('expired', 'value', timeout=-1)
+        self.assertIsNone(cache.get('expired'))
+        self.assertTrue(cache.add('expired', 'fresh'))
+        self.assertEqual(cache.get('expired'), 'fresh')
+
+
+class SQLiteBackendTests(SimpleTestCase):
+    def setUp(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        self.path = f'{location}/db.sqlite3'
+        handler = ConnectionHandler({'default': {
+            'ENGINE': 'core.db.sqlite3',
+            'NAME': self.path,
+            'CONN_MAX_AGE': 60,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'transaction_mode': 'IMMEDIATE',
+                'lock_retries': 2,
+                'pragmas': {
+                    'journal_mode': 'WAL',
+                    'synchronous': 'NORMAL',
+                    'busy_timeout': 0,
+                },
+            },
+        }})
+        self.connection = handler['default']
+        self.addCleanup(handler.close_all)
+        with self.connection.cursor() as cursor:
+            cursor.execute('CREATE TABLE item (id INTEGER PRIMARY KEY)')
+
+    def pragma(self, name):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def lock(self):
+        """Чужое соединение, которое держит блокировку записи."""
+        other = sqlite3.connect(self.path, isolation_level=None, timeout=0)
+        other.execute('BEGIN IMMEDIATE')
+        self.addCleanup(other.close)
+        return other
+
+    def test_pragmas(self):
+        self.assertEqual(self.pragma('journal_mode'), 'wal')
+        self.assertEqual(self.pragma('synchronous'), 1)
+        self.assertEqual(self.pragma('foreign_keys'), 1)
+
+    def test_locked_write_is_retried(self):
+        other = self.lock()
+        with mock.patch('core.db.sqlite3.base.time.sleep') as sleep:
+            sleep.side_effect = lambda delay: other.rollback()
+            with self.connection.cursor() as cursor:
+                cursor.execute('INSERT INTO item DEFAULT VALUES')
+        self.assertEqual(sleep.call_count, 1)
+        with mock.patch('core.db.sqlite3.base.time.sleep') as sleep:
+            self.lock()
+            with self.assertRaises(OperationalError):
+                with self.connection.cursor() as cursor:
+                    cursor.execute('INSERT INTO item DEFAULT VALUES')
+        self.assertEqual(sleep.call_count, 2)
+
+    def test_transaction_takes_write_lock_at_begin(self):
+        self.connection.set_autocommit(
+            False, force_begin_transaction_with_broken_autocommit=True)
+        other = sqlite3.connect(self.path, isolation_level=None, timeout=0)
+        self.addCleanup(other.close)
+        with self.assertRaises(sqlite3.OperationalError):
+            other.execute('BEGIN IMMEDIATE')
+        self.connection.rollback()
+        self.connection.set_autocommit(True)
+
+    def test_persistent_connection_health_check(self):
+        self.connection.ensure_connection()
+        raw = self.connection.connection
+        self.connection.close_if_unusable_or_obsolete()
+        self.assertIs(self.connection.connection, raw)
+        raw.close()
+        self.connection.close_if_unusable_or_obsolete()
+        self.assertEqual(self.pragma('foreign_keys'), 1)
+        self.assertIsNot(self.connection.connection, raw)
+
+    def test_health_check_once_per_request(self):
+        self.connection.ensure_connection()
+        with mock.patch.object(
+                self.connection, 'is_usable',
+                wraps=self.connection.is_usable) as is_usable:
+            self.connection.close_if_unusable_or_obsolete()
+            is_usable.assert_not_called()
+            self.pragma('foreign_keys')
+            self.pragma('synchronous')
+            self.assertEqual(is_usable.call_count, 1)
+            self.connection.close_if_unusable_or_obsolete()
+            self.connection.close_if_unusable_or_obsolete()
+            self.assertEqual(is_usable.call_count, 1)
+
+
+class ContentAddressedStorageTests(TestCase):
+    def setUp(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        self.storage = ContentAddressedStorage(location=location)
+
+    def test_same_content_stored_once(self):
+        first = self.storage.save('posts/a.JPG', ContentFile(b'image'))
+        second = self.storage.save('posts/b.jpg', ContentFile(b'image'))
+        other = self.storage.save('posts/c.jpg', ContentFile(b'other'))
+        digest = hashlib.sha256(b'image').hexdigest()
+        self.assertEqual(
+            first, f'posts/{digest[:2]}/{digest[2:4]}/{digest}.jpg')
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+        self.assertEqual(
+            StoredFile.objects.get(name=first).references, 2)
+
+    def test_file_removed_with_last_reference(self):
+        name = self.storage.save('posts/a.jpg', ContentFile(b'image'))
+        self.storage.save('posts/b.jpg', ContentFile(b'image'))
+        self.storage.delete(name)
+        self.assertTrue(self.storage.exists(name))
+        self.storage.delete(name)
+        self.assertFalse(self.storage.exists(name))
+        self.assertFalse(StoredFile.objects.filter(name=name).exists())
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        settings_override = override_settings(METRICS_LOCATION=location)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(metrics.reset)
+
+    def test_buckets_keep_relative_precision(self):
+        for value in (0, 1, 31, 32, 33, 1000, 123456, 10 ** 9):
+            low, high = metrics.bucket_bounds(metrics.bucket_index(value))
+            self.assertLessEqual(low, value)
+            self.assertGreaterEqual(high, value)
+            self.assertLessEqual(high - low, value / metrics.SUB_BUCKETS)
+
+    def test_processes_are_merged(self):
+        request = metrics.RequestMetrics()
+        request.queries = 3
+        request.cache_hits = 1
+        metrics.recorder.record('posts:index', 0.010, request)
+        with mock.patch('core.metrics.os.getpid', return_value=0):
+            other = metrics.MetricsFile()
+            other.record('posts:index', 0.200, request)
+        view = metrics.summary()['posts:index']
+        self.assertEqual(view['requests'], 2)
+        self.assertEqual(view['cache_hits'], 2)
+        self.assertAlmostEqual(view['wall']['p50'], 10, delta=1)
+        self.assertAlmostEqual(view['wall']['p99'], 200, delta=13)
+        self.assertEqual(view['queries']['p95'], 3)
+
+    def test_reused_pid_starts_empty(self):
+        '''Файл прежнего процесса с тем же pid не смешивается с новым'''
+        metrics.recorder.record(
+            'posts:index', 0.010, metrics.RequestMetrics())
+        restarted = metrics.MetricsFile()
+        restarted.record('posts:search', 0.010, metrics.RequestMetrics())
+        views = metrics.summary()
+        self.assertNotIn('posts:index', views)
+        self.assertEqual(views['posts:search']['requests'], 1)
+
+    def test_reset_keeps_live_workers_recording(self):
+        '''Сброс обнуляет файлы живых воркеров на месте'''
+        request = metrics.RequestMetrics()
+        # Другой живой воркер: сброс делается не в его процессе.
+        with mock.patch('core.metrics.os.getpid', return_value=os.getppid()):
+            worker = metrics.MetricsFile()
+            worker.record('posts:index', 0.010, request)
+            metrics.reset()
+            self.assertEqual(metrics.summary(), {})
+            # Воркер не знает о сбросе и пишет через прежний mmap.
+            worker.record('posts:index', 0.010, request)
+        self.assertEqual(metrics.summary()['posts:index']['requests'], 1)
+
+    def test_views_beyond_limit_share_slot(self):
+        for number in range(metrics.MAX_VIEWS + 5):
+            metrics.recorder.record(
+                f'view{number}', 0.001, metrics.RequestMetrics())
+        views = metrics.summary()
+        self.assertEqual(len(views), metrics.MAX_VIEWS)
+        self.assertEqual(views[metrics.OTHER]['requests'], 6)
+
+    def test_staff_endpoint_and_command(self):
+        self.client.get(reverse('posts:index'))
+        User = get_user_model()
+        user = User.objects.create_user(username='reader')
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 302)
+        user.is_staff = True
+        user.save()
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.json()['posts:index']['requests'], 1)
+        out = StringIO()
+        call_command('view_metrics', stdout=out)
+        self.assertIn('posts:index', out.getvalue())
+
+
+class QueryPlanTests(SimpleTestCase):
+    def test_problems(self):
+        plan = [
+            'SCAN posts_post',
+            'SCAN posts_post USING INDEX post_pub_date',
+            'SCAN posts_group',
+            'SEARCH auth_user USING INTEGER PRIMARY KEY (rowid=?)',
+            'SCAN posts_search VIRTUAL TABLE INDEX 0:M1',
+            'USE TEMP B-TREE FOR ORDER BY',
+        ]
+        self.assertEqual(
+            query_plan.problems(plan, allowed=('posts_group',)), [
+                'полный проход по posts_post',
+                'временная сортировка для ORDER BY',
+            ])
+
+
+class ObserverTests(SimpleTestCase):
+    databases = {'default'}
+
+    def test_queries_of_other_threads(self):
+        """Обёртка видит запросы потоков со скопированным контекстом и не
+        видит запросы чужих потоков."""
+        def query():
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            connection.close()
+
+        counter = QueryCounter()
+        with observe(counter):
+            context = contextvars.copy_context()
+            thread = threading.Thread(target=context.run, args=(query,))
+            thread.start()
+            thread.join()
+            self.assertEqual(counter.count, 1)
+            thread = threading.Thread(target=query)
+            thread.start()
+            thread.join()
+            query()
+        self.assertEqual(counter.count, 2)
+        query()
+        self.assertEqual(counter.count, 2)
+
+    def test_gather(self):
+        """asyncdb.gather возвращает результаты в порядке вызовов."""
+        async def main():
+            return await asyncdb.gather(
+                (sum, (1, 2)), (max, 3, 4), (threading.get_ident,))
+        total, biggest, _ = async_to_sync(main)()
+        self.assertEqual((total, biggest), (3, 4))
+
+
+class TemplateLoaderTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.write('base.html', '<{% block body %}{% endblock %}>')
+        self.write('pages/page.html',
+                   '{% extends "base.html" %}{% block body %}'
+                   '{{ text }}{% endblock %}')
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as file:
+            file.write(content)
+        # mtime должен смениться и на файловых системах с грубым временем.
+        stamp = time.time_ns() + len(content) * 10 ** 9
+        os.utime(path, ns=(stamp, stamp))
+
+    def engine(self, autoreload):
+        engine = Engine(
+            dirs=[self.directory],
+            loaders=[('core.template_loader.Loader', [
+                'django.template.loaders.filesystem.Loader',
+            ], autoreload)])
+        return engine, engine.template_loaders[0]
+
+    def render(self, engine):
+        template = engine.get_template('pages/page.html')
+        return template.render(Context({'text': 'текст'}))
+
+    def test_warm_and_parse_saved(self):
+        """warm() компилирует все шаблоны, попадания считаются
+        сэкономленным разбором."""
+        engine, loader = self.engine(autoreload=False)
+        count, _ = loader.warm()
+        self.assertEqual(count, 2)
+        request = metrics.RequestMetrics()
+        token = metrics._current.set(request)
+        try:
+            self.assertEqual(self.render(engine), '<текст>')
+        finally:
+            metrics._current.reset(token)
+        self.assertGreater(request.parse_saved, 0)
+        self.assertEqual(len(loader.compiled), 2)
+
+    def test_autoreload(self):
+        """С autoreload изменённые и новые файлы перечитываются."""
+        engine, _ = self.engine(autoreload=True)
+        self.render(engine)
+        self.write('base.html', '[{% block body %}{% endblock %}]')
+        self.assertEqual(self.render(engine), '[текст]')
+        with self.assertRaises(TemplateDoesNotExist):
+            engine.get_template('new.html')
+        self.write('new.html', 'новый')
+        self.assertEqual(
+            engine.get_template('new.html').render(Context()), 'новый')
+        production, _ = self.engine(autoreload=False)
+        self.render(production)
+        self.write('base.html', '({% block body %}{% endblock %})')
+        self.assertEqual(self.render(production), '[текст]')
+
+
+class AssetTests(SimpleTestCase):
+    def setUp(self):
+        source = tempfile.mkdtemp()
+        root = tempfile.mkdtemp()
+        media = tempfile.mkdtemp()
+        for directory in (source, root, media):
+            self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.css = ('body { color: black; }\n' * 40).encode()
+        os.makedirs(os.path.join(source, 'css'))
+        with open(os.path.join(source, 'css', 'site.css'), 'wb') as file:
+            file.write(self.css)
+        self.image = bytes(range(256)) * 4
+        self.image_name = 'posts/ab/cd/' + 'ab' * 32 + '.png'
+        os.makedirs(os.path.join(media, 'posts', 'ab', 'cd'))
+        with open(os.path.join(media, self.image_name), 'wb') as file:
+            file.write(self.image)
+        settings_override = override_settings(
+            STATICFILES_DIRS=[source], STATIC_ROOT=root, MEDIA_ROOT=media,
+            STATICFILES_STORAGE=(
+                'core.storage.CompressedManifestStaticFilesStorage'))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        call_command(
+            'collectstatic', interactive=False, verbosity=0,
+            ignore_patterns=['admin', 'rest_framework', 'django_extensions'])
+        with open(os.path.join(root, 'staticfiles.json')) as file:
+            self.hashed = json.load(file)['paths']['css/site.css']
+
+    def get(self, url, **headers):
+        response = self.client.get(url, **headers)
+        body = b''.join(response.streaming_content)
+        response.close()
+        return response, body
+
+    def test_collect_and_encoding(self):
+        """Сжатая копия выбирается по Accept-Encoding, имя с хэшем
+        кэшируется навсегда."""
+        url = '/static/' + self.hashed
+        response, body = self.get(url, HTTP_ACCEPT_ENCODING='gzip, br;q=0')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(body), self.css)
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(response['Cache-Control'], assets.IMMUTABLE)
+        response, body = self.get(url)
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(body, self.css)
+        response, _ = self.get('/static/css/site.css')
+        self.assertEqual(response['Cache-Control'], assets.REVALIDATE)
+        not_modified = self.client.get(
+            '/static/css/site.css', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_ranges(self):
+        url = '/media/' + self.image_name
+        response, body = self.get(url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(body, self.image[10:20])
+        self.assertEqual(response['Content-Length'], '10')
+        self.assertEqual(
+            response['Content-Range'], f'bytes 10-19/{len(self.image)}')
+        self.assertEqual(response['Cache-Control'], assets.IMMUTABLE)
+        _, body = self.get(url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(body, self.image[-5:])
+        response = self.client.get(url, HTTP_RANGE='bytes=5000-')
+        self.assertEqual(response.status_code, 416)
+        response, body = self.get(
+            url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"old"')
+        self.assertEqual((response.status_code, body), (200, self.image))
+        self.assertIsNone(assets.media_path('../secret'))
+
+    def test_zero_copy(self):
+        """Под ASGI с zerocopysend файл уходит одним сообщением."""
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {
+            'type': 'http', 'method': 'GET', 'path': '/media/x',
+            'query_string': b'', 'headers': [(b'range', b'bytes=4-')],
+            'extensions': {'http.response.zerocopysend': {}},
+        }
+        handler = assets.zero_copy(assets.media_path)
+        result = async_to_sync(handler)(
+            scope, None, send, path=self.image_name)
+        self.assertIsNone(result)
+        start, body = messages
+        self.assertEqual(start['status'], 206)
+        self.assertEqual(body['type'], 'http.response.zerocopysend')
+        self.assertEqual(
+            (body['offset'], body['count']), (4, len(self.image) - 4))
+        del scope['extensions']
+        self.assertIs(async_to_sync(handler)(
+            scope, None, send, path=self.image_name), False)
+
+
+@override_settings(READ_REPLICA='replica', REPLICA_MAX_LAG=30)
+class ReplicaTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def serve(self, view, cookies=None, write=False):
+        """Запрос через ReplicaMiddleware; возвращает ответ и базу, из
+        которой читали бы модели внутри представления."""
+        seen = {}
+
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            seen['read'] = router.db_for_read(get_user_model())
+            seen['session'] = router.db_for_read(Session)
+            if write:
+                get_user_model().objects.create(username='writer')
+            return HttpResponse()
+
+        middleware = replica.ReplicaMiddleware(get_response)
+        request = RequestFactory().get('/')
+        request.COOKIES.update(cookies or {})
+        response = middleware(request)
+        return response, seen
+
+    def synced(self, seconds_ago=0):
+        synced = time.time_ns() - int(seconds_ago * 1e9)
+        cache.set(replica.SYNCED_KEY, synced)
+        return synced
+
+    def test_reads_follow_replica_state(self):
+        view = replica.read_replica(lambda request: None)
+        self.assertEqual(self.serve(view)[1]['read'], 'default')
+        self.synced()
+        _, seen = self.serve(view)
+        self.assertEqual(seen['read'], 'replica')
+        self.assertEqual(seen['session'], 'default')
+        self.assertEqual(
+            self.serve(lambda request: None)[1]['read'], 'default')
+        self.synced(seconds_ago=60)
+        self.assertEqual(self.serve(view)[1]['read'], 'default')
+        self.assertEqual(router.db_for_write(get_user_model()), 'default')
+
+    def test_writer_is_pinned_to_primary(self):
+        view = replica.read_replica(lambda request: None)
+        self.synced()
+        response, _ = self.serve(lambda request: None, write=True)
+        self.assertIn(replica.PIN_COOKIE, response.cookies)
+        self.assertNotIn(replica.PIN_COOKIE, self.serve(view)[0].cookies)
+        written = response.cookies[replica.PIN_COOKIE].value
+        _, seen = self.serve(view, cookies={replica.PIN_COOKIE: written})
+        self.assertEqual(seen['read'], 'default')
+        self.synced()
+        _, seen = self.serve(view, cookies={replica.PIN_COOKIE: written})
+        self.assertEqual(seen['read'], 'replica')
+
+    def test_stale_replica_page_is_not_cached(self):
+        view = replica.read_replica(lambda request: None)
+        synced = self.synced()
+        versions = {}
+
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            versions['old'] = replica.caught_up(synced)
+            versions['new'] = replica.caught_up(synced + 1)
+            return HttpResponse()
+
+        middleware = replica.ReplicaMiddleware(get_response)
+        middleware(RequestFactory().get('/'))
+        self.assertEqual(versions, {'old': True, 'new': False})
+        self.assertTrue(replica.caught_up(synced + 1))
+
+    def test_backup(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        source = sqlite3.connect(f'{location}/primary.sqlite3')
+        source.execute('CREATE TABLE item (name TEXT)')
+        source.execute("INSERT INTO item VALUES ('first')")
+        source.commit()
+        replica.backup(
+            f'{location}/primary.sqlite3', f'{location}/replica.sqlite3')
+        source.close()
+        copy = sqlite3.connect(f'{location}/replica.sqlite3')
+        self.addCleanup(copy.close)
+        self.assertEqual(
+            copy.execute('SELECT name FROM item').fetchall(), [('first',)])
@@ -1,5 +1,11 @@
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse
 from django.shortcuts import render
 
+from . import assets
+from .metrics import summary
+from .streaming import asgi_stream
+
 
 def page_not_found(request, exception):
     return render(request, 'core/404.html', {'path': request.path}, status=404)
@@ -15,3 +21,22 @@ def permission_denied(request, exception):
 
 def csrf_failure(request, reason=''):
     return render(request, 'core/403csrf.html')
+
+
+@staff_member_required
+def metrics(request):
+    """p50/p95/p99 по представлениям, собранные со всех воркеров."""
+    return JsonResponse(
+        summary(), json_dumps_params={'ensure_ascii': False})
+
+
+@asgi_stream(assets.zero_copy(assets.static_path))
+def static_file(request, path):
+    """Статика из STATIC_ROOT, см. core.assets."""
+    return assets.serve(request, path, assets.static_path)
+
+
+@asgi_stream(assets.zero_copy(assets.media_path))
+def media_file(request, path):
+    """Загруженные файлы из MEDIA_ROOT, см. core.assets."""
+    return assets.serve(request, path, assets.media_path)
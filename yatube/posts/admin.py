@@ -1,6 +1,7 @@
 from django.contrib import admin
 
 from .models import Follow, Group, Post, Question, Choice
+from .search import match_expression, matching_ids
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -10,6 +11,12 @@ class PostAdmin(admin.ModelAdmin):
     empty_value_display = '-пусто-'
     list_editable = ('group', 'image')
 
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск по индексу FTS5 вместо LIKE '%...%' по всей таблице.
+        if not match_expression(search_term):
+            return queryset, False
+        return queryset.filter(pk__in=matching_ids(search_term)), False
+
 
 class ChoiceInline(admin.TabularInline):
     model = Choice
@@ -0,0 +1,182 @@
+from functools import wraps
+
+from django.conf import settings
+from django.http import Http404, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, set_response_etag
+
+from core.paginator import CursorPaginator
+from core.query_budget import query_budget
+from core.replica import read_replica
+
+from .feed import FollowFeedPaginator
+from .models import Comment, Group, Post, Question, User
+from .serializers import (ChoiceSerializer, GroupSerializer, PostSerializer,
+                          QuestionSerializer, comment_rows, group_rows,
+                          post_rows)
+from .votes import question_totals
+
+
+class APIError(Exception):
+    def __init__(self, status, detail):
+        super().__init__(detail)
+        self.status = status
+        self.detail = detail
+
+
+def error(status, detail):
+    return JsonResponse(
+        {'detail': detail}, status=status,
+        json_dumps_params={'ensure_ascii': False})
+
+
+def json_api(view):
+    """Представление API только для чтения: возвращает данные, а ответ
+    собирает декоратор.
+
+    Ответ получает ETag по содержимому; если он совпал с If-None-Match,
+    уходит 304 без тела. Http404 и APIError становятся ответами с
+    {"detail": ...}.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            response = error(405, 'Метод не поддерживается')
+            response['Allow'] = 'GET, HEAD'
+            return response
+        try:
+            data = view(request, *args, **kwargs)
+        except Http404:
+            return error(404, 'Не найдено')
+        except APIError as exc:
+            return error(exc.status, exc.detail)
+        response = JsonResponse(
+            data, safe=False, json_dumps_params={'ensure_ascii': False})
+        set_response_etag(response)
+        return get_conditional_response(
+            request, etag=response['ETag'], response=response)
+    return wrapper
+
+
+def requested_fields(request, available):
+    """Поля из ?fields=id,text в порядке available; без параметра — все."""
+    raw = request.GET.get('fields')
+    if not raw:
+        return tuple(available)
+    fields = {name.strip() for name in raw.split(',')} - {''}
+    unknown = fields - set(available)
+    if unknown:
+        raise APIError(
+            400, f'Неизвестные поля: {", ".join(sorted(unknown))}')
+    return tuple(name for name in available if name in fields)
+
+
+def cursor_url(request, cursor):
+    if cursor is None:
+        return None
+    query = request.GET.copy()
+    query['cursor'] = cursor
+    return f'{request.path}?{query.urlencode(safe=",")}'
+
+
+def paginated(request, paginator, rows, fields):
+    page_obj = paginator.get_page(request.GET.get('cursor'))
+    return {
+        'results': rows.serialize(page_obj, fields),
+        'next': cursor_url(request, page_obj.next_cursor),
+        'previous': cursor_url(request, page_obj.previous_cursor),
+    }
+
+
+def post_feed(request, **filters):
+    """Страница постов; связанные таблицы — только для запрошенных полей."""
+    fields = requested_fields(request, post_rows.fields)
+    related = [name for name in ('author', 'group') if name in fields]
+    post_list = Post.objects.filter(**filters).select_related(*related)
+    paginator = CursorPaginator(post_list, settings.API_PAGE_SIZE)
+    return paginated(request, paginator, post_rows, fields)
+
+
+@query_budget(1)
+@read_replica
+@json_api
+def posts(request):
+    return post_feed(request)
+
+
+@query_budget(2)
+@read_replica
+@json_api
+def group_posts(request, slug):
+    group = get_object_or_404(Group.objects.only('pk'), slug=slug)
+    return post_feed(request, group=group)
+
+
+@query_budget(2)
+@read_replica
+@json_api
+def author_posts(request, username):
+    author = get_object_or_404(User.objects.only('pk'), username=username)
+    return post_feed(request, author=author)
+
+
+@query_budget(5)
+@json_api
+def follow_posts(request):
+    if not request.user.is_authenticated:
+        raise APIError(401, 'Нужно войти на сайт')
+    fields = requested_fields(request, post_rows.fields)
+    paginator = FollowFeedPaginator(request.user, settings.API_PAGE_SIZE)
+    return paginated(request, paginator, post_rows, fields)
+
+
+@query_budget(1)
+@read_replica
+@json_api
+def post_detail(request, post_id):
+    fields = requested_fields(request, post_rows.fields)
+    post = get_object_or_404(
+        Post.objects.select_related('author', 'group'), pk=post_id)
+    return PostSerializer(post, fields=fields).data
+
+
+@query_budget(2)
+@read_replica
+@json_api
+def post_comments(request, post_id):
+    fields = requested_fields(request, comment_rows.fields)
+    post = get_object_or_404(Post.objects.only('pk'), pk=post_id)
+    comment_list = Comment.objects.filter(post=post)
+    if 'author' in fields:
+        comment_list = comment_list.select_related('author')
+    paginator = CursorPaginator(
+        comment_list, settings.API_PAGE_SIZE, ordering=('created', 'id'))
+    return paginated(request, paginator, comment_rows, fields)
+
+
+@query_budget(1)
+@read_replica
+@json_api
+def groups(request):
+    fields = requested_fields(request, group_rows.fields)
+    return group_rows.serialize(Group.objects.order_by('title'), fields)
+
+
+@query_budget(1)
+@read_replica
+@json_api
+def group_detail(request, slug):
+    fields = requested_fields(request, group_rows.fields)
+    group = get_object_or_404(Group, slug=slug)
+    return GroupSerializer(group, fields=fields).data
+
+
+@query_budget(2)
+@read_replica
+@json_api
+def question_results(request, pk):
+    question = get_object_or_404(Question, pk=pk)
+    return {
+        **QuestionSerializer(question).data,
+        'choices': ChoiceSerializer(question_totals(pk), many=True).data,
+    }
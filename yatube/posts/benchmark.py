@@ -0,0 +1,223 @@
+import shutil
+import statistics
+import tempfile
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.test import Client
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from core.db.observers import observe
+from core.query_budget import QueryCounter
+from posts import api_urls
+from posts import urls as posts_urls
+from users import urls as users_urls
+
+from .models import Group, Post, Question, User
+
+
+@contextmanager
+def scratch_site(shared_file=False):
+    """Временная тестовая база и свои каталоги медиа, кэша и метрик.
+
+    Рабочие данные, кэш и метрики сервера не затрагиваются. С
+    shared_file база лежит в файле, а не в памяти, и её видят
+    процессы, запущенные через fork. Отдаёт временный каталог.
+    """
+    workdir = tempfile.mkdtemp()
+    database = settings.DATABASES['default']
+    old_test = database.get('TEST', {})
+    if shared_file:
+        database['TEST'] = {**old_test, 'NAME': f'{workdir}/db.sqlite3'}
+    runner = DiscoverRunner(verbosity=0, interactive=False)
+    runner.setup_test_environment()
+    old_config = runner.setup_databases()
+    caches = {
+        alias: {**config, 'LOCATION': f'{workdir}/cache-{alias}'}
+        for alias, config in settings.CACHES.items()
+    }
+    try:
+        with override_settings(
+            MEDIA_ROOT=f'{workdir}/media',
+            METRICS_LOCATION=f'{workdir}/metrics',
+            CACHES=caches,
+            QUERY_BUDGET_STRICT=False,
+            # DEBUG выключен, а манифеста collectstatic во временном
+            # окружении нет.
+            STATICFILES_STORAGE=(
+                'django.contrib.staticfiles.storage.StaticFilesStorage'),
+        ):
+            yield workdir
+    finally:
+        runner.teardown_databases(old_config)
+        runner.teardown_test_environment()
+        database['TEST'] = old_test
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def url_kwargs():
+    """Значения параметров URL из сгенерированных данных: самый
+    обсуждаемый пост, самый популярный автор и так далее."""
+    post = Post.objects.order_by('-counter__comments', 'pk').first()
+    author = User.objects.order_by('-counter__followers', 'pk').first()
+    group = Group.objects.order_by('pk').first()
+    question = Question.objects.order_by('pk').first()
+    return {
+        'post_id': post and post.pk,
+        'username': author and author.username,
+        'slug': group and group.slug,
+        'pk': question and question.pk,
+    }
+
+
+URLCONFS = (
+    ('posts', posts_urls), ('users', users_urls), ('api', api_urls))
+
+# Представление API -> HTML-страница с теми же данными
+API_COUNTERPARTS = {
+    'api:posts': 'posts:index',
+    'api:group_posts': 'posts:group_posts',
+    'api:author_posts': 'posts:profile',
+    'api:follow_posts': 'posts:follow_index',
+    'api:post_detail': 'posts:post_detail',
+    'api:post_comments': 'posts:post_comments',
+    'api:question': 'posts:question_visual',
+}
+
+# GET этих маршрутов меняет данные или сессию: подписка, отписка и выход
+# испортили бы и следующие замеры, и саму базу.
+STATE_CHANGING = frozenset({
+    'posts:profile_follow',
+    'posts:profile_unfollow',
+    'users:logout',
+})
+
+
+def view_urls(urlconfs=URLCONFS):
+    """Имя представления -> URL для всех маршрутов posts, users и API."""
+    values = url_kwargs()
+    urls = {}
+    for namespace, module in urlconfs:
+        for pattern in module.urlpatterns:
+            name = f'{namespace}:{pattern.name}'
+            converters = pattern.pattern.converters
+            kwargs = {key: values.get(key) for key in converters}
+            if None in kwargs.values():
+                continue
+            urls[name] = reverse(name, kwargs=kwargs)
+    return urls
+
+
+def reader():
+    """Пользователь, от имени которого открываются страницы: у него
+    больше всех подписок, чтобы лента подписок была непустой."""
+    return User.objects.order_by('-counter__following', 'pk').first()
+
+
+def _timed_get(client, url):
+    # Не CaptureQueriesContext: асинхронные представления ходят в базу и
+    # из других потоков.
+    with observe(QueryCounter()) as queries:
+        start = time.perf_counter()
+        response = client.get(url)
+        elapsed = time.perf_counter() - start
+    return response.status_code, elapsed * 1000, queries.count
+
+
+def _percentile(values, percent):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, round(percent / 100 * (len(ordered) - 1)))
+    return ordered[index]
+
+
+def time_views(iterations=20, user=None):
+    """Замеряет каждое представление через тестовый Client.
+
+    Перед холодным запросом кэш очищается. Тёплый замер идёт с той же
+    сессией после ещё одного запроса: первый ответ выдаёт csrftoken и
+    потому не кэшируется. Маршруты из STATE_CHANGING не замеряются.
+    """
+    user = user or reader()
+    results = {}
+    for name, url in view_urls().items():
+        if name in STATE_CHANGING:
+            continue
+        cold, warm, queries, statuses = [], [], [], set()
+        for _ in range(iterations):
+            client = Client()
+            if user is not None:
+                client.force_login(user)
+            cache.clear()
+            status, elapsed, count = _timed_get(client, url)
+            cold.append(elapsed)
+            queries.append(count)
+            statuses.add(status)
+            client.get(url)
+            warm.append(_timed_get(client, url)[1])
+        results[name] = {
+            'url': url,
+            'status': sorted(statuses),
+            'queries': max(queries),
+            'cold_ms': {
+                'p50': round(statistics.median(cold), 3),
+                'p95': round(_percentile(cold, 95), 3),
+            },
+            'warm_ms': {
+                'p50': round(statistics.median(warm), 3),
+                'p95': round(_percentile(warm, 95), 3),
+            },
+        }
+    return results
+
+
+def compare_api(results):
+    """Медианы API и HTML-страниц с теми же данными.
+
+    speedup — во сколько раз холодный запрос к API быстрее страницы:
+    тёплая страница берётся из кэша, а API каждый раз считается заново.
+    """
+    comparison = {}
+    for api_name, html_name in API_COUNTERPARTS.items():
+        api, html = results.get(api_name), results.get(html_name)
+        if api is None or html is None:
+            continue
+        comparison[api_name] = {
+            'html': html_name,
+            'api_cold_ms': api['cold_ms']['p50'],
+            'html_cold_ms': html['cold_ms']['p50'],
+            'api_warm_ms': api['warm_ms']['p50'],
+            'html_warm_ms': html['warm_ms']['p50'],
+            'speedup': round(
+                html['cold_ms']['p50'] / max(api['cold_ms']['p50'], 1e-3),
+                2),
+        }
+    return comparison
+
+
+def find_regressions(results, baseline, threshold=0.25, min_delta=1.0):
+    """Представления, ставшие медленнее базовых замеров.
+
+    Время считается регрессией, если медиана выросла больше чем на
+    threshold и при этом больше чем на min_delta миллисекунд; число
+    запросов — при любом росте.
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result['queries'] > base['queries']:
+            regressions.append(
+                f'{name}: SQL-запросов {base["queries"]} -> '
+                f'{result["queries"]}')
+        for timing in ('cold_ms', 'warm_ms'):
+            before, after = base[timing]['p50'], result[timing]['p50']
+            if (after > before * (1 + threshold)
+                    and after - before > min_delta):
+                regressions.append(
+                    f'{name}: {timing} p50 {before} -> {after}')
+    return regressions
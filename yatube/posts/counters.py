@@ -0,0 +1,54 @@
+from django.db.models import Count, F
+
+from .models import Post, PostCounter, User, UserCounter
+
+# Поле счётчика -> обратная связь, по которой он пересчитывается.
+USER_RELATIONS = {
+    'posts': 'posts',
+    'comments': 'comments',
+    'followers': 'following',
+    'following': 'follower',
+}
+
+
+def bump_user(user_id, **deltas):
+    """Атомарно сдвигает счётчики пользователя: bump_user(1, posts=1)."""
+    UserCounter.objects.filter(pk=user_id).update(
+        **{name: F(name) + delta for name, delta in deltas.items()})
+
+
+def bump_post(post_id, **deltas):
+    PostCounter.objects.filter(pk=post_id).update(
+        **{name: F(name) + delta for name, delta in deltas.items()})
+
+
+def _rebuild(model, queryset, name, relation, dry_run):
+    stored = dict(model.objects.values_list('pk', name))
+    actual = queryset.annotate(
+        value=Count(relation)).values_list('pk', 'value')
+    fixed = 0
+    for pk, value in actual.iterator():
+        if stored.get(pk) == value:
+            continue
+        fixed += 1
+        if not dry_run:
+            model.objects.update_or_create(pk=pk, defaults={name: value})
+    return fixed
+
+
+def rebuild_user_counters(dry_run=False):
+    """Пересчитывает счётчики пользователей, возвращает число исправлений.
+
+    Каждый счётчик считается отдельным запросом, чтобы JOIN по нескольким
+    связям не перемножал строки.
+    """
+    return sum(
+        _rebuild(UserCounter, User.objects.all(), name, relation, dry_run)
+        for name, relation in USER_RELATIONS.items()
+    )
+
+
+def rebuild_post_counters(dry_run=False):
+    """Пересчитывает счётчики постов, возвращает число исправлений."""
+    return _rebuild(
+        PostCounter, Post.objects.order_by(), 'comments', 'comments', dry_run)
@@ -0,0 +1,155 @@
+import datetime
+import random
+from io import BytesIO
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image, ImageDraw
+
+from core.models import StoredFile
+
+from . import counters, feed, thumbnails
+from .models import (Choice, Comment, Follow, Group, Post, PullAuthor,
+                     Question, User)
+
+WORDS = (
+    'утро', 'город', 'дорога', 'кофе', 'книга', 'река', 'дом', 'друг',
+    'вечер', 'снег', 'море', 'лето', 'работа', 'кот', 'музыка', 'поезд',
+    'окно', 'сад', 'небо', 'письмо', 'история', 'фото', 'день', 'лес',
+)
+
+DEFAULTS = {
+    'users': 50,
+    'groups': 5,
+    'posts': 1000,
+    'comments': 3000,
+    'follows': 500,
+    'questions': 5,
+    'images': 20,
+}
+
+
+def _text(rng, low, high):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(low, high)))
+
+
+def _image(rng, number):
+    width, height = rng.choice(((1200, 800), (800, 1200), (1600, 900)))
+    image = Image.new('RGB', (width, height), tuple(
+        rng.randrange(256) for _ in range(3)))
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        box = sorted(rng.sample(range(width), 2)), sorted(
+            rng.sample(range(height), 2))
+        draw.rectangle(
+            (box[0][0], box[1][0], box[0][1], box[1][1]),
+            fill=tuple(rng.randrange(256) for _ in range(3)))
+    buffer = BytesIO()
+    image.save(buffer, 'JPEG', quality=85)
+    return f'bench-{number}.jpg', buffer.getvalue(), (width, height)
+
+
+def _bulk_create(model, objects):
+    """bulk_create, после которого у объектов есть pk и на SQLite."""
+    last = model.objects.order_by('-pk').values_list(
+        'pk', flat=True).first() or 0
+    model.objects.bulk_create(objects, batch_size=500)
+    return list(model.objects.filter(pk__gt=last).order_by('pk'))
+
+
+@transaction.atomic
+def generate(seed=0, **sizes):
+    """Заполняет базу воспроизводимым набором данных для замеров.
+
+    Строки вставляются через bulk_create, поэтому сигналы не срабатывают:
+    счётчики, ленты подписок и ссылки на картинки досчитываются в конце.
+    Одинаковые seed и размеры дают одинаковые данные.
+    """
+    sizes = {**DEFAULTS, **sizes}
+    rng = random.Random(seed)
+    now = timezone.now()
+    password = make_password(None)
+
+    users = _bulk_create(User, [
+        User(username=f'bench{number}', first_name=rng.choice(WORDS),
+             last_name=rng.choice(WORDS), password=password)
+        for number in range(sizes['users'])])
+    groups = _bulk_create(Group, [
+        Group(title=_text(rng, 1, 3), slug=f'bench-{number}',
+              description=_text(rng, 5, 20))
+        for number in range(sizes['groups'])])
+
+    images = []
+    storage = Post._meta.get_field('image').storage
+    for number in range(sizes['images']):
+        name, content, size = _image(rng, number)
+        images.append((storage.save(f'posts/{name}', ContentFile(content)),
+                       size))
+
+    # Авторы неравномерно популярны: часть пишет заметно чаще.
+    weights = [rng.paretovariate(1.2) for _ in users]
+    posts = []
+    for number in range(sizes['posts']):
+        post = Post(
+            text=_text(rng, 5, 60),
+            author=rng.choices(users, weights)[0],
+            group=rng.choice(groups) if groups and rng.random() < 0.6
+            else None,
+        )
+        if images and rng.random() < 0.3:
+            post.image, (post.image_width, post.image_height) = rng.choice(
+                images)
+        posts.append(post)
+    posts = _bulk_create(Post, posts)
+    # auto_now_add при вставке затирает дату, bulk_update её не трогает.
+    for post in posts:
+        post.pub_date = now - datetime.timedelta(
+            seconds=rng.randrange(365 * 24 * 3600))
+    Post.objects.bulk_update(posts, ['pub_date'], batch_size=500)
+
+    comments = _bulk_create(Comment, [
+        Comment(text=_text(rng, 1, 25), post=rng.choice(posts),
+                author=rng.choice(users))
+        for _ in range(sizes['comments'] if posts else 0)])
+    pub_dates = {post.pk: post.pub_date for post in posts}
+    for comment in comments:
+        comment.created = pub_dates[comment.post_id] + datetime.timedelta(
+            seconds=rng.randrange(7 * 24 * 3600))
+    Comment.objects.bulk_update(comments, ['created'], batch_size=500)
+
+    pairs = set()
+    attempts = 0
+    while len(pairs) < sizes['follows'] and attempts < sizes['follows'] * 10:
+        attempts += 1
+        user, author = rng.choice(users), rng.choices(users, weights)[0]
+        if user != author:
+            pairs.add((user.pk, author.pk))
+    pairs = sorted(pairs)
+    Follow.objects.bulk_create(
+        Follow(user_id=user_id, author_id=author_id)
+        for user_id, author_id in pairs)
+    if users:
+        PullAuthor.objects.create(
+            author=max(zip(weights, users), key=lambda pair: pair[0])[1])
+    for user_id, author_id in pairs:
+        feed.backfill(user_id, author_id)
+
+    for number in range(sizes['questions']):
+        question = Question.objects.create(
+            question_text=_text(rng, 3, 8) + '?',
+            pub_date=now - datetime.timedelta(days=number))
+        Choice.objects.bulk_create(
+            Choice(question=question, choice_text=_text(rng, 1, 3),
+                   votes=rng.randrange(100))
+            for _ in range(rng.randint(2, 5)))
+
+    counters.rebuild_user_counters()
+    counters.rebuild_post_counters()
+    for name, _ in images:
+        StoredFile.objects.filter(name=name).update(
+            references=Post.objects.filter(image=name).count())
+    for name, _ in images:
+        thumbnails.generate(name)
+    return sizes
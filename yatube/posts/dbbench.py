@@ -0,0 +1,154 @@
+import random
+import shutil
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.db.utils import ConnectionHandler
+from django.utils import timezone
+
+from .loadtest import Stats
+from .models import Choice, Comment, PendingVote, Post, PostCounter, User
+
+READS = ('feed', 'post')
+WRITES = ('comment', 'vote')
+
+
+def profiles():
+    """Профили для сравнения: стандартный бэкенд Django и DATABASES из
+    настроек. NAME подставляет run()."""
+    return {
+        'django': {'ENGINE': 'django.db.backends.sqlite3'},
+        'configured': {
+            key: value
+            for key, value in settings.DATABASES['default'].items()
+            if key != 'TEST'
+        },
+    }
+
+
+def snapshot(target):
+    """Копия текущей базы в режиме журнала по умолчанию.
+
+    WAL записывается в сам файл, поэтому журнал возвращается в DELETE:
+    иначе и стандартный профиль работал бы в WAL.
+    """
+    source = connections['default'].settings_dict['NAME']
+    connections.close_all()
+    connection = sqlite3.connect(source)
+    connection.execute('PRAGMA journal_mode = DELETE')
+    connection.close()
+    shutil.copyfile(source, target)
+
+
+class Workload:
+    """Запросы, которые делают ленты, страница поста, add_comment и
+    голосование; id для них выбраны заранее."""
+
+    def __init__(self):
+        self.post_ids = list(Post.objects.values_list('pk', flat=True))
+        self.user_ids = list(User.objects.values_list('pk', flat=True))
+        self.choice_ids = list(Choice.objects.values_list('pk', flat=True))
+        self.feed = Post.objects.select_related(
+            'author', 'group').order_by('-pub_date', '-id')[
+            :settings.PAGINATOR_OBJECTS_PER_PAGE + 1].query.sql_with_params()
+        self.post = Post.objects.select_related(
+            'author', 'group').filter(pk=0).query.sql_with_params()[0]
+        comment = Comment._meta.db_table
+        post_counter = PostCounter._meta.db_table
+        self.add_comment = (
+            f'INSERT INTO {comment} '
+            f'(text, created, updated_at, post_id, author_id) '
+            f'VALUES (%s, %s, %s, %s, %s)',
+            f'UPDATE {post_counter} SET comments = comments + 1 '
+            f'WHERE post_id = %s',
+        )
+        self.vote = (
+            f'INSERT INTO {PendingVote._meta.db_table} (choice_id) '
+            f'VALUES (%s)')
+
+    def run(self, name, connection, rng):
+        if name == 'feed':
+            with connection.cursor() as cursor:
+                cursor.execute(*self.feed)
+                cursor.fetchall()
+        elif name == 'post':
+            with connection.cursor() as cursor:
+                cursor.execute(self.post, [rng.choice(self.post_ids)])
+                cursor.fetchall()
+        elif name == 'vote':
+            with connection.cursor() as cursor:
+                cursor.execute(self.vote, [rng.choice(self.choice_ids)])
+        else:
+            self.comment(connection, rng)
+
+    def comment(self, connection, rng):
+        # Как transaction.atomic: BEGIN в режиме из профиля.
+        post_id = rng.choice(self.post_ids)
+        created = connection.ops.adapt_datetimefield_value(timezone.now())
+        try:
+            connection.set_autocommit(
+                False, force_begin_transaction_with_broken_autocommit=True)
+            with connection.cursor() as cursor:
+                cursor.execute(self.add_comment[0], [
+                    'Замер', created, created, post_id,
+                    rng.choice(self.user_ids)])
+                cursor.execute(self.add_comment[1], [post_id])
+            connection.commit()
+        except DatabaseError:
+            connection.rollback()
+            raise
+        finally:
+            connection.set_autocommit(True)
+
+
+def _worker(handler, workload, names, stats, deadline, seed):
+    rng = random.Random(seed)
+    connection = handler['default']
+    while time.monotonic() < deadline:
+        name = rng.choice(names)
+        # Жизненный цикл запроса: close_old_connections в начале и конце.
+        connection.close_if_unusable_or_obsolete()
+        start = time.perf_counter()
+        try:
+            workload.run(name, connection, rng)
+            ok = True
+        except DatabaseError:
+            ok = False
+        stats.record(name, time.perf_counter() - start, ok)
+        connection.close_if_unusable_or_obsolete()
+    connection.close()
+
+
+def run(database, workload, readers, writers, duration, seed=0):
+    """readers потоков читают, writers пишут duration секунд."""
+    handler = ConnectionHandler({'default': database})
+    stats = Stats()
+    start = time.monotonic()
+    threads = [
+        threading.Thread(target=_worker, args=(
+            handler, workload, names, stats, start + duration,
+            seed + number))
+        for number, names in enumerate(
+            [READS] * readers + [WRITES] * writers)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return stats.summary(time.monotonic() - start)
+
+
+def compare(workdir, readers, writers, duration, seed=0):
+    """Профиль -> сводка по операциям; каждый на своей копии базы."""
+    workload = Workload()
+    results = {}
+    for name, database in profiles().items():
+        path = f'{workdir}/{name}.sqlite3'
+        snapshot(path)
+        results[name] = run(
+            {**database, 'NAME': path}, workload, readers, writers,
+            duration, seed)
+    return results
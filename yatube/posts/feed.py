@@ -0,0 +1,113 @@
+from django.conf import settings
+from django.db.models.expressions import RawSQL
+from django.utils.functional import cached_property
+
+from core.paginator import CursorPaginator
+
+from .models import FeedEntry, Follow, Post, PullAuthor
+
+BATCH_SIZE = 500
+# Авторов из PullAuthor в одном UNION ALL: SQLite ограничивает число
+# частей составного запроса (500) и параметров.
+PULL_CHUNK = 100
+
+
+def fan_out_post(post):
+    """Раскладывает новый пост по лентам подписчиков автора."""
+    if PullAuthor.objects.filter(author_id=post.author_id).exists():
+        return
+    limit = settings.FEED_FANOUT_LIMIT
+    followers = list(
+        Follow.objects.filter(author_id=post.author_id)
+        .values_list('user_id', flat=True)[:limit + 1])
+    if len(followers) > limit:
+        PullAuthor.objects.get_or_create(author_id=post.author_id)
+        return
+    FeedEntry.objects.bulk_create(
+        [FeedEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+         for user_id in followers],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту новой подписки уже опубликованные посты автора."""
+    if PullAuthor.objects.filter(author_id=author_id).exists():
+        return
+    posts = Post.objects.filter(author_id=author_id).values_list(
+        'id', 'pub_date')
+    FeedEntry.objects.bulk_create(
+        (FeedEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+         for post_id, pub_date in posts.iterator()),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def trim(user_id, author_id):
+    """Убирает из ленты посты автора после отписки."""
+    FeedEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id).delete()
+
+
+class FollowFeedPaginator(CursorPaginator):
+    """Лента подписок: входящие записи пользователя плюс посты авторов из
+    PullAuthor, которые читаются напрямую и сливаются по (pub_date, id)."""
+
+    def __init__(self, user, per_page):
+        super().__init__(
+            Post.objects.select_related('author', 'group'), per_page)
+        self.user = user
+        self.entries = FeedEntry.objects.filter(
+            user=user).select_related('post__author', 'post__group')
+
+    @cached_property
+    def pull_authors(self):
+        return list(Follow.objects.filter(
+            user=self.user,
+            author_id__in=PullAuthor.objects.values('author_id'),
+        ).values_list('author_id', flat=True))
+
+    def _fetch(self, values, forward, limit):
+        posts = {post.pk: post for post in self._fetch_pulled(
+            values, forward, limit)}
+        entries = self.entries
+        if values is not None:
+            entries = entries.filter(self._seek(
+                values, forward, fields=('pub_date', 'post_id')))
+        ordering = (
+            ('-pub_date', '-post_id') if forward else ('pub_date', 'post_id'))
+        for entry in entries.order_by(*ordering)[:limit]:
+            posts.setdefault(entry.post_id, entry.post)
+        return sorted(
+            posts.values(), key=self._position, reverse=forward)[:limit]
+
+    def _fetch_pulled(self, values, forward, limit):
+        """Посты авторов из PullAuthor одним запросом (на PULL_CHUNK
+        авторов).
+
+        Для author_id IN (...) SQLite сортирует все посты авторов, поэтому
+        запрос — UNION ALL подзапросов по автору: каждый читается из
+        индекса post_author_pub_date не дальше limit строк.
+        """
+        if not self.pull_authors:
+            return []
+        ordering = self.ordering if forward else self._reversed_ordering()
+        posts = []
+        for start in range(0, len(self.pull_authors), PULL_CHUNK):
+            parts, params = [], []
+            for author_id in self.pull_authors[start:start + PULL_CHUNK]:
+                queryset = Post.objects.filter(author_id=author_id)
+                if values is not None:
+                    queryset = queryset.filter(self._seek(values, forward))
+                sql, part_params = queryset.order_by(*ordering).values(
+                    'pk')[:limit].query.sql_with_params()
+                # В SQLite LIMIT в части UNION допустим только внутри
+                # подзапроса.
+                parts.append(f'SELECT * FROM ({sql})')
+                params.extend(part_params)
+            # Порядок наводит слияние в _fetch.
+            posts += self.queryset.filter(
+                pk__in=RawSQL(' UNION ALL '.join(parts), params)).order_by()
+        return posts
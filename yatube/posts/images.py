@@ -0,0 +1,80 @@
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import InMemoryUploadedFile
+from PIL import Image, ImageOps
+
+
+def _has_alpha(image):
+    return (image.mode in ('RGBA', 'LA')
+            or (image.mode == 'P' and 'transparency' in image.info))
+
+
+def _reencode(upload):
+    """Уменьшает и пересохраняет картинку: (буфер, расширение, тип,
+    размер). Анимацию оставляет как есть и возвращает None."""
+    image = Image.open(upload)
+    width, height = image.size
+    if width * height > settings.POST_IMAGE_MAX_PIXELS:
+        raise ValidationError(
+            'Слишком большая картинка: %(width)s×%(height)s',
+            code='image_too_large',
+            params={'width': width, 'height': height},
+        )
+    if getattr(image, 'is_animated', False):
+        upload.seek(0)
+        upload.image_size = image.size
+        return None
+    max_size = settings.POST_IMAGE_MAX_SIZE
+    image.draft('RGB', max_size)
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail(max_size, Image.LANCZOS)
+    icc_profile = image.info.get('icc_profile')
+    buffer = BytesIO()
+    if _has_alpha(image):
+        image = image.convert('RGBA')
+        image.save(buffer, 'PNG', optimize=True, icc_profile=icc_profile)
+        extension, content_type = 'png', 'image/png'
+    else:
+        image = image.convert('RGB')
+        image.save(
+            buffer, 'JPEG',
+            quality=settings.POST_IMAGE_QUALITY,
+            optimize=True,
+            progressive=True,
+            icc_profile=icc_profile,
+        )
+        extension, content_type = 'jpg', 'image/jpeg'
+    return buffer, extension, content_type, image.size
+
+
+def normalize_image(upload):
+    """Приводит загруженную картинку к виду, в котором её хранит сайт.
+
+    Картинка читается из файла загрузки, уменьшается до
+    POST_IMAGE_MAX_SIZE (JPEG сразу декодируется в уменьшенном масштабе),
+    поворачивается по EXIF и пересохраняется без метаданных: в JPEG или,
+    если есть прозрачность, в PNG. Анимации остаются как есть.
+    У результата есть image_size — итоговые (ширина, высота).
+    """
+    upload.seek(0)
+    try:
+        result = _reencode(upload)
+    except (OSError, Image.DecompressionBombError):
+        # verify() в ImageField проверяет только структуру файла:
+        # обрезанные данные обнаруживаются при декодировании.
+        raise ValidationError(
+            'Не удалось прочитать картинку: файл повреждён',
+            code='invalid_image',
+        )
+    if result is None:
+        return upload
+    buffer, extension, content_type, size = result
+    name = os.path.splitext(os.path.basename(upload.name))[0]
+    normalized = InMemoryUploadedFile(
+        buffer, 'image', f'{name}.{extension}', content_type,
+        buffer.tell(), None)
+    normalized.image_size = size
+    return normalized
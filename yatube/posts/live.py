@@ -0,0 +1,178 @@
+import asyncio
+import json
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from core import asyncdb
+from core.streaming import send_events
+
+from .models import Question
+from .votes import question_totals
+
+logger = logging.getLogger(__name__)
+
+HEADERS = (
+    ('Content-Type', 'text/event-stream'),
+    ('Cache-Control', 'no-cache'),
+    # nginx не должен копить события в буфере.
+    ('X-Accel-Buffering', 'no'),
+)
+
+
+def version_key(question_id):
+    return f'poll:{question_id}'
+
+
+def touch(question_id):
+    """Отмечает, что итоги опроса изменились."""
+    cache.set(version_key(question_id), time.time_ns(), None)
+
+
+def version(question_id):
+    return cache.get(version_key(question_id))
+
+
+def vote_counts(question_id):
+    return [entry['votes'] for entry in question_totals(question_id)]
+
+
+def delta(sent, totals):
+    """Изменившиеся итоги: номер варианта -> голосов; в первый раз все."""
+    return {
+        index: votes for index, votes in enumerate(totals)
+        if sent is None or index >= len(sent) or sent[index] != votes
+    }
+
+
+def event(data, name='totals'):
+    payload = json.dumps(data, separators=(',', ':'))
+    return f'event: {name}\ndata: {payload}\n\n'.encode()
+
+
+PING = b': ping\n\n'
+
+
+def follow(question_id):
+    """События SSE для одного зрителя без цикла событий: для WSGI.
+
+    Каждый зритель сам раз в 1 / POLL_STREAM_RATE секунд сверяет версию
+    итогов в кэше и перечитывает их, только если она сменилась. Зритель
+    занимает поток воркера, поэтому ответ длится POLL_STREAM_WSGI_TIMEOUT
+    секунд, а дальше браузер переподключается сам по retry.
+    """
+    interval = 1 / settings.POLL_STREAM_RATE
+    deadline = time.monotonic() + settings.POLL_STREAM_WSGI_TIMEOUT
+    pinged = time.monotonic()
+    sent = seen = None
+    yield f'retry: {settings.POLL_STREAM_RETRY_MS}\n\n'.encode()
+    while True:
+        current = version(question_id)
+        if sent is None or current != seen:
+            seen = current
+            totals = vote_counts(question_id)
+            changed = delta(sent, totals)
+            if changed:
+                sent = totals
+                pinged = time.monotonic()
+                yield event(changed)
+        if time.monotonic() - pinged >= settings.POLL_STREAM_HEARTBEAT:
+            pinged = time.monotonic()
+            yield PING
+        if time.monotonic() + interval > deadline:
+            return
+        time.sleep(interval)
+
+
+class PollFeed:
+    """Итоги одного опроса для всех его зрителей в процессе.
+
+    Пока есть зрители, одна задача раз в 1 / POLL_STREAM_RATE секунд
+    сверяет версию итогов и перечитывает их, только если она сменилась.
+    Все голоса между проверками уходят зрителям одним событием, а
+    медленный зритель получает разницу с тем, что видел последним.
+    """
+
+    def __init__(self, question_id):
+        self.question_id = question_id
+        self.totals = None
+        self.version = None
+        self.viewers = 0
+        self.changed = asyncio.Condition()
+        self.task = None
+
+    async def watch(self):
+        interval = 1 / settings.POLL_STREAM_RATE
+        while True:
+            try:
+                await self.check()
+            except Exception:
+                logger.exception(
+                    'Не удалось прочитать итоги опроса %s', self.question_id)
+            await asyncio.sleep(interval)
+
+    async def check(self):
+        current = await asyncdb.run(version, self.question_id)
+        if self.totals is not None and current == self.version:
+            return
+        # Сначала версия, потом итоги: голос между ними сменит версию
+        # ещё раз и не потеряется.
+        self.version = current
+        totals = await asyncdb.run(vote_counts, self.question_id)
+        if totals != self.totals:
+            self.totals = totals
+            async with self.changed:
+                self.changed.notify_all()
+
+    async def events(self):
+        sent = None
+        yield f'retry: {settings.POLL_STREAM_RETRY_MS}\n\n'.encode()
+        while True:
+            async with self.changed:
+                if self.totals is None or self.totals == sent:
+                    try:
+                        await asyncio.wait_for(
+                            self.changed.wait(),
+                            settings.POLL_STREAM_HEARTBEAT)
+                    except asyncio.TimeoutError:
+                        pass
+                totals = self.totals
+            if totals is None or totals == sent:
+                yield PING
+                continue
+            changed = delta(sent, totals)
+            sent = totals
+            yield event(changed)
+
+
+_feeds = {}
+
+
+async def subscribe(question_id):
+    """Асинхронный поток событий SSE опроса для одного зрителя."""
+    feed = _feeds.get(question_id)
+    if feed is None:
+        feed = _feeds[question_id] = PollFeed(question_id)
+        feed.task = asyncio.ensure_future(feed.watch())
+    feed.viewers += 1
+    try:
+        async for chunk in feed.events():
+            yield chunk
+    finally:
+        feed.viewers -= 1
+        if not feed.viewers:
+            del _feeds[question_id]
+            feed.task.cancel()
+
+
+async def stream(scope, receive, send, pk):
+    """Обработчик question_stream под ASGI: корутина на зрителя вместо
+    потока."""
+    exists = await asyncdb.run(Question.objects.filter(pk=pk).exists)
+    if not exists:
+        return False
+    await send_events(
+        subscribe(pk), receive, send, HEADERS,
+        timeout=settings.POLL_STREAM_TIMEOUT)
@@ -0,0 +1,379 @@
+import asyncio
+import http.client
+import os
+import random
+import re
+import signal
+import socket
+import threading
+import time
+from http import HTTPStatus
+from http.cookies import SimpleCookie
+from urllib.parse import unquote, urlencode
+
+from django.conf import settings
+from django.core.servers.basehttp import (ThreadedWSGIServer,
+                                          WSGIRequestHandler)
+from django.db import connections
+from django.test import Client
+from django.urls import reverse
+
+from core.metrics import BUCKETS, bucket_index, percentile
+
+from .models import Choice, Group, Post, User
+
+# Сценарий -> вес по умолчанию. Чтение лент анонимами преобладает.
+DEFAULT_MIX = {
+    'index': 30,
+    'group_posts': 10,
+    'profile': 10,
+    'post_detail': 15,
+    'follow_index': 15,
+    'add_comment': 12,
+    'vote': 8,
+}
+
+PERCENTILES = (50, 95, 99)
+
+
+def parse_mix(value):
+    """'index=5,vote=1' -> {'index': 5, 'vote': 1}."""
+    mix = {}
+    for part in filter(None, value.split(',')):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in DEFAULT_MIX:
+            raise ValueError(f'Неизвестный сценарий: {name}')
+        mix[name] = float(weight)
+    if not any(mix.values()):
+        raise ValueError('Нужен хотя бы один сценарий с весом больше нуля')
+    return mix
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class LoadServer(ThreadedWSGIServer):
+    request_queue_size = 128
+
+
+REASONS = {status.value: status.phrase for status in HTTPStatus}
+
+
+async def _asgi_connection(application, reader, writer):
+    """Один запрос HTTP/1.1 на соединение, как у клиентов Worker."""
+    try:
+        head = await reader.readuntil(b'\r\n\r\n')
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+        writer.close()
+        return
+    request_line, *lines = head.decode('latin-1').split('\r\n')
+    method, target, _ = request_line.split(' ', 2)
+    path, _, query = target.partition('?')
+    headers = []
+    for line in filter(None, lines):
+        name, _, value = line.partition(':')
+        headers.append((name.strip().lower().encode(), value.strip().encode()))
+    length = int(dict(headers).get(b'content-length', 0))
+    body = await reader.readexactly(length) if length else b''
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': method,
+        'scheme': 'http',
+        'path': unquote(path),
+        'raw_path': path.encode(),
+        'query_string': query.encode(),
+        'root_path': '',
+        'headers': headers,
+        'client': writer.get_extra_info('peername')[:2],
+        'server': writer.get_extra_info('sockname')[:2],
+        'extensions': {'http.response.zerocopysend': {}},
+    }
+    disconnected = asyncio.get_running_loop().create_future()
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        await disconnected
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status = message['status']
+            out = [f'HTTP/1.1 {status} {REASONS.get(status, "")}'.encode()]
+            out += [name + b': ' + value
+                    for name, value in message.get('headers', ())]
+            out.append(b'Connection: close')
+            writer.write(b'\r\n'.join(out) + b'\r\n\r\n')
+        elif message['type'] == 'http.response.body':
+            writer.write(message.get('body', b''))
+            await writer.drain()
+        elif message['type'] == 'http.response.zerocopysend':
+            # Файл уходит в сокет через sendfile, минуя память процесса.
+            await writer.drain()
+            file = message['file']
+            offset = message.get('offset')
+            await asyncio.get_running_loop().sendfile(
+                writer.transport, file,
+                file.tell() if offset is None else offset,
+                message.get('count'))
+
+    try:
+        await application(scope, receive, send)
+    finally:
+        disconnected.set_result(None)
+        writer.close()
+
+
+async def _serve_asgi(application, sock):
+    server = await asyncio.start_server(
+        lambda reader, writer: _asgi_connection(application, reader, writer),
+        sock=sock, backlog=LoadServer.request_queue_size)
+    async with server:
+        await server.serve_forever()
+
+
+class Servers:
+    """Процессы сервера, слушающие один адрес."""
+
+    def __init__(self, address, pids, close):
+        self.address = address
+        self.pids = pids
+        self._close = close
+
+    def rss(self):
+        """Сколько памяти (KiB) сейчас занимают все процессы."""
+        total = 0
+        for pid in self.pids:
+            with open(f'/proc/{pid}/status') as status:
+                for line in status:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1])
+        return total
+
+    def stop(self):
+        for pid in self.pids:
+            os.kill(pid, signal.SIGTERM)
+        for pid in self.pids:
+            os.waitpid(pid, 0)
+        self._close()
+
+
+def serve(application, processes, interface='wsgi'):
+    """Слушает порт и запускает processes форков сервера.
+
+    interface='wsgi' — WSGI-сервер Django с потоком на соединение,
+    'asgi' — сервер на asyncio, в котором application вызывается как
+    ASGI-приложение. Соединения с БД закрываются до fork, чтобы дочерние
+    процессы открыли свои.
+    """
+    server = LoadServer(('127.0.0.1', 0), QuietHandler)
+    if interface == 'wsgi':
+        server.set_app(application)
+
+        def child():
+            server.serve_forever()
+    else:
+        def child():
+            asyncio.run(_serve_asgi(application, server.socket))
+    connections.close_all()
+    children = []
+    for _ in range(processes):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, lambda *args: os._exit(0))
+            try:
+                child()
+            finally:
+                os._exit(0)
+        children.append(pid)
+    return Servers(server.server_address, children, server.server_close)
+
+
+def memory_per_connection(servers, count, settle=1.0):
+    """Прирост памяти сервера (KiB) на одно открытое соединение.
+
+    Держит соединения с недописанным запросом: WSGI тратит на каждое
+    поток, ASGI — корутину. Считается разница между count и 2 * count
+    соединениями: первые count занимают память, освобождённую после
+    прошлых запросов, и по ним прирост не виден.
+    """
+    sockets = []
+
+    def hold():
+        for _ in range(count):
+            sock = socket.create_connection(servers.address)
+            sock.sendall(b'GET / HTTP/1.1\r\nHost: loadtest\r\n')
+            sockets.append(sock)
+        time.sleep(settle)
+        return servers.rss()
+
+    try:
+        before = hold()
+        after = hold()
+    finally:
+        for sock in sockets:
+            sock.close()
+    return round((after - before) / count, 1)
+
+
+class Targets:
+    """Что запрашивать: id и сессии из базы, собранные до запуска."""
+
+    def __init__(self, sessions):
+        self.post_ids = list(Post.objects.values_list('pk', flat=True))
+        self.group_slugs = list(Group.objects.values_list('slug', flat=True))
+        self.usernames = list(User.objects.values_list('username', flat=True))
+        self.choices = list(Choice.objects.values_list('pk', 'question_id'))
+        readers = User.objects.order_by('-counter__following', 'pk')
+        self.sessions = []
+        for user in readers[:sessions]:
+            client = Client()
+            client.force_login(user)
+            self.sessions.append(
+                client.cookies[settings.SESSION_COOKIE_NAME].value)
+
+
+class Stats:
+    """Гистограммы задержек в микросекундах по сценариям."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.errors = {}
+
+    def record(self, name, seconds, ok):
+        with self.lock:
+            buckets = self.histograms.setdefault(name, [0] * BUCKETS)
+            buckets[bucket_index(seconds * 1e6)] += 1
+            if not ok:
+                self.errors[name] = self.errors.get(name, 0) + 1
+
+    def summary(self, elapsed):
+        result = {}
+        for name, buckets in sorted(self.histograms.items()):
+            count = sum(buckets)
+            result[name] = {
+                'requests': count,
+                'errors': self.errors.get(name, 0),
+                'rps': round(count / elapsed, 1),
+                **{
+                    f'p{percent}_ms': round(
+                        percentile(buckets, percent) / 1000, 2)
+                    for percent in PERCENTILES
+                },
+            }
+        return result
+
+
+class Worker(threading.Thread):
+    """Один виртуальный пользователь: выбирает сценарии по весам, пока
+    не истечёт время."""
+
+    csrf_pattern = re.compile(r'csrftoken=([^;]+)')
+
+    def __init__(self, address, targets, mix, stats, deadline, seed):
+        super().__init__(daemon=True)
+        self.address = address
+        self.targets = targets
+        self.stats = stats
+        self.deadline = deadline
+        self.rng = random.Random(seed)
+        self.names = list(mix)
+        self.weights = list(mix.values())
+        self.session = (
+            self.rng.choice(targets.sessions) if targets.sessions else None)
+        self.csrf = None
+
+    def request(self, method, path, body=None, logged_in=False):
+        connection = http.client.HTTPConnection(*self.address, timeout=30)
+        headers = {}
+        cookies = SimpleCookie()
+        if logged_in and self.session:
+            cookies[settings.SESSION_COOKIE_NAME] = self.session
+        if body is not None:
+            # Если страница с формой не выдала токен, запрос уходит без
+            # него и засчитывается как ошибка (403).
+            if self.csrf is not None:
+                cookies[settings.CSRF_COOKIE_NAME] = self.csrf
+                headers['X-CSRFToken'] = self.csrf
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+            body = urlencode(body)
+        if cookies:
+            headers['Cookie'] = '; '.join(
+                f'{key}={morsel.value}' for key, morsel in cookies.items())
+        try:
+            connection.request(method, path, body, headers)
+            response = connection.getresponse()
+            response.read()
+            match = self.csrf_pattern.search(
+                response.getheader('Set-Cookie') or '')
+            if match:
+                self.csrf = match.group(1)
+            return response.status
+        finally:
+            connection.close()
+
+    def scenario(self, name):
+        targets, rng = self.targets, self.rng
+        if name == 'index':
+            return self.request('GET', reverse('posts:index'))
+        if name == 'group_posts':
+            return self.request('GET', reverse(
+                'posts:group_posts',
+                kwargs={'slug': rng.choice(targets.group_slugs)}))
+        if name == 'profile':
+            return self.request('GET', reverse(
+                'posts:profile',
+                kwargs={'username': rng.choice(targets.usernames)}))
+        if name == 'post_detail':
+            return self.request('GET', reverse(
+                'posts:post_detail',
+                kwargs={'post_id': rng.choice(targets.post_ids)}))
+        if name == 'follow_index':
+            return self.request(
+                'GET', reverse('posts:follow_index'), logged_in=True)
+        if self.csrf is None:
+            # Токен выдаёт любая страница с формой.
+            self.request('GET', reverse('users:login'))
+        if name == 'add_comment':
+            return self.request('POST', reverse(
+                'posts:add_comment',
+                kwargs={'post_id': rng.choice(targets.post_ids)}),
+                {'text': 'Нагрузочный комментарий'}, logged_in=True)
+        choice_id, question_id = rng.choice(targets.choices)
+        return self.request('POST', reverse(
+            'posts:question', kwargs={'pk': question_id}),
+            {'exampleRadios': choice_id})
+
+    def run(self):
+        while time.monotonic() < self.deadline:
+            name = self.rng.choices(self.names, self.weights)[0]
+            start = time.perf_counter()
+            try:
+                status = self.scenario(name)
+            except (OSError, http.client.HTTPException):
+                status = None
+            self.stats.record(
+                name, time.perf_counter() - start,
+                status is not None and status < 400)
+
+
+def run(address, targets, mix, clients, duration, seed=0):
+    """Гоняет clients потоков duration секунд, возвращает сводку."""
+    stats = Stats()
+    start = time.monotonic()
+    workers = [
+        Worker(address, targets, mix, stats, start + duration, seed + number)
+        for number in range(clients)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return stats.summary(time.monotonic() - start)
@@ -0,0 +1,68 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import dataset
+from posts.benchmark import (compare_api, find_regressions, scratch_site,
+                             time_views)
+
+
+class Command(BaseCommand):
+    help = ('Заполняет временную базу воспроизводимыми данными и замеряет '
+            'все представления posts, users и API; сравнивает API со '
+            'страницами')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0)
+        for name, default in dataset.DEFAULTS.items():
+            parser.add_argument(
+                f'--{name}', type=int, default=default,
+                help=f'Сколько создать: {name} (по умолчанию {default})')
+        parser.add_argument(
+            '--iterations', type=int, default=20,
+            help='Сколько раз открыть каждое представление')
+        parser.add_argument(
+            '--output', help='Записать результаты в JSON-файл')
+        parser.add_argument(
+            '--baseline',
+            help='JSON прошлого запуска; при регрессии команда падает')
+        parser.add_argument(
+            '--threshold', type=float, default=0.25,
+            help='Допустимый относительный рост медианы времени')
+        parser.add_argument(
+            '--min-delta', type=float, default=1.0,
+            help='Рост медианы меньше стольких мс регрессией не считается')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as file:
+                baseline = json.load(file)
+        sizes = {name: options[name] for name in dataset.DEFAULTS}
+        results = {
+            'seed': options['seed'],
+            'dataset': sizes,
+            'iterations': options['iterations'],
+            'views': self.run(options['seed'], sizes, options['iterations']),
+        }
+        results['api_vs_html'] = compare_api(results['views'])
+        report = json.dumps(results, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(report + '\n')
+        self.stdout.write(report)
+        if baseline is None:
+            return
+        regressions = find_regressions(
+            results['views'], baseline['views'],
+            options['threshold'], options['min_delta'])
+        if regressions:
+            raise CommandError(
+                'Регрессии относительно базового замера:\n'
+                + '\n'.join(regressions))
+        self.stderr.write('Регрессий нет')
+
+    def run(self, seed, sizes, iterations):
+        with scratch_site():
+            dataset.generate(seed, **sizes)
+            return time_views(iterations)
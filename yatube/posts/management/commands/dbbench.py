@@ -0,0 +1,55 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from posts import dataset, dbbench
+from posts.benchmark import scratch_site
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает пропускную способность SQLite при одновременных '
+            'чтении и записи: стандартный бэкенд Django против профиля '
+            'из DATABASES')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--writers', type=int, default=4)
+        parser.add_argument(
+            '--duration', type=float, default=5,
+            help='Секунд на каждый профиль')
+        parser.add_argument('--seed', type=int, default=0)
+        for name, default in dataset.DEFAULTS.items():
+            parser.add_argument(
+                f'--{name}', type=int, default=default,
+                help=f'Сколько создать: {name} (по умолчанию {default})')
+        parser.add_argument('--json', action='store_true')
+
+    def handle(self, *args, **options):
+        sizes = {name: options[name] for name in dataset.DEFAULTS}
+        with scratch_site(shared_file=True) as workdir:
+            dataset.generate(options['seed'], **sizes)
+            results = dbbench.compare(
+                workdir, options['readers'], options['writers'],
+                options['duration'], options['seed'])
+        if options['json']:
+            self.stdout.write(
+                json.dumps(results, ensure_ascii=False, indent=2))
+            return
+        self.stdout.write(
+            f'{"операция":<10} {"профиль":<12} {"запросов":>9} '
+            f'{"ошибок":>7} {"в сек.":>8} {"p50 мс":>8} {"p99 мс":>8}')
+        for operation in dbbench.READS + dbbench.WRITES:
+            for profile, summary in results.items():
+                row = summary.get(operation)
+                if row is None:
+                    continue
+                self.stdout.write(
+                    f'{operation:<10} {profile:<12} {row["requests"]:>9} '
+                    f'{row["errors"]:>7} {row["rps"]:>8} '
+                    f'{row["p50_ms"]:>8} {row["p99_ms"]:>8}')
+        for profile, summary in results.items():
+            total = sum(row['rps'] for row in summary.values())
+            errors = sum(row['errors'] for row in summary.values())
+            self.stdout.write(
+                f'{profile}: {total:.1f} операций в секунду, '
+                f'ошибок {errors}')
@@ -0,0 +1,82 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+
+from core.query_plan import audit, capture
+from posts import dataset
+from posts import urls as posts_urls
+from posts.benchmark import STATE_CHANGING, reader, scratch_site, view_urls
+
+# Таблицы из нескольких строк, которые дешевле прочитать целиком.
+SMALL_TABLES = ('posts_group', 'posts_question')
+
+
+class Command(BaseCommand):
+    help = ('Печатает EXPLAIN QUERY PLAN каждого запроса представлений '
+            'posts и отмечает полные проходы и временные сортировки')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0)
+        for name, default in dataset.DEFAULTS.items():
+            parser.add_argument(
+                f'--{name}', type=int, default=default,
+                help=f'Сколько создать: {name} (по умолчанию {default})')
+        parser.add_argument(
+            '--view', action='append', dest='views',
+            help='Только это представление, например posts:index')
+        parser.add_argument(
+            '--allow', action='append', default=list(SMALL_TABLES),
+            help='Таблица, которую можно читать целиком')
+        parser.add_argument(
+            '--quiet', action='store_true',
+            help='Печатать только запросы с проблемами')
+        parser.add_argument(
+            '--fail', action='store_true',
+            help='Завершиться с ошибкой, если есть проблемы')
+
+    def handle(self, *args, **options):
+        sizes = {name: options[name] for name in dataset.DEFAULTS}
+        with scratch_site():
+            dataset.generate(options['seed'], **sizes)
+            flagged = self.explain_views(options)
+        if flagged:
+            message = f'Запросов с проблемами: {flagged}'
+            if options['fail']:
+                raise CommandError(message)
+            self.stderr.write(message)
+        else:
+            self.stderr.write('Полных проходов и сортировок нет')
+
+    def explain_views(self, options):
+        user = reader()
+        urls = view_urls((('posts', posts_urls),))
+        if options['views']:
+            unknown = set(options['views']) - set(urls)
+            if unknown:
+                raise CommandError(
+                    'Нет представлений: ' + ', '.join(sorted(unknown)))
+            urls = {name: urls[name] for name in options['views']}
+        else:
+            urls = {name: url for name, url in urls.items()
+                    if name not in STATE_CHANGING}
+        flagged = 0
+        for name, url in urls.items():
+            # Холодный кэш: иначе часть запросов представления не видна.
+            cache.clear()
+            status, statements = capture(url, user)
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f'{name} {url} -> {status}, запросов: {len(statements)}'))
+            for sql, params in statements:
+                result = audit(sql, params, options['allow'])
+                if result is None:
+                    continue
+                plan, problems = result
+                if problems:
+                    flagged += 1
+                elif options['quiet']:
+                    continue
+                self.stdout.write(f'  {sql}')
+                for line in plan:
+                    self.stdout.write(f'    {line}')
+                for problem in problems:
+                    self.stdout.write(self.style.WARNING(f'    ! {problem}'))
+        return flagged
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts.votes import flush_votes
+
+
+class Command(BaseCommand):
+    help = 'Переносит накопленные голоса опросов в Choice.votes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=0,
+            help='Повторять каждые N секунд вместо однократного запуска',
+        )
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        while True:
+            flushed = flush_votes()
+            self.stdout.write(f'Перенесено голосов: {flushed}')
+            if not interval:
+                return
+            time.sleep(interval)
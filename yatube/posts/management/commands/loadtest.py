@@ -0,0 +1,131 @@
+import json
+import os
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+
+from core import metrics
+from posts import dataset, loadtest
+from posts.benchmark import scratch_site
+
+
+class Command(BaseCommand):
+    help = ('Поднимает приложение на временной базе SQLite в нескольких '
+            'процессах и нагружает его смесью запросов из многих потоков; '
+            'сравнивает WSGI и ASGI')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=os.cpu_count(),
+            help='Процессов сервера, в каждом поток на запрос')
+        parser.add_argument(
+            '--clients', type=int, default=32,
+            help='Потоков, одновременно шлющих запросы')
+        parser.add_argument(
+            '--duration', type=float, default=15,
+            help='Длительность нагрузки в секундах')
+        parser.add_argument(
+            '--mix', type=loadtest.parse_mix,
+            default=loadtest.DEFAULT_MIX,
+            help='Веса сценариев, например index=5,follow_index=2,vote=1; '
+                 f'сценарии: {", ".join(loadtest.DEFAULT_MIX)}')
+        parser.add_argument(
+            '--sessions', type=int, default=20,
+            help='Сколько пользователей входят на сайт')
+        parser.add_argument('--seed', type=int, default=0)
+        for name, default in dataset.DEFAULTS.items():
+            parser.add_argument(f'--{name}', type=int, default=default)
+        parser.add_argument(
+            '--interface', choices=('wsgi', 'asgi', 'both'), default='wsgi',
+            help='Через какой интерфейс обслуживать запросы; both — '
+                 'по очереди оба на одной базе и сравнить')
+        parser.add_argument(
+            '--hold', type=int, default=1000,
+            help='По сколько соединений открывать для замера памяти на '
+                 'соединение (дважды); 0 — не замерять')
+        parser.add_argument(
+            '--json', action='store_true',
+            help='Вывести результаты и метрики сервера в JSON')
+
+    def handle(self, *args, **options):
+        if not hasattr(os, 'fork'):
+            raise CommandError('Нужна ОС с fork()')
+        # Файл, а не память: базу должны видеть все процессы сервера.
+        with scratch_site(shared_file=True):
+            self.load(options)
+
+    def load(self, options):
+        dataset.generate(options['seed'], **{
+            name: options[name] for name in dataset.DEFAULTS})
+        targets = loadtest.Targets(options['sessions'])
+        interfaces = (
+            ('wsgi', 'asgi') if options['interface'] == 'both'
+            else (options['interface'],))
+        results = {
+            interface: self.run(interface, targets, options)
+            for interface in interfaces
+        }
+        if options['json']:
+            if len(results) == 1:
+                results, = results.values()
+            self.stdout.write(
+                json.dumps(results, ensure_ascii=False, indent=2))
+            return
+        for interface, result in results.items():
+            self.report(interface, result)
+        if len(results) > 1:
+            self.stdout.write('Сравнение:')
+            for interface, result in results.items():
+                total = sum(row['rps'] for row in result['client'].values())
+                memory = result['memory_kib_per_connection']
+                self.stdout.write(
+                    f'  {interface}: {total:.1f} запросов в секунду, '
+                    f'{"—" if memory is None else memory} KiB на соединение')
+
+    def run(self, interface, targets, options):
+        # Оба прогона начинают с пустого кэша и метрик.
+        cache.clear()
+        metrics.reset()
+        if interface == 'wsgi':
+            from yatube.wsgi import application
+        else:
+            from yatube.asgi import application
+        servers = loadtest.serve(
+            application, options['processes'], interface)
+        try:
+            client = loadtest.run(
+                servers.address, targets, options['mix'],
+                options['clients'], options['duration'], options['seed'])
+        finally:
+            servers.stop()
+        memory = None
+        if options['hold']:
+            # Отдельный процесс: после нагрузки память ещё освобождается
+            # и замер уходит в шум.
+            servers = loadtest.serve(application, 1, interface)
+            try:
+                memory = loadtest.memory_per_connection(
+                    servers, options['hold'])
+            finally:
+                servers.stop()
+        return {
+            'client': client,
+            'server': metrics.summary(),
+            'memory_kib_per_connection': memory,
+        }
+
+    def report(self, interface, result):
+        self.stdout.write(f'{interface.upper()}')
+        self.stdout.write(
+            f'{"сценарий":<14} {"запросов":>8} {"ошибок":>7} {"в сек":>7} '
+            f'{"p50 мс":>8} {"p95 мс":>8} {"p99 мс":>8}')
+        for name, row in result['client'].items():
+            self.stdout.write(
+                f'{name:<14} {row["requests"]:>8} {row["errors"]:>7} '
+                f'{row["rps"]:>7} {row["p50_ms"]:>8} {row["p95_ms"]:>8} '
+                f'{row["p99_ms"]:>8}')
+        total = sum(row['rps'] for row in result['client'].values())
+        self.stdout.write(f'Всего: {total:.1f} запросов в секунду')
+        memory = result['memory_kib_per_connection']
+        if memory is not None:
+            self.stdout.write(f'Память на соединение: {memory} KiB')
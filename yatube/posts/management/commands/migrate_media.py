@@ -0,0 +1,45 @@
+import re
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from posts.models import Post
+
+CONTENT_NAME = re.compile(r'/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.\w+$')
+
+
+class Command(BaseCommand):
+    help = ('Переносит картинки постов в хранилище по содержимому, '
+            'склеивая одинаковые файлы')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--keep-originals',
+            action='store_true',
+            help='Не удалять старые файлы после переноса',
+        )
+
+    def handle(self, *args, **options):
+        storage = Post._meta.get_field('image').storage
+        legacy = FileSystemStorage(location=storage.location)
+        moved = {}
+        posts = Post.objects.exclude(image='').values_list('pk', 'image')
+        for pk, name in posts.iterator():
+            if CONTENT_NAME.search('/' + name):
+                continue
+            if not legacy.exists(name):
+                self.stderr.write(f'Нет файла {name} для поста {pk}')
+                continue
+            with legacy.open(name) as source:
+                new_name = storage.save(name, File(source))
+            Post.objects.filter(pk=pk).update(
+                image=new_name, updated_at=timezone.now())
+            moved.setdefault(name, new_name)
+        if not options['keep_originals']:
+            for name in moved:
+                legacy.delete(name)
+        self.stdout.write(
+            f'Перенесено файлов: {len(moved)}, '
+            f'уникальных: {len(set(moved.values()))}')
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.counters import rebuild_post_counters, rebuild_user_counters
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики постов, комментариев и подписок'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать, сколько счётчиков разошлось',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        with transaction.atomic():
+            users = rebuild_user_counters(dry_run=dry_run)
+            posts = rebuild_post_counters(dry_run=dry_run)
+        verb = 'Разошлось' if dry_run else 'Исправлено'
+        self.stdout.write(
+            f'{verb} счётчиков: пользователей {users}, постов {posts}')
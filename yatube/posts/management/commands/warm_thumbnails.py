@@ -0,0 +1,56 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts.models import Post
+from posts.thumbnails import generate
+
+
+def _generate(name):
+    try:
+        generate(name)
+    except Exception as error:
+        return name, error
+    return name, None
+
+
+def _generate_in_worker(name):
+    try:
+        return _generate(name)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Строит миниатюры для всех картинок постов параллельно'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count(),
+            help='Число процессов; 1 — без пула, в текущем процессе',
+        )
+
+    def handle(self, *args, **options):
+        names = list(
+            Post.objects.exclude(image='').order_by()
+            .values_list('image', flat=True).distinct())
+        workers = max(options['workers'] or 1, 1)
+        if workers == 1:
+            results = [_generate(name) for name in names]
+        else:
+            # Дочерние процессы не должны наследовать соединения с БД.
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(
+                    pool.map(_generate_in_worker, names, chunksize=16))
+        failed = 0
+        for name, error in results:
+            if error is not None:
+                failed += 1
+                self.stderr.write(f'{name}: {error}')
+        self.stdout.write(
+            f'Готово: {len(names) - failed} из {len(names)} картинок')
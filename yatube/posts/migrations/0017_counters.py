@@ -0,0 +1,64 @@
+# Generated by Django 3.2.25 on 2026-10-18 05:36
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count
+
+
+def fill_counters(apps, schema_editor):
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    Post = apps.get_model('posts', 'Post')
+    UserCounter = apps.get_model('posts', 'UserCounter')
+    PostCounter = apps.get_model('posts', 'PostCounter')
+    user_counters = {
+        pk: UserCounter(user_id=pk) for pk in User.objects.values_list(
+            'pk', flat=True)
+    }
+    relations = {
+        'posts': 'posts',
+        'comments': 'comments',
+        'followers': 'following',
+        'following': 'follower',
+    }
+    for name, relation in relations.items():
+        counts = User.objects.annotate(
+            value=Count(relation)).values_list('pk', 'value')
+        for pk, value in counts:
+            setattr(user_counters[pk], name, value)
+    UserCounter.objects.bulk_create(user_counters.values(), batch_size=500)
+    PostCounter.objects.bulk_create(
+        (PostCounter(post_id=pk, comments=value)
+         for pk, value in Post.objects.order_by().annotate(
+             value=Count('comments')).values_list('pk', 'value')),
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0016_feed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostCounter',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='counter', serialize=False, to='posts.post')),
+                ('comments', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='UserCounter',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='counter', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('posts', models.PositiveIntegerField(default=0)),
+                ('comments', models.PositiveIntegerField(default=0)),
+                ('followers', models.PositiveIntegerField(default=0)),
+                ('following', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 3.2.25 on 2026-10-18 05:46
+
+from django.db import migrations, models
+from PIL import Image
+
+
+def fill_image_size(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    storage = Post._meta.get_field('image').storage
+    posts = Post.objects.exclude(image='').only('pk', 'image')
+    for post in posts.iterator():
+        try:
+            with storage.open(post.image.name) as file:
+                # Размер берётся из заголовка, пиксели не декодируются.
+                width, height = Image.open(file).size
+        except (OSError, SyntaxError):
+            continue
+        Post.objects.filter(pk=post.pk).update(
+            image_width=width, image_height=height)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0019_alter_post_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='image_height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='image_width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(fill_image_size, migrations.RunPython.noop),
+    ]
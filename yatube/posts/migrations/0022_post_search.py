@@ -0,0 +1,85 @@
+from functools import partial
+
+from django.db import migrations
+
+# Индекс хранит свою копию текста поста и его группы. Его обновляют
+# триггеры, поэтому в синхроне и save(), и update(), и bulk_create().
+# SQL записан здесь, а не берётся из posts.search: миграция не должна
+# меняться вместе с кодом приложения.
+TABLE_SQL = (
+    """CREATE VIRTUAL TABLE posts_search USING fts5(
+        text, group_title, group_description,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )""",
+    # Совпадение в тексте важнее, чем в названии группы, а описание
+    # группы — самое слабое.
+    """INSERT INTO posts_search(posts_search, rank)
+        VALUES ('rank', 'bm25(10.0, 3.0, 1.0)')""",
+)
+
+TRIGGER_SQL = (
+    """CREATE TRIGGER posts_search_post_insert AFTER INSERT ON posts_post
+    BEGIN
+        INSERT INTO posts_search(rowid, text, group_title, group_description)
+        SELECT new.id, new.text, g.title, g.description
+        FROM (SELECT 1) LEFT JOIN posts_group g ON g.id = new.group_id;
+    END""",
+    """CREATE TRIGGER posts_search_post_update
+    AFTER UPDATE OF text, group_id ON posts_post
+    BEGIN
+        DELETE FROM posts_search WHERE rowid = old.id;
+        INSERT INTO posts_search(rowid, text, group_title, group_description)
+        SELECT new.id, new.text, g.title, g.description
+        FROM (SELECT 1) LEFT JOIN posts_group g ON g.id = new.group_id;
+    END""",
+    """CREATE TRIGGER posts_search_post_delete AFTER DELETE ON posts_post
+    BEGIN
+        DELETE FROM posts_search WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER posts_search_group_update
+    AFTER UPDATE OF title, description ON posts_group
+    BEGIN
+        UPDATE posts_search
+        SET group_title = new.title, group_description = new.description
+        WHERE rowid IN (SELECT id FROM posts_post WHERE group_id = new.id);
+    END""",
+)
+
+FILL_SQL = (
+    """INSERT INTO posts_search(rowid, text, group_title, group_description)
+        SELECT p.id, p.text, g.title, g.description
+        FROM posts_post p LEFT JOIN posts_group g ON g.id = p.group_id""",
+    "INSERT INTO posts_search(posts_search) VALUES ('optimize')",
+)
+
+DROP_TRIGGER_SQL = (
+    'DROP TRIGGER IF EXISTS posts_search_group_update',
+    'DROP TRIGGER IF EXISTS posts_search_post_delete',
+    'DROP TRIGGER IF EXISTS posts_search_post_update',
+    'DROP TRIGGER IF EXISTS posts_search_post_insert',
+)
+
+DROP_SQL = DROP_TRIGGER_SQL + ('DROP TABLE IF EXISTS posts_search',)
+
+
+def execute(statements, apps, schema_editor):
+    # FTS5 есть только в SQLite.
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0021_comment_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            partial(execute, TABLE_SQL + TRIGGER_SQL + FILL_SQL),
+            partial(execute, DROP_SQL)),
+    ]
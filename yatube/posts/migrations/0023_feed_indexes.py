@@ -0,0 +1,50 @@
+from functools import partial
+from importlib import import_module
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+# SQLite пересоздаёт posts_post при этих изменениях: триггеры поиска,
+# которые ссылаются на неё, снимаются до и ставятся после. Их SQL — из
+# 0022_post_search, он уже не меняется, в отличие от posts.search.
+post_search = import_module('posts.migrations.0022_post_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0022_post_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            partial(post_search.execute, post_search.DROP_TRIGGER_SQL),
+            partial(post_search.execute, post_search.TRIGGER_SQL)),
+        migrations.AlterField(
+            model_name='post',
+            name='author',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='posts', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='group',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='posts', to='posts.group'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-pub_date', '-id'], name='post_pub_date'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['group', '-pub_date', '-id'], name='post_group_pub_date'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['author', '-pub_date', '-id'], name='post_author_pub_date'),
+        ),
+        migrations.RunPython(
+            partial(post_search.execute, post_search.TRIGGER_SQL),
+            partial(post_search.execute, post_search.DROP_TRIGGER_SQL)),
+    ]
@@ -0,0 +1,45 @@
+from functools import partial
+from importlib import import_module
+
+from django.db import migrations, models
+import django.utils.timezone
+
+# SQLite пересоздаёт posts_post при этих изменениях: триггеры поиска,
+# которые ссылаются на неё, снимаются до и ставятся после. Их SQL — из
+# 0022_post_search, он уже не меняется, в отличие от posts.search.
+post_search = import_module('posts.migrations.0022_post_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0023_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            partial(post_search.execute, post_search.DROP_TRIGGER_SQL),
+            partial(post_search.execute, post_search.TRIGGER_SQL)),
+        migrations.AddField(
+            model_name='post',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        # Старые записи не менялись с публикации.
+        migrations.RunSQL(
+            'UPDATE posts_post SET updated_at = pub_date',
+            migrations.RunSQL.noop),
+        migrations.RunSQL(
+            'UPDATE posts_comment SET updated_at = created',
+            migrations.RunSQL.noop),
+        migrations.RunPython(
+            partial(post_search.execute, post_search.TRIGGER_SQL),
+            partial(post_search.execute, post_search.DROP_TRIGGER_SQL)),
+    ]
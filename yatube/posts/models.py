@@ -4,6 +4,8 @@ from django.contrib import admin
 import datetime
 from django.utils import timezone
 
+from core.storage import content_storage
+
 User = get_user_model()
 
 
@@ -19,21 +21,43 @@ class Group(models.Model):
 class Post(models.Model):
     text = models.TextField()
     pub_date = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Отдельные индексы по group и author не нужны: их заменяют
+    # составные индексы лент, которые начинаются с этих полей.
     group = models.ForeignKey(Group, on_delete=models.SET_NULL,
-                              blank=True, null=True, related_name='posts')
+                              blank=True, null=True, related_name='posts',
+                              db_index=False)
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
         related_name='posts',
+        db_index=False,
     )
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=content_storage,
         blank=True
     )
+    image_width = models.PositiveIntegerField(
+        null=True, blank=True, editable=False)
+    image_height = models.PositiveIntegerField(
+        null=True, blank=True, editable=False)
 
     class Meta:
         ordering = ['-pub_date']
+        # Индексы повторяют порядок лент (-pub_date, -id), поэтому
+        # страница читается из индекса без сортировки.
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'], name='post_pub_date'),
+            models.Index(
+                fields=['group', '-pub_date', '-id'],
+                name='post_group_pub_date'),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='post_author_pub_date'),
+        ]
 
     def __str__(self):
         return self.text[:15]
@@ -42,6 +66,7 @@ class Post(models.Model):
 class Comment(models.Model):
     text = models.TextField()
     created = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     post = models.ForeignKey(
         Post,
         on_delete=models.CASCADE,
@@ -51,6 +76,13 @@ class Comment(models.Model):
         on_delete=models.CASCADE,
         related_name='comments')
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['post', 'created', 'id'],
+                name='comment_post_created'),
+        ]
+
 
 class Follow(models.Model):
     user = models.ForeignKey(
@@ -71,6 +103,67 @@ class Follow(models.Model):
         ]
 
 
+class FeedEntry(models.Model):
+    """Запись во входящей ленте подписок пользователя."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+    )
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'], name='unique_feed_entry')
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='feed_entry_user_pub_date'),
+        ]
+
+
+class PullAuthor(models.Model):
+    """Автор, чьи посты не раскладываются по лентам: слишком много
+    подписчиков. Подписчики дочитывают его посты при открытии ленты."""
+    author = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        related_name='pull_author',
+    )
+
+
+class UserCounter(models.Model):
+    """Счётчики пользователя, которые обновляются вместе с записями."""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='counter',
+    )
+    posts = models.PositiveIntegerField(default=0)
+    comments = models.PositiveIntegerField(default=0)
+    followers = models.PositiveIntegerField(default=0)
+    following = models.PositiveIntegerField(default=0)
+
+
+class PostCounter(models.Model):
+    """Счётчики поста."""
+    post = models.OneToOneField(
+        Post,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='counter',
+    )
+    comments = models.PositiveIntegerField(default=0)
+
+
 class Question(models.Model):
     question_text = models.CharField(max_length=200)
     pub_date = models.DateTimeField('date published')
@@ -89,3 +182,16 @@ class Choice(models.Model):
     question = models.ForeignKey(Question, on_delete=models.CASCADE)
     choice_text = models.CharField(max_length=200)
     votes = models.IntegerField(default=0)
+
+
+class PendingVote(models.Model):
+    """Голос, ещё не перенесённый в Choice.votes.
+
+    Голоса только дописываются в эту таблицу, а flush_votes периодически
+    переносит их суммы в Choice одним UPDATE на вариант ответа.
+    """
+    choice = models.ForeignKey(
+        Choice,
+        on_delete=models.CASCADE,
+        related_name='pending_votes',
+    )
@@ -0,0 +1,120 @@
+import re
+
+from django.db import connections, models, router
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from core.paginator import CursorPaginator
+
+from .models import Post
+
+TABLE = 'posts_search'
+MAX_WORDS = 8
+SNIPPET_TOKENS = 40
+# Метки совпадений, которых нет в тексте: их вставляет FTS5, а в HTML
+# они превращаются в <mark> уже после экранирования текста.
+MARK_START = '\x02'
+MARK_END = '\x03'
+WORD = re.compile(r'\w+')
+
+# Таблицу posts_search и триггеры, которые держат её в синхроне с posts_post
+# и posts_group, создаёт миграция 0022_post_search. Миграции, после
+# которых SQLite пересоздаёт posts_post, снимают триггеры до и ставят
+# после (см. 0023_feed_indexes).
+
+
+def rebuild(cursor):
+    """Заново заполняет индекс из posts_post и posts_group."""
+    cursor.execute(f'DELETE FROM {TABLE}')
+    cursor.execute(
+        f"""INSERT INTO {TABLE}(rowid, text, group_title, group_description)
+        SELECT p.id, p.text, g.title, g.description
+        FROM posts_post p LEFT JOIN posts_group g ON g.id = p.group_id""")
+    cursor.execute(f"INSERT INTO {TABLE}({TABLE}) VALUES ('optimize')")
+    cursor.execute(f'SELECT count(*) FROM {TABLE}')
+    return cursor.fetchone()[0]
+
+
+def match_expression(query):
+    """Строка из формы -> выражение MATCH.
+
+    Операторы FTS5 пользователю недоступны: из запроса берутся только
+    слова, каждое ищется как начало слова, и все они обязательны.
+    """
+    words = WORD.findall(query.lower())[:MAX_WORDS]
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def highlight(fragment):
+    if fragment is None:
+        return ''
+    return mark_safe(
+        escape(fragment)
+        .replace(MARK_START, '<mark>')
+        .replace(MARK_END, '</mark>'))
+
+
+class SearchPaginator(CursorPaginator):
+    """Курсор по (rank, id) поверх индекса FTS5.
+
+    У постов страницы есть rank, search_snippet — фрагмент текста с
+    подсвеченными совпадениями — и search_group с подсветкой в названии
+    группы.
+    """
+
+    def __init__(self, query, per_page):
+        self.match = match_expression(query)
+        super().__init__(
+            Post.objects.select_related('author', 'group'), per_page,
+            ordering=('rank', 'id'))
+
+    def cursor_field(self, name):
+        if name == 'rank':
+            return models.FloatField()
+        return super().cursor_field(name)
+
+    def _fetch(self, values, forward, limit):
+        if not self.match:
+            return []
+        params = [
+            MARK_START, MARK_END, SNIPPET_TOKENS,
+            MARK_START, MARK_END, self.match,
+        ]
+        seek = ''
+        if values is not None:
+            rank, pk = values
+            operator = '>' if forward else '<'
+            seek = (f'AND (rank {operator} %s '
+                    f'OR (rank = %s AND rowid {operator} %s))')
+            params += [rank, rank, pk]
+        direction = '' if forward else 'DESC'
+        # Индекс и посты читаются из одной базы: под read_replica это
+        # реплика, и посты, которых в ней ещё нет, не теряются.
+        alias = router.db_for_read(Post)
+        with connections[alias].cursor() as cursor:
+            cursor.execute(
+                f"""SELECT rowid, rank,
+                    snippet({TABLE}, 0, %s, %s, '…', %s),
+                    highlight({TABLE}, 1, %s, %s)
+                FROM {TABLE} WHERE {TABLE} MATCH %s {seek}
+                ORDER BY rank {direction}, rowid {direction} LIMIT %s""",
+                params + [limit])
+            rows = cursor.fetchall()
+        posts = self.queryset.using(alias).in_bulk([row[0] for row in rows])
+        found = []
+        for pk, rank, snippet, group_title in rows:
+            post = posts.get(pk)
+            if post is None:
+                continue
+            post.rank = rank
+            post.search_snippet = highlight(snippet)
+            post.search_group = highlight(group_title)
+            found.append(post)
+        return found
+
+
+def matching_ids(query):
+    """Подзапрос id постов, подходящих под запрос, для filter(pk__in=...)."""
+    return models.expressions.RawSQL(
+        f'SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s',
+        [match_expression(query)])
@@ -1,8 +1,112 @@
 from rest_framework import serializers
-from .models import Choice
+from .models import Choice, Comment, Group, Post, Question
 
 
 class ChoiceSerializer(serializers.ModelSerializer):
     class Meta:
         model = Choice
         fields = ('choice_text', 'votes')
+
+
+class SparseFieldsMixin:
+    """fields=(...) в конструкторе оставляет только эти поля."""
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class PostSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    author = serializers.SlugRelatedField(
+        slug_field='username', read_only=True)
+    group = serializers.SlugRelatedField(slug_field='slug', read_only=True)
+
+    class Meta:
+        model = Post
+        fields = ('id', 'text', 'pub_date', 'author', 'group', 'image',
+                  'image_width', 'image_height')
+
+
+class CommentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    author = serializers.SlugRelatedField(
+        slug_field='username', read_only=True)
+
+    class Meta:
+        model = Comment
+        fields = ('id', 'post', 'text', 'created', 'author')
+
+
+class GroupSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Group
+        fields = ('id', 'slug', 'title', 'description')
+
+
+class QuestionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Question
+        fields = ('id', 'question_text', 'pub_date')
+
+
+_datetime = serializers.DateTimeField().to_representation
+
+
+def _image(post):
+    return post.image.url if post.image else None
+
+
+class RowSerializer:
+    """Сериализатор списков без полей DRF.
+
+    ModelSerializer на каждый объект и поле вызывает get_attribute и
+    to_representation своего объекта поля; здесь на поле один getter.
+    Вывод совпадает с serializer, это проверяют тесты. Связанные объекты
+    запрошенных полей должны быть загружены select_related.
+    """
+
+    def __init__(self, serializer, getters):
+        self.serializer = serializer
+        self.getters = getters
+
+    @property
+    def fields(self):
+        return tuple(self.getters)
+
+    def serialize(self, objects, fields=None):
+        getters = [
+            (name, getter) for name, getter in self.getters.items()
+            if fields is None or name in fields
+        ]
+        return [
+            {name: getter(obj) for name, getter in getters}
+            for obj in objects
+        ]
+
+
+post_rows = RowSerializer(PostSerializer, {
+    'id': lambda post: post.pk,
+    'text': lambda post: post.text,
+    'pub_date': lambda post: _datetime(post.pub_date),
+    'author': lambda post: post.author.username,
+    'group': lambda post: post.group.slug if post.group_id else None,
+    'image': _image,
+    'image_width': lambda post: post.image_width,
+    'image_height': lambda post: post.image_height,
+})
+
+comment_rows = RowSerializer(CommentSerializer, {
+    'id': lambda comment: comment.pk,
+    'post': lambda comment: comment.post_id,
+    'text': lambda comment: comment.text,
+    'created': lambda comment: _datetime(comment.created),
+    'author': lambda comment: comment.author.username,
+})
+
+group_rows = RowSerializer(GroupSerializer, {
+    'id': lambda group: group.pk,
+    'slug': lambda group: group.slug,
+    'title': lambda group: group.title,
+    'description': lambda group: group.description,
+})
@@ -0,0 +1,146 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from core.cache import invalidate_tags
+
+from . import counters, feed, tags
+from .models import (Comment, Follow, Group, Post, PostCounter, User,
+                     UserCounter)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+    if created:
+        UserCounter.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    if created:
+        PostCounter.objects.create(post=instance)
+        counters.bump_user(instance.author_id, posts=1)
+        feed.fan_out_post(instance)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    counters.bump_user(instance.author_id, posts=-1)
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.bump_user(instance.author_id, comments=1)
+        counters.bump_post(instance.post_id, comments=1)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    counters.bump_user(instance.author_id, comments=-1)
+    counters.bump_post(instance.post_id, comments=-1)
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.bump_user(instance.user_id, following=1)
+        counters.bump_user(instance.author_id, followers=1)
+        feed.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    counters.bump_user(instance.user_id, following=-1)
+    counters.bump_user(instance.author_id, followers=-1)
+    feed.trim(instance.user_id, instance.author_id)
+
+
+@receiver(pre_save, sender=Post)
+def remember_post(sender, instance, **kwargs):
+    """Запоминает прежние группу и картинку поста и то, загружается ли
+    новая картинка."""
+    instance._old_group_slug = None
+    instance._old_image = None
+    instance._image_uploaded = (
+        bool(instance.image) and not instance.image._committed)
+    if instance.pk is None:
+        return
+    row = Post.objects.filter(pk=instance.pk).values_list(
+        'group__slug', 'image').first()
+    if row is not None:
+        instance._old_group_slug, instance._old_image = row
+
+
+@receiver(pre_save, sender=Group)
+def remember_group(sender, instance, **kwargs):
+    """Запоминает прежний slug, чтобы сбросить и его страницу."""
+    instance._old_group_slug = None
+    if instance.pk is not None:
+        instance._old_group_slug = Group.objects.filter(
+            pk=instance.pk).values_list('slug', flat=True).first()
+
+
+def release(storage, name):
+    """Снимает ссылку на файл после коммита: при откате строка поста
+    останется, и файл ей ещё нужен."""
+    transaction.on_commit(lambda: storage.delete(name))
+
+
+@receiver(post_save, sender=Post)
+def release_replaced_image(sender, instance, created, **kwargs):
+    old_image = getattr(instance, '_old_image', None)
+    # Загрузка того же содержимого даёт то же имя, но тоже берёт ссылку.
+    if old_image and (old_image != instance.image.name
+                      or getattr(instance, '_image_uploaded', False)):
+        release(instance.image.storage, old_image)
+
+
+@receiver(post_delete, sender=Post)
+def release_image(sender, instance, **kwargs):
+    if instance.image:
+        release(instance.image.storage, instance.image.name)
+
+
+def invalidate(*changed):
+    """Сбрасывает теги после коммита: раньше параллельный запрос мог бы
+    прочитать ещё старые строки и положить их в кэш под новой версией."""
+    transaction.on_commit(lambda: invalidate_tags(*changed))
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post(sender, instance, **kwargs):
+    changed = [
+        tags.INDEX,
+        tags.post_tag(instance.pk),
+        tags.author_tag(instance.author_id),
+    ]
+    slugs = {getattr(instance, '_old_group_slug', None)}
+    if instance.group_id is not None:
+        slugs.add(instance.group.slug)
+    changed += [tags.group_tag(slug) for slug in slugs if slug]
+    invalidate(*changed)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment(sender, instance, **kwargs):
+    invalidate(tags.post_tag(instance.post_id))
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_group(sender, instance, **kwargs):
+    slugs = {instance.slug, getattr(instance, '_old_group_slug', None)}
+    invalidate(
+        tags.INDEX, *[tags.group_tag(slug) for slug in slugs if slug])
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_follow(sender, instance, **kwargs):
+    invalidate(
+        tags.author_tag(instance.author_id),
+        tags.author_tag(instance.user_id),
+    )
@@ -0,0 +1,13 @@
+INDEX = 'feed:index'
+
+
+def post_tag(post_id):
+    return f'post:{post_id}'
+
+
+def author_tag(author_id):
+    return f'author:{author_id}'
+
+
+def group_tag(slug):
+    return f'group:{slug}'
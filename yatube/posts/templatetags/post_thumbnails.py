@@ -0,0 +1,34 @@
+import logging
+
+from django import template
+from sorl.thumbnail import get_thumbnail
+
+from posts.thumbnails import POST_THUMBNAILS, pregenerate
+
+logger = logging.getLogger(__name__)
+
+register = template.Library()
+
+OPTIONS = dict(POST_THUMBNAILS)
+
+
+@register.simple_tag
+def post_thumbnail(post, geometry):
+    """Миниатюра из post.thumbnails, иначе — обычный путь sorl.
+
+    Если миниатюры искали через prefetch и не нашли, страница не ждёт
+    Pillow: миниатюра ставится в очередь, а пост показывается без неё.
+    """
+    if not post.image:
+        return None
+    prefetched = getattr(post, 'thumbnails', None)
+    if prefetched is not None:
+        thumbnail = prefetched.get(geometry)
+        if thumbnail is None:
+            pregenerate(post.image.name)
+        return thumbnail
+    try:
+        return get_thumbnail(post.image, geometry, **OPTIONS[geometry])
+    except Exception:
+        logger.exception('Не удалось получить миниатюру %s', post.image)
+        return None
@@ -0,0 +1,145 @@
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from core.testing import QueryBudgetMixin
+from posts import api_urls
+from posts.models import (Choice, Comment, Follow, Group, PendingVote, Post,
+                          Question, User)
+from posts.serializers import (CommentSerializer, GroupSerializer,
+                               PostSerializer, comment_rows, group_rows,
+                               post_rows)
+
+
+@override_settings(API_PAGE_SIZE=3)
+class APITests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание')
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.posts = [
+            Post.objects.create(
+                text=f'Пост № {number}', author=cls.author,
+                group=cls.group if number % 2 else None)
+            for number in range(5)
+        ]
+        for number in range(4):
+            Comment.objects.create(
+                text=f'Комментарий {number}', post=cls.posts[0],
+                author=cls.reader)
+        cls.question = Question.objects.create(
+            question_text='Опрос', pub_date=timezone.now())
+        cls.choice = Choice.objects.create(
+            question=cls.question, choice_text='Да', votes=2)
+        PendingVote.objects.create(choice=cls.choice)
+
+    def setUp(self):
+        self.client = Client()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+        cache.clear()
+
+    def get(self, name, client=None, **kwargs):
+        query = kwargs.pop('query', '')
+        response = (client or self.client).get(
+            reverse(f'api:{name}', kwargs=kwargs) + query)
+        self.assertWithinQueryBudget(response)
+        return response
+
+    def test_every_view_declares_budget(self):
+        for pattern in api_urls.urlpatterns:
+            with self.subTest(name=pattern.name):
+                self.assertTrue(hasattr(pattern.callback, 'query_budget'))
+
+    def test_cursor_pagination(self):
+        '''Курсоры проходят ленту целиком, новые посты первыми'''
+        seen = []
+        url = reverse('api:posts')
+        while url:
+            data = self.client.get(url).json()
+            seen += [post['id'] for post in data['results']]
+            url = data['next']
+        self.assertEqual(seen, [post.pk for post in reversed(self.posts)])
+
+    def test_feeds(self):
+        group = self.get('group_posts', slug='group').json()
+        self.assertEqual(
+            [post['id'] for post in group['results']],
+            [self.posts[3].pk, self.posts[1].pk])
+        author = self.get('author_posts', username='author').json()
+        self.assertEqual(len(author['results']), 3)
+        self.assertEqual(self.get('follow_posts').status_code, 401)
+        follow = self.get('follow_posts', client=self.reader_client).json()
+        self.assertEqual(follow['results'], author['results'])
+        self.assertEqual(
+            self.get('group_posts', slug='missing').json(),
+            {'detail': 'Не найдено'})
+
+    def test_sparse_fieldsets(self):
+        data = self.get('posts', query='?fields=id,author').json()
+        self.assertEqual(data['results'][0], {
+            'id': self.posts[-1].pk, 'author': 'author'})
+        self.assertIn('fields=id,author', data['next'])
+        detail = self.get(
+            'post_detail', post_id=self.posts[1].pk,
+            query='?fields=text,group').json()
+        self.assertEqual(detail, {'text': 'Пост № 1', 'group': 'group'})
+        response = self.get('posts', query='?fields=id,secret')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json(), {'detail': 'Неизвестные поля: secret'})
+
+    def test_fast_serializers_match_model_serializers(self):
+        '''Быстрый путь списков отдаёт то же, что ModelSerializer'''
+        posts = Post.objects.select_related('author', 'group')
+        comments = Comment.objects.select_related('author')
+        groups = Group.objects.all()
+        for rows, serializer, objects in (
+            (post_rows, PostSerializer, posts),
+            (comment_rows, CommentSerializer, comments),
+            (group_rows, GroupSerializer, groups),
+        ):
+            with self.subTest(serializer=serializer.__name__):
+                self.assertEqual(
+                    rows.serialize(objects),
+                    [dict(row) for row in serializer(objects, many=True).data])
+                self.assertEqual(
+                    rows.serialize(objects, ('id',)),
+                    [dict(row) for row in serializer(
+                        objects, many=True, fields=('id',)).data])
+
+    def test_comments_groups_and_question(self):
+        comments = self.get(
+            'post_comments', post_id=self.posts[0].pk).json()
+        self.assertEqual(
+            [comment['text'] for comment in comments['results']],
+            ['Комментарий 0', 'Комментарий 1', 'Комментарий 2'])
+        self.assertEqual(
+            self.get('groups', query='?fields=slug').json(),
+            [{'slug': 'group'}])
+        self.assertEqual(
+            self.get('group_detail', slug='group').json()['title'], 'Группа')
+        question = self.get('question', pk=self.question.pk).json()
+        self.assertEqual(
+            question['choices'], [{'choice_text': 'Да', 'votes': 3}])
+
+    def test_etag(self):
+        '''Повторный запрос с ETag получает 304 без тела'''
+        url = reverse('api:posts')
+        response = self.client.get(url)
+        etag = response['ETag']
+        not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.content, b'')
+        Post.objects.create(text='Новый', author=self.author)
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_read_only(self):
+        response = self.client.post(reverse('api:posts'))
+        self.assertEqual(response.status_code, 405)
+        self.assertEqual(response['Allow'], 'GET, HEAD')
@@ -0,0 +1,134 @@
+import http.client
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase
+
+from core.query_plan import audit, capture
+from posts import dataset, loadtest
+from posts.benchmark import (compare_api, find_regressions, reader,
+                             time_views, view_urls)
+from posts.management.commands.explain_views import SMALL_TABLES
+from posts.counters import rebuild_post_counters, rebuild_user_counters
+from posts.models import Comment, FeedEntry, Group, Post, User
+
+
+class BenchmarkTests(TestCase):
+    sizes = {
+        'users': 6, 'groups': 2, 'posts': 30, 'comments': 40,
+        'follows': 10, 'questions': 1, 'images': 0,
+    }
+
+    def setUp(self):
+        cache.clear()
+
+    def snapshot(self):
+        return list(Post.objects.order_by('pk').values_list(
+            'text', 'author__username', 'group__slug'))
+
+    def test_dataset_is_reproducible(self):
+        '''Один seed даёт одинаковые данные, счётчики и ленты досчитаны'''
+        dataset.generate(seed=7, **self.sizes)
+        first = self.snapshot()
+        self.assertEqual(len(first), 30)
+        self.assertEqual(Comment.objects.count(), 40)
+        self.assertTrue(FeedEntry.objects.exists())
+        self.assertEqual(rebuild_user_counters(dry_run=True), 0)
+        self.assertEqual(rebuild_post_counters(dry_run=True), 0)
+        User.objects.all().delete()
+        Group.objects.all().delete()
+        dataset.generate(seed=7, **self.sizes)
+        self.assertEqual(self.snapshot(), first)
+
+    def test_time_views(self):
+        '''Замер обходит представления posts и users'''
+        dataset.generate(seed=1, **self.sizes)
+        results = time_views(iterations=1)
+        self.assertEqual(results['posts:index']['status'], [200])
+        self.assertIn('users:login', results)
+        self.assertNotIn('users:logout', results)
+        self.assertNotIn('posts:profile_follow', results)
+        self.assertGreater(results['posts:index']['queries'], 0)
+        self.assertEqual(results['api:posts']['status'], [200])
+        comparison = compare_api(results)
+        self.assertEqual(comparison['api:posts']['html'], 'posts:index')
+
+    def test_find_regressions(self):
+        baseline = {'posts:index': {
+            'queries': 4,
+            'cold_ms': {'p50': 10.0}, 'warm_ms': {'p50': 1.0},
+        }}
+        noisy = {'posts:index': {
+            'queries': 4,
+            'cold_ms': {'p50': 12.0}, 'warm_ms': {'p50': 1.9},
+        }}
+        self.assertEqual(find_regressions(noisy, baseline), [])
+        slower = {'posts:index': {
+            'queries': 5,
+            'cold_ms': {'p50': 20.0}, 'warm_ms': {'p50': 1.0},
+        }}
+        self.assertEqual(len(find_regressions(slower, baseline)), 2)
+
+    def test_feed_query_plans(self):
+        '''Ленты читаются по индексам, без полных проходов и сортировок'''
+        dataset.generate(seed=2, **self.sizes)
+        urls = view_urls()
+        user = reader()
+        for name in ('posts:index', 'posts:group_posts', 'posts:profile',
+                     'posts:follow_index', 'posts:question_visual'):
+            cache.clear()
+            status, statements = capture(urls[name], user)
+            self.assertEqual(status, 200)
+            for sql, params in statements:
+                result = audit(sql, params, SMALL_TABLES)
+                if result is not None:
+                    with self.subTest(view=name, sql=sql):
+                        self.assertEqual(result[1], [], result[0])
+
+
+class LoadTestTests(SimpleTestCase):
+    def test_parse_mix(self):
+        self.assertEqual(
+            loadtest.parse_mix('index=3, vote=1'), {'index': 3, 'vote': 1})
+        with self.assertRaises(ValueError):
+            loadtest.parse_mix('unknown=1')
+        with self.assertRaises(ValueError):
+            loadtest.parse_mix('index=0')
+
+    def test_stats_percentiles(self):
+        stats = loadtest.Stats()
+        for number in range(1, 101):
+            stats.record('index', number / 1000, ok=number != 100)
+        row = stats.summary(elapsed=2)['index']
+        self.assertEqual(row['requests'], 100)
+        self.assertEqual(row['errors'], 1)
+        self.assertEqual(row['rps'], 50)
+        self.assertAlmostEqual(row['p50_ms'], 50, delta=50 / 16)
+        self.assertAlmostEqual(row['p99_ms'], 99, delta=99 / 16)
+
+    def test_asgi_server(self):
+        async def application(scope, receive, send):
+            message = await receive()
+            await send({
+                'type': 'http.response.start', 'status': 201,
+                'headers': [(b'content-type', b'text/plain')],
+            })
+            await send({
+                'type': 'http.response.body',
+                'body': f'{scope["method"]} {scope["path"]} '
+                        f'{scope["query_string"].decode()} '.encode()
+                + message['body'],
+            })
+
+        servers = loadtest.serve(application, 1, 'asgi')
+        try:
+            connection = http.client.HTTPConnection(*servers.address)
+            connection.request('POST', '/a%20b/?x=1', b'body')
+            response = connection.getresponse()
+            self.assertEqual(response.status, 201)
+            self.assertEqual(response.read(), b'POST /a b/ x=1 body')
+            connection.close()
+            self.assertIsInstance(
+                loadtest.memory_per_connection(servers, 10, settle=0.1),
+                float)
+        finally:
+            servers.stop()
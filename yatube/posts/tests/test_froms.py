@@ -1,12 +1,31 @@
+from io import BytesIO, StringIO
+from unittest import mock
+
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from core.models import StoredFile
 from posts.forms import PostForm
 from posts.models import Comment, Group, Post
+from posts.thumbnails import (POST_THUMBNAILS, _generate_logged, _pending,
+                              prefetch, pregenerate)
+from PIL import Image
+from sorl.thumbnail import default, get_thumbnail
 
 User = get_user_model()
 
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
 
 class PostsFormsTests(TestCase):
     @classmethod
@@ -101,3 +120,196 @@ class PostsFormsTests(TestCase):
         )
         self.assertEqual(Comment.objects.count(), comment_count + 1)
         self.assertContains(response, 'NewComment')
+
+
+def make_jpeg(size, **params):
+    buffer = BytesIO()
+    Image.new('RGB', size, 'red').save(buffer, 'JPEG', **params)
+    return SimpleUploadedFile(
+        name='photo.jpeg', content=buffer.getvalue(),
+        content_type='image/jpeg')
+
+
+@override_settings(POST_IMAGE_MAX_SIZE=(64, 64), POST_IMAGE_MAX_PIXELS=10_000)
+class ImageNormalizationTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Photographer')
+
+    def post_form(self, image):
+        return PostForm(data={'text': 'Фото'}, files={'image': image})
+
+    def test_large_image_downscaled(self):
+        '''Большая картинка уменьшается, размер сохраняется в посте'''
+        form = self.post_form(make_jpeg((80, 40)))
+        self.assertTrue(form.is_valid(), form.errors)
+        post = form.save(commit=False)
+        post.author = self.author
+        post.save()
+        post.refresh_from_db()
+        self.assertEqual((post.image_width, post.image_height), (64, 32))
+        with post.image.open() as file:
+            self.assertEqual(Image.open(file).size, (64, 32))
+
+    def test_metadata_stripped(self):
+        '''EXIF не попадает в сохранённый файл, поворот применяется'''
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        exif[0x010F] = 'Camera'
+        form = self.post_form(make_jpeg((40, 20), exif=exif.tobytes()))
+        self.assertTrue(form.is_valid(), form.errors)
+        image = form.cleaned_data['image']
+        self.assertEqual(image.image_size, (20, 40))
+        self.assertNotIn('exif', Image.open(image).info)
+
+    def test_truncated_image_rejected(self):
+        '''Обрезанный файл, который проходит verify(), но не
+        декодируется, даёт ошибку формы, а не 500'''
+        buffer = BytesIO()
+        Image.effect_noise((60, 60), 64).convert('RGB').save(buffer, 'JPEG')
+        content = buffer.getvalue()[:len(buffer.getvalue()) // 2]
+        form = self.post_form(SimpleUploadedFile(
+            name='broken.jpeg', content=content, content_type='image/jpeg'))
+        self.assertFalse(form.is_valid())
+        self.assertIn('image', form.errors)
+
+    def test_too_many_pixels_rejected(self):
+        '''Картинка больше POST_IMAGE_MAX_PIXELS не принимается'''
+        form = self.post_form(make_jpeg((200, 100)))
+        self.assertFalse(form.is_valid())
+        self.assertIn('image', form.errors)
+
+
+class ThumbnailTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='HasNoName')
+        cls.post = Post.objects.create(
+            text='Пост с картинкой',
+            author=cls.author,
+            image=SimpleUploadedFile(
+                name='small.gif', content=SMALL_GIF,
+                content_type='image/gif'),
+            image_width=2,
+            image_height=2,
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_warm_thumbnails(self):
+        '''Команда строит миниатюры, которые потом найдёт шаблон'''
+        out = StringIO()
+        call_command('warm_thumbnails', workers=1, stdout=out)
+        self.assertIn('Готово: 1 из 1', out.getvalue())
+        with mock.patch.object(default.engine, 'get_image') as get_image:
+            for geometry, options in POST_THUMBNAILS:
+                self.assertTrue(
+                    get_thumbnail(self.post.image, geometry, **options).url)
+        get_image.assert_not_called()
+
+    def test_pregenerate_after_commit(self):
+        '''Миниатюры ставятся в очередь только после коммита и только
+        один раз'''
+        self.addCleanup(_pending.discard, self.post.image.name)
+        with mock.patch('posts.thumbnails._get_executor') as executor:
+            with self.captureOnCommitCallbacks(execute=True):
+                pregenerate(self.post.image.name)
+                executor.assert_not_called()
+            with self.captureOnCommitCallbacks(execute=True):
+                pregenerate(self.post.image.name)
+        executor.return_value.submit.assert_called_once_with(
+            _generate_logged, self.post.image.name)
+
+    def test_generated_thumbnail_refreshes_pages(self):
+        '''Страница, закэшированная без миниатюры, сбрасывается, когда
+        миниатюра готова'''
+        url = reverse('posts:profile', kwargs={'username': 'HasNoName'})
+        with mock.patch('posts.templatetags.post_thumbnails.pregenerate'):
+            response = self.client.get(url)
+        self.assertContains(response, f'src="{self.post.image.url}"')
+        etag = response['ETag']
+        _generate_logged(self.post.image.name)
+        thumbnail = get_thumbnail(
+            self.post.image, '960x339', crop='center', upscale=True)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, f'src="{thumbnail.url}"')
+        self.assertContains(response, 'width="960" height="339"')
+
+    def test_prefetch_thumbnails(self):
+        '''Миниатюры страницы находятся одним запросом'''
+        call_command('warm_thumbnails', workers=1, stdout=StringIO())
+        post_without_image = Post.objects.create(
+            text='Без картинки', author=self.author)
+        posts = [Post.objects.get(pk=self.post.pk), post_without_image]
+        cache.clear()
+        with self.assertNumQueries(1):
+            prefetch(posts)
+        self.assertEqual(post_without_image.thumbnails, {})
+        thumbnail = posts[0].thumbnails['960x339']
+        self.assertEqual(
+            thumbnail.url,
+            get_thumbnail(self.post.image, '960x339',
+                          crop='center', upscale=True).url)
+        self.assertEqual((thumbnail.width, thumbnail.height), (960, 339))
+        with self.assertNumQueries(0):
+            prefetch(posts)
+
+    def test_prefetch_with_other_kvstore(self):
+        '''Промахи kvstore без кэша не ломают prefetch'''
+        post = Post.objects.get(pk=self.post.pk)
+        with mock.patch.object(default, 'kvstore', mock.Mock()) as kvstore:
+            kvstore._get_raw.return_value = None
+            prefetch([post])
+        self.assertEqual(post.thumbnails, {'960x339': None})
+
+    def test_page_does_not_wait_for_thumbnails(self):
+        '''Страница с непостроенной миниатюрой не строит её сама'''
+        with mock.patch('posts.templatetags.post_thumbnails.'
+                        'pregenerate') as pregenerate_mock:
+            with mock.patch.object(default.engine, 'get_image') as get_image:
+                response = self.client.get(reverse('posts:index'))
+        self.assertEqual(response.status_code, 200)
+        # Пока миниатюры нет, показывается оригинал с размерами из поста.
+        self.assertContains(response, f'src="{self.post.image.url}"')
+        self.assertContains(response, 'width="2" height="2"')
+        get_image.assert_not_called()
+        pregenerate_mock.assert_called_once_with(self.post.image.name)
+
+    def test_deleted_post_releases_image(self):
+        '''Картинка удаляется вместе с последним постом, который на неё
+        ссылается'''
+        green_gif = SMALL_GIF.replace(b'\xFF\xFF\xFF', b'\x00\xFF\x00')
+        posts = [
+            Post.objects.create(
+                text='Копия', author=self.author,
+                image=SimpleUploadedFile(
+                    name=name, content=green_gif, content_type='image/gif'),
+            )
+            for name in ('first.gif', 'second.gif')
+        ]
+        name = posts[0].image.name
+        storage = posts[0].image.storage
+        self.assertEqual(posts[1].image.name, name)
+        with self.captureOnCommitCallbacks(execute=True):
+            posts[0].delete()
+        self.assertTrue(storage.exists(name))
+        with self.captureOnCommitCallbacks(execute=True):
+            posts[1].delete()
+            self.assertTrue(storage.exists(name), 'удалено до коммита')
+        self.assertFalse(storage.exists(name))
+
+    def test_same_image_reuploaded(self):
+        '''Повторная загрузка той же картинки не оставляет лишней ссылки'''
+        post = Post.objects.get(pk=self.post.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            post.image = SimpleUploadedFile(
+                name='again.gif', content=SMALL_GIF,
+                content_type='image/gif')
+            post.save()
+        self.assertEqual(post.image.name, self.post.image.name)
+        self.assertEqual(StoredFile.objects.get(
+            name=post.image.name).references, 1)
@@ -1,7 +1,10 @@
+from io import StringIO
+
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
 from django.test import TestCase
 
-from ..models import Group, Post
+from ..models import Comment, Follow, Group, Post, PostCounter, UserCounter
 
 User = get_user_model()
 
@@ -38,3 +41,48 @@ class GropModelTest(TestCase):
         group = GropModelTest.group
         expected_object_name = group.title
         self.assertEqual(expected_object_name, str(group))
+
+
+class CounterTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.reader = User.objects.create_user(username='reader')
+
+    def test_counters_follow_writes(self):
+        """Счётчики меняются при создании и удалении записей."""
+        post = Post.objects.create(author=self.user, text='Пост')
+        comment = Comment.objects.create(
+            author=self.reader, post=post, text='Комментарий')
+        follow = Follow.objects.create(user=self.reader, author=self.user)
+        self.user.counter.refresh_from_db()
+        self.reader.counter.refresh_from_db()
+        post.counter.refresh_from_db()
+        self.assertEqual(self.user.counter.posts, 1)
+        self.assertEqual(self.user.counter.followers, 1)
+        self.assertEqual(self.reader.counter.comments, 1)
+        self.assertEqual(self.reader.counter.following, 1)
+        self.assertEqual(post.counter.comments, 1)
+        comment.delete()
+        follow.delete()
+        post.delete()
+        self.user.counter.refresh_from_db()
+        self.reader.counter.refresh_from_db()
+        self.assertEqual(self.user.counter.posts, 0)
+        self.assertEqual(self.user.counter.followers, 0)
+        self.assertEqual(self.reader.counter.comments, 0)
+        self.assertEqual(self.reader.counter.following, 0)
+
+    def test_rebuild_counters(self):
+        """Команда rebuild_counters исправляет разошедшиеся счётчики."""
+        post = Post.objects.create(author=self.user, text='Пост')
+        UserCounter.objects.filter(user=self.user).update(posts=42)
+        PostCounter.objects.filter(post=post).update(comments=7)
+        out = StringIO()
+        call_command('rebuild_counters', stdout=out)
+        self.assertIn('пользователей 1, постов 1', out.getvalue())
+        self.user.counter.refresh_from_db()
+        post.counter.refresh_from_db()
+        self.assertEqual(self.user.counter.posts, 1)
+        self.assertEqual(post.counter.comments, 0)
@@ -1,10 +1,29 @@
+import asyncio
+import json
+import threading
+from io import StringIO
+from unittest import mock
+
+from asgiref.sync import sync_to_async
 from django import forms
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
+from django.core.management import call_command
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase
+from django.db import connection
+from django.test import (Client, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from posts.models import Follow, Group, Post
+from django.utils import timezone
+from core.cache import tag_versions
+from core.db.observers import observe
+from core.streaming import StreamRouter
+from core.testing import QueryBudgetMixin
+from posts import tags
+from posts import urls as posts_urls
+from posts.models import (Choice, Comment, FeedEntry, Follow, Group,
+                          PendingVote, Post, PullAuthor, Question)
 
 User = get_user_model()
 
@@ -82,13 +101,81 @@ class PostsVIEWTests(TestCase):
         response = self.authorized_client.get(reverse('posts:index'))
         post = response.context['page_obj'][0]
         self.compare_posts_fields(post, self.post2)
-        Post.objects.filter(id=self.post2.id).delete()
+        Post.objects.filter(id=self.post2.id).update(text='Изменённый пост')
         response = self.authorized_client.get(reverse('posts:index'))
         self.assertContains(response, 'Лишний пост')
         cache.clear()
         response = self.authorized_client.get(reverse('posts:index'))
         self.assertNotContains(response, 'Лишний пост')
 
+    def test_cached_pages_invalidated_by_tags(self):
+        '''Закэшированные страницы сбрасываются при изменении данных'''
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group_posts',
+                    kwargs={'slug': PostsVIEWTests.group2.slug}),
+            reverse('posts:profile',
+                    kwargs={'username': PostsVIEWTests.author2.username}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post2.id}),
+        ]
+        for url in urls:
+            self.assertContains(self.authorized_client.get(url), 'Лишний пост')
+        versions = tag_versions([tags.INDEX])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post2.text = 'Изменённый пост'
+            self.post2.save()
+            self.assertEqual(
+                tag_versions([tags.INDEX]), versions, 'сброшено до коммита')
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.authorized_client.get(url)
+                self.assertContains(response, 'Изменённый пост')
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.create(
+                post=self.post2, author=self.author, text='Новый комментарий')
+        response = self.authorized_client.get(urls[-1])
+        self.assertContains(response, 'Новый комментарий')
+
+    def test_conditional_get(self):
+        '''Неизменившиеся страницы отвечают 304, правки их сбрасывают'''
+        post = PostsVIEWTests.post
+        urls = [
+            reverse('posts:group_posts', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user.username}),
+            reverse('posts:post_detail', kwargs={'post_id': post.pk}),
+        ]
+
+        def etags():
+            return [self.authorized_client.get(url)['ETag'] for url in urls]
+
+        # Первый ответ выдаёт csrftoken, и Cookie меняется.
+        etags()
+        first = etags()
+        for url, etag in zip(urls, first):
+            with self.subTest(url=url):
+                response = self.authorized_client.get(url)
+                self.assertIn('no-cache', response['Cache-Control'])
+                self.assertIn('Last-Modified', response)
+                with CaptureQueriesContext(connection) as queries:
+                    not_modified = self.authorized_client.get(
+                        url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(not_modified.status_code, 304)
+                self.assertEqual(not_modified.content, b'')
+                self.assertEqual(not_modified['ETag'], etag)
+                self.assertLessEqual(len(queries), 3)
+        self.authorized_client.post(
+            reverse('posts:post_edit', kwargs={'post_id': post.pk}),
+            {'text': 'Исправленный пост', 'group': self.group.pk})
+        edited = etags()
+        for url, old, new in zip(urls, first, edited):
+            with self.subTest(url=url):
+                self.assertNotEqual(old, new)
+        Comment.objects.create(post=post, author=self.author2, text='Ещё')
+        self.assertNotEqual(etags()[2], edited[2])
+        self.assertNotEqual(
+            self.client.get(urls[0])['ETag'], edited[0],
+            'ETag зависит от сессии')
+
     def test_groups_view_show_correct_context(self):
         '''На странице группы только посты группы, посты пердаются корректно'''
         response = self.authorized_client.get(
@@ -203,6 +290,37 @@ class PostsVIEWTests(TestCase):
         self.assertFalse(Follow.objects.filter(
             author=PostsVIEWTests.author2).filter(user=self.author).exists())
 
+    def test_follow_backfills_and_unfollow_trims_feed(self):
+        '''Подписка добавляет старые посты автора в ленту,
+        отписка их убирает'''
+        self.authorized_client.get(
+            reverse('posts:profile_follow',
+                    kwargs={'username': PostsVIEWTests.author2.username}))
+        self.assertTrue(FeedEntry.objects.filter(
+            user=self.author, post=self.post2).exists())
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertIn(self.post2, response.context['page_obj'])
+        self.authorized_client.get(
+            reverse('posts:profile_unfollow',
+                    kwargs={'username': PostsVIEWTests.author2.username}))
+        self.assertFalse(FeedEntry.objects.filter(user=self.author).exists())
+
+    @override_settings(FEED_FANOUT_LIMIT=0)
+    def test_follow_feed_pull_author(self):
+        '''Посты автора с множеством подписчиков не раскладываются
+        по лентам, но видны в ленте подписок'''
+        Follow.objects.create(user=self.author, author=self.author2)
+        new_post = Post.objects.create(
+            text='TestPullAuthor',
+            author=PostsVIEWTests.author2
+        )
+        self.assertTrue(PullAuthor.objects.filter(
+            author=PostsVIEWTests.author2).exists())
+        self.assertFalse(FeedEntry.objects.filter(post=new_post).exists())
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        posts = list(response.context['page_obj'])
+        self.assertEqual(posts, [new_post, self.post2])
+
     def test_unfollow(self):
         '''Проверка отписки'''
         self.authorized_client.get(
@@ -266,5 +384,458 @@ class PaginatorTests(TestCase):
             with self.subTest(reverse_name=reverse_name):
                 response = self.authorized_client.get(reverse_name)
                 self.assertEqual(len(response.context['page_obj']), 10)
-                response = self.authorized_client.get(reverse_name + '?page=2')
+                cursor = response.context['page_obj'].next_cursor
+                response = self.authorized_client.get(
+                    reverse_name, {'cursor': cursor})
                 self.assertEqual(len(response.context['page_obj']), intgr)
+                self.assertFalse(response.context['page_obj'].has_next())
+
+    def test_paginator_previous_page(self):
+        '''Курсор назад возвращает ту же первую страницу'''
+        url = reverse('posts:group_posts',
+                      kwargs={'slug': PaginatorTests.group.slug})
+        first = self.authorized_client.get(url).context['page_obj']
+        second = self.authorized_client.get(
+            url, {'cursor': first.next_cursor}).context['page_obj']
+        back = self.authorized_client.get(
+            url, {'cursor': second.previous_cursor}).context['page_obj']
+        self.assertEqual(list(back), list(first))
+        self.assertTrue(set(first).isdisjoint(second))
+
+    def test_paginator_same_pub_date(self):
+        '''Посты с одинаковой датой не теряются между страницами'''
+        Post.objects.filter(group=PaginatorTests.group).update(
+            pub_date=PaginatorTests.post.pub_date)
+        url = reverse('posts:group_posts',
+                      kwargs={'slug': PaginatorTests.group.slug})
+        first = self.authorized_client.get(url).context['page_obj']
+        second = self.authorized_client.get(
+            url, {'cursor': first.next_cursor}).context['page_obj']
+        self.assertEqual(len(set(first) | set(second)), 15)
+
+    def test_paginator_broken_cursor(self):
+        '''Битый курсор отдаёт первую страницу'''
+        response = self.authorized_client.get(
+            reverse('posts:index'), {'cursor': 'broken'})
+        self.assertEqual(len(response.context['page_obj']), 10)
+
+
+@override_settings(COMMENTS_PER_PAGE=5)
+class CommentPaginationTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='HasNoName')
+        cls.post = Post.objects.create(text='Пост', author=cls.author)
+        cls.url = reverse('posts:post_detail',
+                          kwargs={'post_id': cls.post.id})
+
+    def setUp(self):
+        cache.clear()
+
+    def add_comments(self, count):
+        for number in range(count):
+            author = User.objects.create_user(
+                username=f'commenter{Comment.objects.count()}')
+            Comment.objects.create(
+                text=f'Комментарий {number}', post=self.post, author=author)
+
+    def count_queries(self):
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(self.url)
+        return len(context)
+
+    def test_detail_queries_do_not_depend_on_comments(self):
+        '''Число запросов страницы поста не растёт с числом комментариев'''
+        self.add_comments(2)
+        queries = self.count_queries()
+        self.add_comments(10)
+        self.assertEqual(self.count_queries(), queries)
+
+    def test_load_more(self):
+        '''«Показать ещё» отдаёт следующие комментарии без повторов'''
+        self.add_comments(7)
+        response = self.client.get(self.url)
+        first = response.context['comments']
+        self.assertEqual(len(first), 5)
+        self.assertContains(response, 'data-comments-more')
+        response = self.client.get(
+            reverse('posts:post_comments', kwargs={'post_id': self.post.id}),
+            {'cursor': first.next_cursor})
+        second = response.context['comments']
+        self.assertEqual(len(second), 2)
+        self.assertFalse(second.has_next())
+        self.assertEqual(
+            [comment.text for comment in list(first) + list(second)],
+            [f'Комментарий {number}' for number in range(6, -1, -1)])
+
+    def test_oldest_first(self):
+        '''Порядок order=old начинается с первого комментария'''
+        self.add_comments(3)
+        response = self.client.get(self.url, {'order': 'old'})
+        self.assertEqual(
+            response.context['comments'][0].text, 'Комментарий 0')
+
+
+@override_settings(PAGINATOR_OBJECTS_PER_PAGE=2)
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='HasNoName')
+        cls.group = Group.objects.create(
+            title='Кошачий клуб', slug='cats', description='Про котов')
+        cls.posts = [
+            Post.objects.create(text=text, author=cls.author, group=group)
+            for text, group in (
+                ('Кот спит на <b>окне</b>', None),
+                ('Собака гуляет', cls.group),
+                ('Котята и коты играют с котом', None),
+                ('Про погоду', None),
+            )
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def search(self, query, **params):
+        return self.client.get(
+            reverse('posts:search'), {'q': query, **params})
+
+    def test_ranked_and_highlighted(self):
+        '''Поиск по началу слова, с ранжированием и экранированием'''
+        response = self.search('кот')
+        found = list(response.context['page_obj'])
+        self.assertEqual(found[0], self.posts[2])
+        self.assertEqual(set(found), {self.posts[0], self.posts[2]})
+        self.assertContains(response, '<mark>Кот</mark> спит на &lt;b&gt;')
+        self.assertNotContains(response, '<b>окне</b>')
+        cursor = response.context['page_obj'].next_cursor
+        rest = self.search('кот', cursor=cursor).context['page_obj']
+        self.assertEqual(list(rest), [self.posts[1]])
+
+    def test_index_follows_edits(self):
+        '''Индекс следует за правкой поста и переименованием группы'''
+        self.posts[3].text = 'Про кота в дождь'
+        self.posts[3].save()
+        self.assertIn(self.posts[3], self.search('дождь').context['page_obj'])
+        Group.objects.filter(pk=self.group.pk).update(title='Собачий клуб')
+        self.assertIn(self.posts[1], self.search('собачий').context['page_obj'])
+        self.posts[0].delete()
+        cache.clear()
+        self.assertNotContains(self.search('спит'), 'Подробнее')
+
+    def test_index_read_from_read_database(self):
+        '''Индекс читается из той же базы, что и посты: под read_replica
+        это реплика'''
+        with mock.patch('posts.search.router.db_for_read',
+                        return_value='default') as db_for_read:
+            found = list(self.search('кот').context['page_obj'])
+        db_for_read.assert_any_call(Post)
+        self.assertEqual(set(found), {self.posts[0], self.posts[2]})
+
+    def test_rebuild_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM posts_search')
+        self.assertFalse(self.search('погоду').context['page_obj'])
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('Проиндексировано постов: 4', out.getvalue())
+        cache.clear()
+        self.assertTrue(self.search('погоду').context['page_obj'])
+
+
+class QuestionTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.question = Question.objects.create(
+            question_text='Тестовый опрос',
+            pub_date=timezone.now(),
+        )
+        cls.choice = Choice.objects.create(
+            question=cls.question, choice_text='Да')
+        cls.other_choice = Choice.objects.create(
+            question=cls.question, choice_text='Нет')
+
+    def setUp(self):
+        self.guest_client = Client()
+
+    def vote(self):
+        return self.guest_client.post(
+            reverse('posts:question', kwargs={'pk': self.question.pk}),
+            {'exampleRadios': self.choice.pk})
+
+    def test_vote_is_buffered_and_flushed(self):
+        '''Голос попадает в буфер, итоги учитывают его до переноса'''
+        self.vote()
+        self.vote()
+        self.choice.refresh_from_db()
+        self.assertEqual(self.choice.votes, 0)
+        response = self.guest_client.get(
+            reverse('posts:question_visual',
+                    kwargs={'pk': self.question.pk}))
+        chart = json.loads(response.context['chart'])
+        self.assertEqual(chart['series'][0]['data'], [2, 0])
+        call_command('flush_votes', stdout=StringIO())
+        self.choice.refresh_from_db()
+        self.assertEqual(self.choice.votes, 2)
+        self.assertFalse(PendingVote.objects.exists())
+        self.vote()
+        chart = json.loads(self.guest_client.get(
+            reverse('posts:question_visual',
+                    kwargs={'pk': self.question.pk})).context['chart'])
+        self.assertEqual(chart['series'][0]['data'], [3, 0])
+
+    @override_settings(POLL_STREAM_WSGI_TIMEOUT=0.2, POLL_STREAM_RATE=20)
+    def test_stream(self):
+        '''Поток SSE под WSGI отдаёт итоги опроса недолго и просит
+        переподключиться'''
+        self.vote()
+        response = self.guest_client.get(
+            reverse('posts:question_stream',
+                    kwargs={'pk': self.question.pk}))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = b''.join(response.streaming_content).decode()
+        self.assertTrue(body.startswith('retry: 3000\n\n'))
+        self.assertIn('event: totals\ndata: {"0":1,"1":0}\n\n', body)
+        self.assertEqual(body.count('event: totals'), 1)
+        response = self.guest_client.get(
+            reverse('posts:question_stream', kwargs={'pk': 999}))
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(POLL_STREAM_RATE=50)
+    async def test_asgi_stream(self):
+        '''Под ASGI поток идёт в обход Django и присылает только
+        изменившиеся итоги'''
+        fallback = []
+
+        async def application(scope, receive, send):
+            fallback.append(scope['path'])
+
+        router = StreamRouter(application)
+        messages = []
+        received = asyncio.Event()
+        disconnect = asyncio.get_running_loop().create_future()
+
+        async def receive():
+            await disconnect
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            messages.append(message)
+            received.set()
+
+        async def wait_for(text):
+            while not any(text in message.get('body', b'')
+                          for message in messages):
+                received.clear()
+                await asyncio.wait_for(received.wait(), 5)
+
+        url = reverse('posts:question_stream', kwargs={'pk': 999})
+        await router({'type': 'http', 'path': url}, receive, send)
+        self.assertEqual(fallback, [url])
+        url = reverse('posts:question_stream',
+                      kwargs={'pk': self.question.pk})
+        task = asyncio.ensure_future(
+            router({'type': 'http', 'path': url}, receive, send))
+        await wait_for(b'{"0":0,"1":0}')
+        await sync_to_async(self.vote)()
+        await wait_for(b'data: {"0":1}\n')
+        disconnect.set_result(None)
+        await asyncio.wait_for(task, 5)
+        self.assertEqual(messages[0]['status'], 200)
+        self.assertEqual(messages[-1], {'type': 'http.response.body'})
+        self.assertEqual(fallback, [reverse(
+            'posts:question_stream', kwargs={'pk': 999})])
+
+    def test_vote_for_other_question_choice(self):
+        '''Нельзя проголосовать за вариант другого опроса'''
+        other = Question.objects.create(
+            question_text='Другой опрос', pub_date=timezone.now())
+        response = self.guest_client.post(
+            reverse('posts:question', kwargs={'pk': other.pk}),
+            {'exampleRadios': self.choice.pk})
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(PendingVote.objects.exists())
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.group = Group.objects.create(
+            title='Тестовый заголовок',
+            description='Тестовое описание',
+            slug='test-slug'
+        )
+        cls.user = User.objects.create_user(username='Reader')
+        cls.authors = [
+            User.objects.create_user(username=f'author{number}')
+            for number in range(3)
+        ]
+        for number in range(12):
+            post = Post.objects.create(
+                text=f'Пост № {number}',
+                author=cls.authors[number % 3],
+                group=cls.group if number % 2 else None,
+            )
+            for author in cls.authors:
+                Comment.objects.create(
+                    text='Комментарий', post=post, author=author)
+        cls.post = post
+        for author in cls.authors:
+            Follow.objects.create(user=cls.user, author=author)
+        # Посты таких авторов читаются при каждом открытии ленты: их
+        # несколько, чтобы бюджет не зависел от их числа.
+        for author in cls.authors[:2]:
+            PullAuthor.objects.create(author=author)
+        cls.question = Question.objects.create(
+            question_text='Тестовый опрос',
+            pub_date=timezone.now(),
+        )
+        cls.choices = [
+            Choice.objects.create(question=cls.question, choice_text=text)
+            for text in ('Да', 'Нет')
+        ]
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        cache.clear()
+
+    def test_every_view_declares_budget(self):
+        '''У каждого представления posts.urls есть бюджет запросов'''
+        for pattern in posts_urls.urlpatterns:
+            with self.subTest(name=pattern.name):
+                self.assertTrue(hasattr(pattern.callback, 'query_budget'))
+
+    def test_pages_within_budget(self):
+        '''Страницы укладываются в бюджет при любом числе строк'''
+        author = self.authors[0]
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:search') + '?q=пост',
+            reverse('posts:group_posts', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': author.username}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+            reverse('posts:post_comments', kwargs={'post_id': self.post.pk}),
+            reverse('posts:post_create'),
+            reverse('posts:post_edit', kwargs={'post_id': self.post.pk}),
+            reverse('posts:follow_index'),
+            reverse('posts:questions'),
+            reverse('posts:question', kwargs={'pk': self.question.pk}),
+            reverse('posts:question_visual',
+                    kwargs={'pk': self.question.pk}),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertWithinQueryBudget(
+                    self.authorized_client.get(url))
+
+    def test_follow_feed_queries_do_not_grow_with_pull_authors(self):
+        '''Посты всех авторов из PullAuthor читаются одним запросом'''
+        url = reverse('posts:follow_index')
+        with CaptureQueriesContext(connection) as two_authors:
+            self.authorized_client.get(url)
+        PullAuthor.objects.create(author=self.authors[2])
+        cache.clear()
+        with CaptureQueriesContext(connection) as three_authors:
+            response = self.authorized_client.get(url)
+        self.assertEqual(len(three_authors), len(two_authors))
+        self.assertEqual(
+            [post.pk for post in response.context['page_obj']],
+            list(Post.objects.values_list('pk', flat=True)[:10]))
+
+    def test_actions_within_budget(self):
+        '''Действия пользователя укладываются в бюджет'''
+        author = self.authors[1]
+        requests = [
+            (reverse('posts:add_comment', kwargs={'post_id': self.post.pk}),
+             {'text': 'Ещё комментарий'}),
+            (reverse('posts:profile_unfollow',
+                     kwargs={'username': author.username}), None),
+            (reverse('posts:profile_follow',
+                     kwargs={'username': author.username}), None),
+            (reverse('posts:post_create'), {'text': 'Новый пост'}),
+            (reverse('posts:question', kwargs={'pk': self.question.pk}),
+             {'exampleRadios': self.choices[0].pk}),
+        ]
+        for url, data in requests:
+            with self.subTest(url=url):
+                if data is None:
+                    response = self.authorized_client.get(url)
+                else:
+                    response = self.authorized_client.post(url, data)
+                self.assertWithinQueryBudget(response)
+
+
+@override_settings(ASYNC_PARALLEL_DB=True)
+class AsyncViewTests(QueryBudgetMixin, TransactionTestCase):
+    '''Асинхронные представления с запросами из пула потоков: данные
+    должны быть закоммичены, поэтому TransactionTestCase'''
+
+    def setUp(self):
+        self.group = Group.objects.create(
+            title='Группа', description='Описание', slug='async-slug')
+        self.author = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.posts = [
+            Post.objects.create(
+                text=f'Пост № {number}', author=self.author,
+                group=self.group)
+            for number in range(3)
+        ]
+        self.client.force_login(self.reader)
+        cache.clear()
+
+    def test_parallel_queries(self):
+        '''Независимые запросы идут одновременно и все входят в бюджет'''
+        response = self.client.get(
+            reverse('posts:profile', kwargs={'username': 'author'}))
+        self.assertWithinQueryBudget(response)
+        self.assertTrue(response.context['following'])
+        self.assertEqual(response.context['post_amount'], 3)
+        self.assertEqual(len(response.context['page_obj']), 3)
+        self.assertGreaterEqual(response.wsgi_request.query_count, 5)
+        response = self.client.get(
+            reverse('posts:post_detail',
+                    kwargs={'post_id': self.posts[0].pk}))
+        self.assertWithinQueryBudget(response)
+        self.assertEqual(response.context['post'], self.posts[0])
+
+    def test_queries_run_in_pool(self):
+        '''С ASYNC_PARALLEL_DB запросы идут из потоков пула, а не из
+        потока запроса'''
+        threads = set()
+
+        def remember_thread(execute, sql, params, many, context):
+            threads.add(threading.get_ident())
+            return execute(sql, params, many, context)
+
+        with observe(remember_thread):
+            response = self.client.get(
+                reverse('posts:profile', kwargs={'username': 'author'}))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(threads - {threading.get_ident()})
+
+    def test_missing_object(self):
+        for url in (
+            reverse('posts:profile', kwargs={'username': 'nobody'}),
+            reverse('posts:group_posts', kwargs={'slug': 'nothing'}),
+            reverse('posts:question_visual', kwargs={'pk': 999}),
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+
+    async def test_asgi(self):
+        '''Через ASGI middleware и кэш страниц работают без WSGI'''
+        url = reverse('posts:group_posts', kwargs={'slug': 'async-slug'})
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['page_obj']), 3)
+        request = response.asgi_request
+        self.assertLessEqual(request.query_count, request.query_budget)
+        cached = await self.async_client.get(url)
+        self.assertEqual(cached.content, response.content)
@@ -0,0 +1,161 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import KVStore as CachedDBKVStore
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from core.cache import invalidate_tags
+
+from . import tags
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+# Все геометрии, которые шаблоны передают в {% thumbnail post.image ... %}.
+# Опции должны совпадать с шаблонными, иначе sorl сочтёт миниатюру другой.
+POST_THUMBNAILS = (
+    ('960x339', {'crop': 'center', 'upscale': True}),
+)
+
+_executor = None
+# Картинки, миниатюры которых уже в очереди пула.
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def _source(name):
+    """Исходник в хранилище поля Post.image: от хранилища зависит ключ
+    миниатюры в kvstore sorl, он должен совпасть с ключом post.image."""
+    return ImageFile(name, Post._meta.get_field('image').storage)
+
+
+def generate(name):
+    """Строит все миниатюры поста для картинки name."""
+    source = _source(name)
+    for geometry, options in POST_THUMBNAILS:
+        get_thumbnail(source, geometry, **options)
+
+
+def refresh_posts(name):
+    """Сбрасывает страницы постов с картинкой name: они могли попасть в
+    кэш без миниатюры. updated_at меняет и их ETag (см. views.*_stamps)."""
+    rows = list(Post.objects.filter(image=name).values_list(
+        'pk', 'author_id', 'group__slug'))
+    if not rows:
+        return
+    Post.objects.filter(image=name).update(updated_at=timezone.now())
+    changed = {tags.INDEX}
+    for pk, author_id, group_slug in rows:
+        changed.update((tags.post_tag(pk), tags.author_tag(author_id)))
+        if group_slug:
+            changed.add(tags.group_tag(group_slug))
+    invalidate_tags(*changed)
+
+
+def _generate_logged(name):
+    try:
+        generate(name)
+        refresh_posts(name)
+    except Exception:
+        logger.exception('Не удалось построить миниатюры для %s', name)
+    finally:
+        with _pending_lock:
+            _pending.discard(name)
+        # Соединения потока пула сами не закроются.
+        connections.close_all()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.THUMBNAIL_PREGENERATE_WORKERS,
+            thread_name_prefix='thumbnails',
+        )
+    return _executor
+
+
+def _submit(name):
+    with _pending_lock:
+        if name in _pending:
+            return
+        _pending.add(name)
+    _get_executor().submit(_generate_logged, name)
+
+
+def pregenerate(name):
+    """Ставит миниатюры в очередь пула после коммита транзакции,
+    чтобы первый зритель поста не ждал ресайза в Pillow. Картинка, уже
+    стоящая в очереди, второй раз не ставится."""
+    if name:
+        transaction.on_commit(lambda: _submit(name))
+
+
+def _thumbnail_file(name, geometry, options):
+    """Файл миниатюры, который вернул бы get_thumbnail, но без обращения
+    к kvstore: повторяет подготовку опций из ThumbnailBackend."""
+    backend = default.backend
+    source = _source(name)
+    options = dict(options)
+    if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(sorl_settings, attr)
+        if value != getattr(sorl_defaults, attr):
+            options.setdefault(key, value)
+    return ImageFile(
+        backend._get_thumbnail_filename(source, geometry, options),
+        default.storage,
+    )
+
+
+def _get_raw_many(keys):
+    kvstore = default.kvstore
+    if not isinstance(kvstore, CachedDBKVStore):
+        values = {key: kvstore._get_raw(key) for key in keys}
+        return {key: value for key, value in values.items() if value}
+    values = kvstore.cache.get_many(keys)
+    missing = [key for key in keys if key not in values]
+    if missing:
+        found = dict(KVStoreModel.objects.filter(
+            key__in=missing).values_list('key', 'value'))
+        kvstore.cache.set_many(found, sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+        values.update(found)
+    return {
+        key: value for key, value in values.items()
+        if isinstance(value, str) and value
+    }
+
+
+def prefetch(posts):
+    """Находит готовые миниатюры всех постов одним запросом к kvstore.
+
+    Каждому посту добавляется словарь post.thumbnails: геометрия ->
+    ImageFile с url и размерами или None, если миниатюры ещё нет.
+    """
+    wanted = {}
+    for post in posts:
+        post.thumbnails = {}
+        if not post.image:
+            continue
+        for geometry, options in POST_THUMBNAILS:
+            post.thumbnails[geometry] = None
+            thumbnail = _thumbnail_file(post.image.name, geometry, options)
+            wanted.setdefault(add_prefix(thumbnail.key), []).append(
+                (post, geometry))
+    if not wanted:
+        return
+    for key, value in _get_raw_many(list(wanted)).items():
+        for post, geometry in wanted[key]:
+            post.thumbnails[geometry] = deserialize_image_file(value)
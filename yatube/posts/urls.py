@@ -6,6 +6,7 @@ app_name = 'posts'
 
 urlpatterns = [
     path('', views.index, name='index'),
+    path('search/', views.search, name='search'),
     path('group/<slug:slug>/', views.group_posts, name='group_posts'),
     path('profile/<str:username>/', views.profile, name='profile'),
     path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
@@ -15,6 +16,10 @@ urlpatterns = [
         name='post_create'
     ),
     path('posts/<int:post_id>/edit/', views.post_edit, name='post_edit'),
+    path(
+        'posts/<int:post_id>/comments/',
+        views.post_comments,
+        name='post_comments'),
     path(
         'posts/<int:post_id>/comment/',
         views.add_comment,
@@ -45,4 +50,9 @@ urlpatterns = [
         views.grath_api,
         name="question_visual"
     ),
+    path(
+        'questions/<int:pk>/stream/',
+        views.question_stream,
+        name="question_stream"
+    ),
 ]
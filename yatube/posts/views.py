@@ -1,77 +1,258 @@
 import json
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import cache_page
-from django.db.models import Sum
+from django.db import transaction
+from django.db.models import Count, Exists, Max, OuterRef, Sum
 
+from core import asyncdb
+from core.cache import cache_tagged, conditional
+from core.paginator import CursorPaginator
+from core.query_budget import query_budget
+from core.replica import read_replica
+from core.streaming import asgi_stream
+
+from . import live, tags, thumbnails
+from .feed import FollowFeedPaginator
 from .forms import CommentForm, PostForm
-from .models import Follow, Group, Post, User, Question, Choice
+from .models import Comment, Follow, Group, Post, User, Question, Choice
+from .search import SearchPaginator
+from .votes import question_totals, record_vote
+
+
+def index_tags(request):
+    return [tags.INDEX]
+
+
+def group_tags(request, slug):
+    return [tags.group_tag(slug)]
+
+
+def profile_tags(request, username):
+    author_ids = User.objects.filter(
+        username=username).values_list('pk', flat=True)[:1]
+    return [tags.author_tag(pk) for pk in author_ids]
+
+
+def post_tags(request, post_id):
+    page_tags = []
+    rows = Post.objects.filter(pk=post_id).values_list(
+        'author_id', 'group__slug')[:1]
+    for author_id, group_slug in rows:
+        page_tags += [tags.post_tag(post_id), tags.author_tag(author_id)]
+        if group_slug:
+            page_tags.append(tags.group_tag(group_slug))
+    return page_tags
+
+
+def group_stamps(request, slug):
+    """Валидаторы страницы группы: правки постов, их число и сама
+    группа."""
+    rows = Group.objects.filter(slug=slug).values_list(
+        'title', 'description').annotate(
+        last_modified=Max('posts__updated_at'),
+        post_count=Count('posts'))[:1]
+    for title, description, last_modified, post_count in rows:
+        return last_modified, (title, description, post_count)
+    return None
+
+
+def profile_stamps(request, username):
+    """Валидаторы профиля: правки постов, счётчик постов автора и
+    подписка на него."""
+    user_id = request.user.pk if load_user(request) else None
+    rows = User.objects.filter(username=username).annotate(
+        followed=Exists(Follow.objects.filter(
+            author=OuterRef('pk'), user=user_id)),
+    ).values_list(
+        'first_name', 'last_name', 'counter__posts', 'followed',
+    ).annotate(last_modified=Max('posts__updated_at'))[:1]
+    for *parts, last_modified in rows:
+        return last_modified, parts
+    return None
+
+
+def post_stamps(request, post_id):
+    """Валидаторы поста: правки поста и комментариев и их число."""
+    rows = Post.objects.filter(pk=post_id).values_list(
+        'updated_at', 'group__title', 'author__first_name',
+        'author__last_name', 'author__counter__posts', 'counter__comments',
+    ).annotate(last_comment=Max('comments__updated_at'))[:1]
+    for updated_at, *parts, last_comment in rows:
+        return max(updated_at, last_comment or updated_at), parts
+    return None
+
+
+COMMENT_ORDERINGS = {
+    'new': ('-created', '-id'),
+    'old': ('created', 'id'),
+}
+
+
+def feed_page(request, post_list):
+    """Страница ленты с найденными миниатюрами."""
+    paginator = CursorPaginator(
+        post_list, settings.PAGINATOR_OBJECTS_PER_PAGE)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
+    thumbnails.prefetch(page_obj)
+    return page_obj
+
+
+def load_user(request):
+    """Загружает ленивый request.user: сессию и пользователя."""
+    return request.user.is_authenticated
+
+
+def is_following(request, username):
+    return load_user(request) and Follow.objects.filter(
+        author__username=username, user=request.user).exists()
+
+
+def detail_post(post_id):
+    """Пост для post_detail вместе с миниатюрами."""
+    post = get_object_or_404(
+        Post.objects.select_related('author__counter', 'counter', 'group'),
+        pk=post_id)
+    thumbnails.prefetch([post])
+    return post
+
+
+def comment_page(request, post):
+    """Страница комментариев поста вместе с авторами, одним запросом.
+
+    post — пост или его id."""
+    order = request.GET.get('order')
+    if order not in COMMENT_ORDERINGS:
+        order = 'new'
+    paginator = CursorPaginator(
+        Comment.objects.filter(post=post).select_related('author'),
+        settings.COMMENTS_PER_PAGE,
+        ordering=COMMENT_ORDERINGS[order],
+    )
+    return order, paginator.get_page(request.GET.get('cursor'))
 
 
-@cache_page(20)
-def index(request):
+@query_budget(5)
+@read_replica
+@cache_tagged(settings.VIEW_CACHE_TIMEOUT, index_tags)
+async def index(request):
     template = 'posts/index.html'
-    post_list = Post.objects.all().select_related('group')
-    paginator = Paginator(post_list, settings.PAGINATOR_OBJECTS_PER_PAGE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    post_list = Post.objects.select_related('author', 'group')
+    page_obj, _ = await asyncdb.gather(
+        (feed_page, request, post_list),
+        (load_user, request),
+    )
     context = {
         'page_obj': page_obj,
     }
-    return render(request, template, context)
+    return await asyncdb.run(render, request, template, context)
 
 
-def group_posts(request, slug):
-    group = get_object_or_404(Group, slug=slug)
-    post_list = Post.objects.filter(group=group).select_related('group')
-    paginator = Paginator(post_list, settings.PAGINATOR_OBJECTS_PER_PAGE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+@query_budget(7)
+@read_replica
+@conditional(group_stamps, private=True, no_cache=True)
+@cache_tagged(settings.VIEW_CACHE_TIMEOUT, group_tags)
+async def group_posts(request, slug):
+    # Группа и страница постов запрашиваются одновременно: страница
+    # ищется по slug, а не по уже загруженной группе.
+    post_list = Post.objects.filter(
+        group__slug=slug).select_related('author')
+    group, page_obj, _ = await asyncdb.gather(
+        (get_object_or_404, Group.objects.filter(slug=slug)),
+        (feed_page, request, post_list),
+        (load_user, request),
+    )
     template = 'posts/group_list.html'
     context = {
         'group': group,
         'page_obj': page_obj,
     }
-    return render(request, template, context)
+    return await asyncdb.run(render, request, template, context)
 
 
-def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    post_list = Post.objects.filter(author=author).select_related('group')
-    paginator = Paginator(post_list, settings.PAGINATOR_OBJECTS_PER_PAGchoiE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    following = False
-    if request.user.is_authenticated:
-        if Follow.objects.filter(
-           author=author).filter(user=request.user).exists():
-            following = True
+@query_budget(9)
+@read_replica
+@conditional(profile_stamps, private=True, no_cache=True)
+@cache_tagged(settings.VIEW_CACHE_TIMEOUT, profile_tags)
+async def profile(request, username):
+    # Автор со счётчиком постов, страница и проверка подписки независимы:
+    # все три запроса ищут автора по username.
+    post_list = Post.objects.filter(
+        author__username=username).select_related('group')
+    author, page_obj, following = await asyncdb.gather(
+        (get_object_or_404, User.objects.select_related('counter').filter(
+            username=username)),
+        (feed_page, request, post_list),
+        (is_following, request, username),
+    )
     template = 'posts/profile.html'
-    post_amount = post_list.count()
+    post_amount = author.counter.posts
     context = {
         'author': author,
         'page_obj': page_obj,
         'post_amount': post_amount,
         'following': following,
     }
-    return render(request, template, context)
+    return await asyncdb.run(render, request, template, context)
 
 
-def post_detail(request, post_id):
+@query_budget(7)
+@read_replica
+@conditional(post_stamps, private=True, no_cache=True)
+@cache_tagged(settings.VIEW_CACHE_TIMEOUT, post_tags)
+async def post_detail(request, post_id):
     template = 'post_detail.html'
-    post = get_object_or_404(Post, pk=post_id)
-    post_amount = Post.objects.filter(author=post.author).count()
+    post, (order, comments), _ = await asyncdb.gather(
+        (detail_post, post_id),
+        (comment_page, request, post_id),
+        (load_user, request),
+    )
+    post_amount = post.author.counter.posts
     form = CommentForm()
     context = {
         'post': post,
         'post_amount': post_amount,
         'form': form,
+        'comments': comments,
+        'order': order,
+    }
+    return await asyncdb.run(render, request, template, context)
+
+
+@query_budget(4)
+@read_replica
+@cache_tagged(settings.VIEW_CACHE_TIMEOUT, post_tags)
+def post_comments(request, post_id):
+    """Следующая порция комментариев для кнопки «Показать ещё»."""
+    post = get_object_or_404(Post.objects.only('pk'), pk=post_id)
+    order, comments = comment_page(request, post)
+    template = 'posts/includes/comment_list.html'
+    context = {
+        'post': post,
+        'comments': comments,
+        'order': order,
     }
     return render(request, template, context)
 
 
+@query_budget(5)
+@read_replica
+@cache_tagged(settings.VIEW_CACHE_TIMEOUT, index_tags)
+def search(request):
+    query = request.GET.get('q', '').strip()
+    paginator = SearchPaginator(query, settings.PAGINATOR_OBJECTS_PER_PAGE)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
+    template = 'posts/search.html'
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+    }
+    return render(request, template, context)
+
+
+# Раскладка по лентам добавляет запрос на каждые feed.BATCH_SIZE подписчиков.
+@query_budget(18)
 @login_required
 def post_create(request):
     template = 'posts/create_post.html'
@@ -80,7 +261,9 @@ def post_create(request):
     if form.is_valid():
         post = form.save(commit=False)
         post.author = request.user
-        post.save()
+        with transaction.atomic():
+            post.save()
+            thumbnails.pregenerate(post.image.name)
         return redirect('posts:profile', post.author.username)
     context = {
         'groups': groups,
@@ -89,10 +272,11 @@ def post_create(request):
     return render(request, template, context)
 
 
+@query_budget(19)
 @login_required
 def post_edit(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
-    if request.user.pk != post.author.pk:
+    if request.user.pk != post.author_id:
         return redirect('posts:post_detail', post_id)
     template = 'posts/create_post.html'
     groups = Group.objects.all()
@@ -102,7 +286,10 @@ def post_edit(request, post_id):
         files=request.FILES or None,
         instance=post)
     if form.is_valid():
-        form.save()
+        with transaction.atomic():
+            form.save()
+            if 'image' in form.changed_data:
+                thumbnails.pregenerate(post.image.name)
         return redirect('posts:post_detail', post_id)
     context = {
         'groups': groups,
@@ -113,6 +300,7 @@ def post_edit(request, post_id):
     return render(request, template, context)
 
 
+@query_budget(8)
 @login_required
 def add_comment(request, post_id):
     form = CommentForm(request.POST or None)
@@ -121,41 +309,50 @@ def add_comment(request, post_id):
         comment.author = request.user
         post = get_object_or_404(Post, pk=post_id)
         comment.post = post
-        comment.save()
+        with transaction.atomic():
+            comment.save()
     return redirect('posts:post_detail', post_id=post_id)
 
 
+@query_budget(7)
 @login_required
 def follow_index(request):
     template = 'posts/follow.html'
-    post_list = Post.objects.filter(author__following__user=request.user)
-    paginator = Paginator(post_list, settings.PAGINATOR_OBJECTS_PER_PAGE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    paginator = FollowFeedPaginator(
+        request.user, settings.PAGINATOR_OBJECTS_PER_PAGE)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
+    thumbnails.prefetch(page_obj)
     context = {
         'page_obj': page_obj,
     }
     return render(request, template, context)
 
 
+@query_budget(14)
 @login_required
 def profile_follow(request, username):
     post_author = User.objects.get(username=username)
     if request.user != post_author:
-        Follow.objects.get_or_create(
-            user=request.user,
-            author=post_author
-        )
+        with transaction.atomic():
+            Follow.objects.get_or_create(
+                user=request.user,
+                author=post_author
+            )
     return redirect('posts:profile', username=username)
 
 
+@query_budget(10)
 @login_required
 def profile_unfollow(request, username):
-    Follow.objects.filter(user=request.user).filter(
-        author=get_object_or_404(User, username=username)).delete()
+    author = get_object_or_404(User, username=username)
+    with transaction.atomic():
+        Follow.objects.filter(user=request.user).filter(
+            author=author).delete()
     return redirect('posts:profile', username=username)
 
 
+@query_budget(3)
+@read_replica
 def questions(request):
     questions_list = Question.objects.all()
     template = 'posts/question_list.html'
@@ -165,12 +362,15 @@ def questions(request):
     return render(request, template, context)
 
 
+@query_budget(4)
 def question(request, pk):
     if request.method == 'POST':
         result = get_object_or_404(
-            Choice, pk=int(request.POST['exampleRadios']))
-        result.votes += 1
-        result.save()
+            Choice.objects.only('pk'),
+            pk=int(request.POST['exampleRadios']),
+            question_id=pk)
+        record_vote(result.pk)
+        live.touch(pk)
         return redirect('posts:question_visual', pk=pk)
     question = get_object_or_404(Question, pk=pk)
     choices = Choice.objects.filter(question__id=pk)
@@ -182,10 +382,8 @@ def question(request, pk):
     return render(request, template, context)
 
 
-def grath_api(request, pk):
-    choices = Choice.objects.filter(question__id=pk).values('choice_text', 'votes')
-    question = get_object_or_404(Question, pk=pk)
-    template = 'posts/grath.html'
+def chart(question, choices):
+    """Диаграмма Highcharts с голосами за варианты ответа."""
     categories = []
     survived_series_data = []
     for entry in choices:
@@ -196,11 +394,38 @@ def grath_api(request, pk):
         'data': survived_series_data,
         'color': 'green'
     }
-    chart = {
+    return {
         'chart': {'type': 'column'},
         'title': {'text': f'Количество голосов в опросе {question.question_text}.'},
         'xAxis': {'categories': categories},
         'series': [survived_series]
     }
-    dump = json.dumps(chart)
-    return render(request, template, {'chart': dump})
+
+
+@query_budget(4)
+@read_replica
+async def grath_api(request, pk):
+    question, choices, _ = await asyncdb.gather(
+        (get_object_or_404, Question.objects.filter(pk=pk)),
+        (question_totals, pk),
+        (load_user, request),
+    )
+    template = 'posts/grath.html'
+    dump = json.dumps(chart(question, choices))
+    context = {
+        'chart': dump,
+        'question': question,
+    }
+    return await asyncdb.run(render, request, template, context)
+
+
+@query_budget(1)
+@asgi_stream(live.stream)
+def question_stream(request, pk):
+    """Итоги опроса потоком SSE. Под ASGI запрос до представления не
+    доходит: его обслуживает live.stream."""
+    get_object_or_404(Question.objects.only('pk'), pk=pk)
+    response = StreamingHttpResponse(live.follow(pk))
+    for name, value in live.HEADERS:
+        response[name] = value
+    return response
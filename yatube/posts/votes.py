@@ -0,0 +1,46 @@
+from django.db import transaction
+from django.db.models import (Count, F, IntegerField, Max, OuterRef,
+                              Subquery)
+from django.db.models.functions import Coalesce
+
+from .models import Choice, PendingVote
+
+
+def record_vote(choice_id):
+    """Принимает голос без блокировки строки Choice."""
+    PendingVote.objects.create(choice_id=choice_id)
+
+
+def flush_votes():
+    """Переносит накопленные голоса в Choice.votes, возвращает их число."""
+    with transaction.atomic():
+        last_id = PendingVote.objects.aggregate(last=Max('id'))['last']
+        if last_id is None:
+            return 0
+        batch = PendingVote.objects.filter(id__lte=last_id)
+        deltas = batch.order_by().values('choice').annotate(
+            amount=Count('id'))
+        flushed = 0
+        for delta in deltas:
+            Choice.objects.filter(pk=delta['choice']).update(
+                votes=F('votes') + delta['amount'])
+            flushed += delta['amount']
+        batch.delete()
+    return flushed
+
+
+def question_totals(question_id):
+    """Итоги опроса с учётом ещё не перенесённых голосов."""
+    # Подзапрос вместо JOIN с GROUP BY: так варианты читаются по индексу
+    # question_id уже в порядке pk, без сортировки.
+    pending = PendingVote.objects.filter(
+        choice=OuterRef('pk')).order_by().values('choice').annotate(
+        count=Count('id')).values('count')
+    choices = Choice.objects.filter(question_id=question_id).annotate(
+        pending=Coalesce(Subquery(pending, output_field=IntegerField()), 0),
+    ).order_by('pk')
+    return [
+        {'choice_text': choice.choice_text,
+         'votes': choice.votes + choice.pending}
+        for choice in choices
+    ]
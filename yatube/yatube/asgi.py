@@ -0,0 +1,30 @@
+"""
+ASGI config for yatube project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
+"""
+
+import os
+
+from asgiref.sync import ThreadSensitiveContext
+from django.core.asgi import get_asgi_application
+
+from core.streaming import StreamRouter
+from core.template_loader import warm_up
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+
+# Долгие потоки (SSE) обслуживаются в цикле событий мимо Django.
+django_application = StreamRouter(get_asgi_application())
+warm_up()
+
+
+async def application(scope, receive, send):
+    # Django 3.2 выполняет все thread_sensitive-вызовы (синхронные
+    # middleware, сигналы) в одном потоке на процесс. Свой поток на
+    # каждый запрос, как в Django 4.0.
+    async with ThreadSensitiveContext():
+        await django_application(scope, receive, send)
@@ -49,6 +49,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.metrics.MetricsMiddleware',
+    'core.replica.ReplicaMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -57,20 +59,38 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.query_budget.QueryBudgetMiddleware',
 ]
 
 ROOT_URLCONF = 'yatube.urls'
 
+TEST_RUNNER = 'core.testing.TestRunner'
+
+# Асинхронные представления выполняют независимые запросы одновременно,
+# в пуле потоков со своими соединениями (core.asyncdb)
+ASYNC_PARALLEL_DB = True
+
+# Превышение бюджета запросов представления — исключение, а не запись в лог
+QUERY_BUDGET_STRICT = False
+
 CORS_ORIGIN_ALLOW_ALL=True
 
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.template_backend.TimedDjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
-        'APP_DIRS': True,
         'OPTIONS': {
+            # Шаблоны компилируются при старте воркера (yatube/wsgi.py,
+            # yatube/asgi.py) и остаются в памяти; с DEBUG изменённый
+            # файл перекомпилируется. См. core.template_loader.
+            'loaders': [
+                ('core.template_loader.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ], DEBUG),
+            ],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -92,13 +112,46 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
+# Профиль SQLite для нескольких воркеров, см. core.db.sqlite3. До и
+# после: python manage.py dbbench
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'core.db.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'lock_retries': 5,
+            'pragmas': {
+                'journal_mode': 'WAL',
+                # В WAL с NORMAL после сбоя питания теряются лишь
+                # последние транзакции, база остаётся целой.
+                'synchronous': 'NORMAL',
+                'mmap_size': 256 * 1024 * 1024,
+                # Отрицательное значение — в КиБ: 20 МБ на соединение.
+                'cache_size': -20000,
+                'busy_timeout': 5000,
+                'temp_store': 'MEMORY',
+            },
+        },
     }
 }
 
+# Реплика для чтения лент: копия основной базы, которую обновляет
+# python manage.py sync_replica --interval 2. Пока синхронизации не было
+# или она отстала больше REPLICA_MAX_LAG секунд, всё читается из
+# основной базы. Записавший что-то пользователь читает основную базу,
+# пока реплика не догонит его запись, см. core.replica.
+DATABASES['replica'] = {
+    **DATABASES['default'],
+    'NAME': os.path.join(BASE_DIR, 'db-replica.sqlite3'),
+    'TEST': {'MIRROR': 'default'},
+}
+DATABASE_ROUTERS = ['core.replica.ReplicaRouter']
+READ_REPLICA = 'replica'
+REPLICA_MAX_LAG = 30
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -137,21 +190,62 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/2.2/howto/static-files/
 
 STATIC_URL = '/static/'
+# collectstatic добавляет к именам хэш содержимого и пишет рядом сжатые
+# копии .gz и .br, см. core.storage и core.assets
+STATIC_ROOT = os.path.join(BASE_DIR, 'var', 'static')
+STATICFILES_STORAGE = 'core.storage.CompressedManifestStaticFilesStorage'
 
 LOGIN_URL = 'users:login'
 LOGIN_REDIRECT_URL = 'posts:index'
 
 PAGINATOR_OBJECTS_PER_PAGE = 10
+COMMENTS_PER_PAGE = 20
+# Размер страницы списков API (posts.api)
+API_PAGE_SIZE = 20
+
+# Авторы с большим числом подписчиков не раскладываются по лентам
+FEED_FANOUT_LIMIT = 10000
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Картинки постов больше этого уменьшаются при загрузке
+POST_IMAGE_MAX_SIZE = (1920, 1920)
+POST_IMAGE_MAX_PIXELS = 50_000_000
+POST_IMAGE_QUALITY = 85
+
+# Потоки, которые строят миниатюры загруженных картинок вне запроса
+THUMBNAIL_PREGENERATE_WORKERS = 2
+
+# Гистограммы времени ответа по представлениям, файл на каждый процесс
+METRICS_LOCATION = os.path.join(BASE_DIR, 'var', 'metrics')
+
+# L1 в памяти каждого воркера, L2 — общий файл SQLite, см. core.cache_backend
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache_backend.TieredCache',
+        'LOCATION': os.path.join(BASE_DIR, 'var', 'cache'),
+        'OPTIONS': {
+            'L1_MAX_ENTRIES': 1000,
+            'MAX_ENTRIES': 20000,
+        },
     }
 }
 
+# Страницы сбрасываются сигналами по тегам, таймаут лишь страховка
+VIEW_CACHE_TIMEOUT = 60 * 15
+
+# Итоги опроса потоком SSE (posts.live): не больше POLL_STREAM_RATE
+# обновлений в секунду, комментарий-пинг при тишине, переподключение
+# клиента после POLL_STREAM_TIMEOUT секунд
+POLL_STREAM_RATE = 2
+POLL_STREAM_HEARTBEAT = 15
+POLL_STREAM_TIMEOUT = 300
+POLL_STREAM_RETRY_MS = 3000
+# Под WSGI поток держит поток воркера, поэтому ответ короткий, а клиент
+# переподключается через POLL_STREAM_RETRY_MS
+POLL_STREAM_WSGI_TIMEOUT = 5
+
 GRAPH_MODELS = {
     'all_applications': True,
     'group_models': True,